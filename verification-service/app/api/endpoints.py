@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 import fastapi
 from app.api.models import InitSessionRequest, InitSessionResponse, VerifyTokenRequest, VerifyTokenResponse
 from app.services.session_manager import session_manager
 from app.services.websocket_manager import websocket_manager
+from app.services.speculative_verifier import speculative_verifier
 from app.core.config import settings
+from app.core import metrics as app_metrics
 import time
 from datetime import datetime
 import logging
@@ -12,20 +15,14 @@ from urllib.parse import urlparse
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-from app.core.rate_limit import RateLimiter
+from app.core.rate_limit import rate_limit_policy
 
-# Initialize limiters (e.g. 10/min per IP for init, 30/min for verify)
-init_limiter = RateLimiter(requests_per_minute=20)
-verify_limiter = RateLimiter(requests_per_minute=60)
-proximity_limiter = RateLimiter(requests_per_minute=30)
-poll_limiter = RateLimiter(requests_per_minute=120)
+# Per-IP rate limits are applied by RateLimitMiddleware (see settings.RATE_LIMIT_POLICY)
+
+MAX_USER_AGENT_LENGTH = 2048
 
 @router.post("/session/init", response_model=InitSessionResponse)
 async def init_session(request: Request, body: InitSessionRequest):
-    # Rate Limit by IP
-    client_ip = request.client.host if request.client else "unknown"
-    init_limiter.check(f"init:{client_ip}")
-
     # Get Client URL from header
     client_url = request.headers.get("X-Client-Url")
     if not client_url:
@@ -66,8 +63,14 @@ async def init_session(request: Request, body: InitSessionRequest):
     # Capture IP and User-Agent from Request
     client_ip = request.client.host if request.client else None
     user_agent = request.headers.get("User-Agent")
+    if user_agent:
+        # Only parsed for display; cap it so an oversized header can't bloat the session record
+        user_agent = user_agent[:MAX_USER_AGENT_LENGTH]
 
-    nonce = session_manager.create_session(client_url, ip=client_ip, ua=user_agent)
+    nonce = await session_manager.create_session(client_url, ip=client_ip, ua=user_agent)
+    # Start on the URL-only stages now; the verdict is usually ready by the time the phone scans
+    if settings.SPECULATIVE_ENABLED:
+        speculative_verifier.schedule(nonce, client_url)
     
     return InitSessionResponse(
         nonce=nonce,
@@ -79,22 +82,18 @@ async def init_session(request: Request, body: InitSessionRequest):
 async def verify_token(body: VerifyTokenRequest, raw_request: Request, background_tasks: BackgroundTasks):
     request = body # Alias for easier diff
     
-    # Rate Limit by IP
-    client_ip = raw_request.client.host if raw_request.client else "unknown"
-    verify_limiter.check(f"verify:{client_ip}")
-    
-    # 1. Get Session
-    session = session_manager.get_session(request.token)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-        
+    # 1. Claim Session (PENDING -> VERIFYING in one atomic step; concurrent verifies lose here)
+    claim, session = await session_manager.claim_session(request.token)
+
     # 2. Check Expiry
-    if session["status"] == "EXPIRED":
+    if claim == "EXPIRED":
         raise HTTPException(status_code=410, detail="Session expired")
     
-    # 3. Check Consumed
-    if session["status"] == "CONSUMED":
+    # 3. Check Consumed / already being verified by another request
+    if claim == "CONSUMED":
         raise HTTPException(status_code=409, detail="Session already consumed")
+    if claim == "VERIFYING":
+        raise HTTPException(status_code=409, detail="Session verification already in progress")
     
     # 4. Deep Verification
     url = session["url"]
@@ -103,7 +102,18 @@ async def verify_token(body: VerifyTokenRequest, raw_request: Request, backgroun
     bluetooth_data = session.get("proximity")  # Get BLE proximity data
     
     from app.services.verification_engine import verification_engine
-    result = verification_engine.verify(url, web_ip=web_ip, mobile_ip=mobile_ip, proximity=bluetooth_data)
+    # Started by DeadlineMiddleware when the request arrived (settings.REQUEST_DEADLINES)
+    deadline = getattr(raw_request.state, "deadline", None)
+    try:
+        prepared = await speculative_verifier.prepared_for(session, deadline=deadline)
+        result = await verification_engine.verify(
+            url, web_ip=web_ip, mobile_ip=mobile_ip, proximity=bluetooth_data, prepared=prepared,
+            deadline=deadline
+        )
+    except BaseException:
+        # Hand the session back so the user can scan again instead of it sitting in VERIFYING
+        await session_manager.release_session(request.token)
+        raise
     
     # Update status MOVED TO END
     # session_manager.update_status(request.token, "CONSUMED")
@@ -143,41 +153,79 @@ async def verify_token(body: VerifyTokenRequest, raw_request: Request, backgroun
     )
     
     # Update status and SAVE RESULT
-    session_manager.update_status(request.token, "CONSUMED", response_data.model_dump())
+    await session_manager.update_status(request.token, "CONSUMED", response_data.model_dump())
     
-    # Send WebSocket notification if verification succeeded and proximity was confirmed
+    # Send WebSocket notification if verification succeeded and proximity was confirmed.
+    # Runs after the response is sent; a phone that isn't connected yet gets it from the mailbox.
     if result["verdict"] in ["TRUSTED", "CAUTION"] and bluetooth_data and bluetooth_data.get("confirmed"):
-        try:
-            # Prefer BLE UUID as WebSocket channel key; fall back to nonce if absent
-            ble_uuid = bluetooth_data.get("ble_uuid")
-            channel_key = ble_uuid
-            await websocket_manager.send_verification_success(
-                channel_key,
-                response_data.model_dump()
-            )
-        except Exception as e:
-            logger.error(f"Failed to send WebSocket notification: {e}")
+        # Prefer BLE UUID as WebSocket channel key; fall back to nonce if absent
+        ble_uuid = bluetooth_data.get("ble_uuid")
+        channel_key = ble_uuid
+        background_tasks.add_task(
+            _notify_phone,
+            channel_key,
+            response_data.model_dump(),
+            time.time(),
+        )
 
     return response_data
 
+async def _notify_phone(channel_key: str, result: dict, verified_at: float):
+    try:
+        await websocket_manager.send_verification_success(channel_key, result, verified_at)
+    except Exception as e:
+        logger.error(f"Failed to send WebSocket notification: {e}")
+
 from app.api.models import PollSessionResponse
 
+def _poll_response(session: dict) -> PollSessionResponse:
+    status = session.get("status")
+    # VERIFYING is internal; to the web client the session is still pending
+    if status == "VERIFYING":
+        status = "PENDING"
+    return PollSessionResponse(
+        status=status,
+        result=session.get("result")
+    )
+
 @router.get("/session/poll/{nonce}", response_model=PollSessionResponse)
-def poll_session(nonce: str, request: Request):
-    # Rate Limit by IP
-    client_ip = request.client.host if request.client else "unknown"
-    poll_limiter.check(f"poll:{client_ip}")
-    
-    session = session_manager.get_session(nonce)
+async def poll_session(nonce: str, request: Request, wait: float = Query(0, ge=0, le=settings.LONG_POLL_MAX_WAIT)):
+    """
+    Session status. With ?wait=N (seconds) this is a long-poll: it answers as soon as the
+    session is consumed, or after N seconds with whatever the status is then.
+    """
+    if wait:
+        session = await session_manager.wait_for_update(nonce, wait)
+    else:
+        session = await session_manager.get_session(nonce)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    status = session.get("status")
-    result = session.get("result")
-    
-    return PollSessionResponse(
-        status=status,
-        result=result
+    return _poll_response(session)
+
+@router.get("/session/events/{nonce}")
+async def session_events(nonce: str, request: Request):
+    """
+    Server-Sent Events stream of the session status for the web client. Sends the current
+    status right away, then once more when it changes (CONSUMED with the result, or
+    EXPIRED) and closes. Comment lines keep idle proxies from dropping the connection.
+    """
+    async def stream():
+        response = _poll_response(await session_manager.get_session(nonce))
+        yield f"event: status\ndata: {response.model_dump_json()}\n\n"
+        while response.status == "PENDING":
+            session = await session_manager.wait_for_update(nonce, settings.SSE_KEEPALIVE_INTERVAL)
+            update = _poll_response(session)
+            if update.status == response.status:
+                yield ": keepalive\n\n"
+                continue
+            response = update
+            yield f"event: status\ndata: {response.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 from app.api.models import BluetoothData
@@ -188,29 +236,23 @@ async def confirm_proximity(nonce: str, bluetooth_data: BluetoothData, request:
     Confirm BLE proximity detection from browser.
     Stores proximity confirmation in session for verification engine.
     """
-    # Rate Limit by IP
-    client_ip = request.client.host if request.client else "unknown"
-    proximity_limiter.check(f"proximity:{client_ip}")
-    
     # Validate nonce format (basic check)
     if len(nonce) > 100 or not nonce.replace("-", "").replace("_", "").isalnum():
         raise HTTPException(status_code=422, detail="Invalid nonce format")
     
-    session = session_manager.get_session(nonce)
-    if not session or session.get("status") == "EXPIRED":
-        raise HTTPException(status_code=404, detail="Session not found or expired")
-    
-    # Store proximity data in session
+    # Store proximity data in session (field-level write; False if the session is gone)
     # If BLE not supported, mark as not confirmed (but verification will pass)
     # If BLE supported and close, mark as confirmed (verification passes)
     # If BLE supported but not close/not found, don't call this endpoint (verification fails)
-    session_manager.update_proximity(nonce, {
+    stored = await session_manager.update_proximity(nonce, {
         "ble_uuid": bluetooth_data.ble_uuid,
         "found": bluetooth_data.found,
         "timestamp": bluetooth_data.timestamp,
         "supported": bluetooth_data.supported,  # Store whether BLE is supported by browser
         "confirmed": bluetooth_data.supported and bluetooth_data.found  # Only confirmed if supported AND found
     })
+    if not stored:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
     logger.info(f"Proximity stored for nonce={nonce}, ble_uuid={bluetooth_data.ble_uuid}, supported={bluetooth_data.supported}, found={bluetooth_data.found}")
     
     return {"status": "proximity_confirmed"}
@@ -220,6 +262,27 @@ async def websocket_test():
     """Test endpoint to verify WebSocket routes are registered"""
     return {"status": "WebSocket routes are registered", "endpoint": "/api/v1/ws/verification/{nonce}"}
 
+@router.get("/metrics")
+async def metrics():
+    """Cache and pipeline counters for dashboards / load tests"""
+    from app.services.verification_engine import verification_engine
+    from app.services.verdict_warmer import verdict_warmer
+    ssl_verifier = verification_engine.ssl_verifier
+    return {
+        "whitelist": verification_engine.tar.stats(),
+        "warmer": verdict_warmer.stats(),
+        "chain_cache": verification_engine.chain_cache.stats(),
+        "ocsp_cache": ssl_verifier.ocsp_cache.stats(),
+        "crl_cache": ssl_verifier.crl_cache.stats(),
+        "intermediate_cache": ssl_verifier.intermediate_cache.stats(),
+        "http": ssl_verifier.http.stats(),
+        "broker": session_manager.broker.stats(),
+        "websocket": websocket_manager.stats(),
+        "latency": app_metrics.snapshot(),
+        "rate_limit": rate_limit_policy.stats(),
+        "speculative": speculative_verifier.stats(),
+    }
+
 @router.websocket("/ws/verification/{nonce}")
 async def websocket_verification(websocket: WebSocket, nonce: str):
     """
@@ -232,7 +295,7 @@ async def websocket_verification(websocket: WebSocket, nonce: str):
         return
     
     # Verify session exists before accepting connection
-    session = session_manager.get_session(nonce)
+    session = await session_manager.get_session(nonce)
     if not session or session.get("status") == "EXPIRED":
         await websocket.close(code=1008, reason="Session not found or expired")
         return
@@ -289,8 +352,8 @@ async def websocket_verification(websocket: WebSocket, nonce: str):
             if data == "ping":
                 await websocket.send_text("pong")
     except WebSocketDisconnect:
-        websocket_manager.disconnect(websocket, nonce)
+        websocket_manager.disconnect(websocket, channel_key)
         logger.info(f"WebSocket disconnected for nonce: {nonce}")
     except Exception as e:
         logger.error(f"WebSocket error for nonce {nonce}: {e}")
-        websocket_manager.disconnect(websocket, nonce)
+        websocket_manager.disconnect(websocket, channel_key)
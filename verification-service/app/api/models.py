@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Literal, List, Dict, Any, Optional
 
 class InitSessionRequest(BaseModel):
@@ -32,7 +32,9 @@ class PollSessionResponse(BaseModel):
     result: VerifyTokenResponse | None = None
 
 class BluetoothData(BaseModel):
-    ble_uuid: str
+    # Length caps keep both fields within the session record's one-byte length prefix
+    # (63 characters <= 255 bytes of UTF-8), so every session backend accepts the same input
+    ble_uuid: str = Field(max_length=63)
     found: bool = False
-    timestamp: str
+    timestamp: str = Field(max_length=63)
     supported: bool = True  # Whether BT is supported by browser
@@ -1,3 +1,4 @@
+import json
 import os
 
 class Settings:
@@ -5,8 +6,159 @@ class Settings:
     PROJECT_NAME: str = "Gov Verify"
     API_V1_STR: str = "/api/v1"
     
+    # Session storage engine: "redis" (shared across workers/replicas) or "memory"
+    # (in-process, single worker only; rate limits are then counted in-process too)
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "redis").lower()
+
+    # Result delivery to the web client without tight polling: GET /session/poll/{nonce}?wait=N
+    # holds up to LONG_POLL_MAX_WAIT seconds; the SSE stream sends a keepalive comment (and
+    # re-checks for expiry) every SSE_KEEPALIVE_INTERVAL seconds.
+    LONG_POLL_MAX_WAIT: int = int(os.getenv("LONG_POLL_MAX_WAIT", 25))
+    SSE_KEEPALIVE_INTERVAL: int = int(os.getenv("SSE_KEEPALIVE_INTERVAL", 15))
+
+    # Phone notifications sent before its WebSocket is up wait in a per-channel mailbox
+    # for WS_MAILBOX_TTL seconds (newest WS_MAILBOX_MAX_MESSAGES kept) and are flushed on connect
+    WS_MAILBOX_TTL: int = int(os.getenv("WS_MAILBOX_TTL", 30))
+    WS_MAILBOX_MAX_MESSAGES: int = int(os.getenv("WS_MAILBOX_MAX_MESSAGES", 8))
+    # Broadcast: at most WS_SEND_CONCURRENCY sends in flight per worker; a socket that
+    # doesn't take a message within WS_SEND_TIMEOUT seconds is closed as a slow consumer
+    WS_SEND_CONCURRENCY: int = int(os.getenv("WS_SEND_CONCURRENCY", 256))
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", 2))
+
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
+    # Shared asyncio connection pool (sessions + rate limiting). Requests wait up to
+    # REDIS_POOL_TIMEOUT for a free connection instead of opening unbounded sockets.
+    # Timeouts are in seconds; idle connections are PINGed every REDIS_HEALTH_CHECK_INTERVAL.
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", 64))
+    REDIS_POOL_TIMEOUT: float = float(os.getenv("REDIS_POOL_TIMEOUT", 2))
+    REDIS_SOCKET_TIMEOUT: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", 1))
+    REDIS_CONNECT_TIMEOUT: float = float(os.getenv("REDIS_CONNECT_TIMEOUT", 1))
+    REDIS_HEALTH_CHECK_INTERVAL: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+    # Rate limiting runs a local tier first: per-IP buckets for up to RATE_LIMIT_LOCAL_KEYS
+    # keys (LRU) reject floods without a Redis round-trip. Requests it lets through take a
+    # lease of up to RATE_LIMIT_LEASE_SIZE tokens from the shared Redis bucket, spent locally
+    # for at most RATE_LIMIT_LEASE_TTL seconds (1 = a Redis call for every request).
+    RATE_LIMIT_LOCAL_KEYS: int = int(os.getenv("RATE_LIMIT_LOCAL_KEYS", 50000))
+    RATE_LIMIT_LEASE_SIZE: int = int(os.getenv("RATE_LIMIT_LEASE_SIZE", 4))
+    RATE_LIMIT_LEASE_TTL: float = float(os.getenv("RATE_LIMIT_LEASE_TTL", 2))
+    # Per-IP budgets, enforced by middleware before the request body is read. "buckets" are
+    # the budgets (sustained rpm + burst); "routes" map "METHOD /path" (a path also covers
+    # everything below it) to the bucket it draws from and how many tokens a request costs.
+    # Replace the whole table with RATE_LIMIT_POLICY='{"buckets": {...}, "routes": {...}}'.
+    RATE_LIMIT_POLICY: dict = json.loads(os.getenv("RATE_LIMIT_POLICY") or json.dumps({
+        "buckets": {
+            "init": {"rpm": 20, "burst": 10},
+            "verify": {"rpm": 60, "burst": 10},
+            "proximity": {"rpm": 30, "burst": 10},
+            "poll": {"rpm": 120, "burst": 20},
+        },
+        "routes": {
+            f"POST {API_V1_STR}/session/init": {"bucket": "init", "cost": 1},
+            f"POST {API_V1_STR}/session/verify": {"bucket": "verify", "cost": 1},
+            f"POST {API_V1_STR}/session/proximity": {"bucket": "proximity", "cost": 1},
+            f"GET {API_V1_STR}/session/poll": {"bucket": "poll", "cost": 1},
+            # One stream replaces a whole session's worth of polls
+            f"GET {API_V1_STR}/session/events": {"bucket": "poll", "cost": 1},
+        },
+    }))
+
+    # Whitelist is rebuilt in the background every WHITELIST_REFRESH_INTERVAL seconds
+    WHITELIST_REFRESH_INTERVAL: int = int(os.getenv("WHITELIST_REFRESH_INTERVAL", 3600))
+
+    # Verification pipeline: blocking TLS/OCSP/CRL I/O runs on a bounded thread pool
+    # so a slow host never stalls the event loop. Stage timeouts are in seconds.
+    VERIFY_MAX_WORKERS: int = int(os.getenv("VERIFY_MAX_WORKERS", 32))
+    TLS_STAGE_TIMEOUT: float = float(os.getenv("TLS_STAGE_TIMEOUT", 6))
+    REVOCATION_STAGE_TIMEOUT: float = float(os.getenv("REVOCATION_STAGE_TIMEOUT", 10))
+    # Overall time budget per request, starting when it arrives ("METHOD /path" -> seconds; a path
+    # also covers everything below it). Stages get what is left of it, capped by their own timeouts;
+    # out of time, verify answers with a partial or ERROR verdict instead of running on. Must stay
+    # well under SESSION_TTL. Work not tied to a request (speculative, warmer) gets VERIFY_DEADLINE.
+    # Replace the table with REQUEST_DEADLINES='{"POST /api/v1/session/verify": 8}'.
+    REQUEST_DEADLINES: dict = json.loads(os.getenv("REQUEST_DEADLINES") or json.dumps({
+        f"POST {API_V1_STR}/session/verify": 10,
+    }))
+    VERIFY_DEADLINE: float = float(os.getenv("VERIFY_DEADLINE", 20))
+    # Revocation sources race: OCSP starts first; every CRL distribution point joins after
+    # REVOCATION_HEDGE_DELAY seconds (or as soon as OCSP gives no answer). First definitive answer wins.
+    REVOCATION_HEDGE_DELAY: float = float(os.getenv("REVOCATION_HEDGE_DELAY", 0.5))
+
+    # Shared keep-alive HTTP client for OCSP, CRL, caIssuers and whitelist API fetches: pools for
+    # up to HTTP_POOL_MAX_HOSTS hosts, at most HTTP_POOL_PER_HOST connections each (extra requests
+    # wait for one), resolved addresses cached for HTTP_DNS_TTL seconds. Timeouts are in seconds;
+    # a caller's own (shorter) budget takes precedence over HTTP_READ_TIMEOUT.
+    HTTP_POOL_MAX_HOSTS: int = int(os.getenv("HTTP_POOL_MAX_HOSTS", 32))
+    HTTP_POOL_PER_HOST: int = int(os.getenv("HTTP_POOL_PER_HOST", 8))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+    HTTP_READ_TIMEOUT: float = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+    HTTP_DNS_TTL: int = int(os.getenv("HTTP_DNS_TTL", 300))
+    # Circuit breaker per OCSP responder / CRL host: over the last BREAKER_WINDOW seconds, once
+    # at least BREAKER_MIN_CALLS calls were made and BREAKER_FAILURE_RATE of them failed (error,
+    # 5xx, or more than BREAKER_SLOW_CALL seconds to the response headers - the body's download
+    # time doesn't count, CRLs can be megabytes), calls fail fast for BREAKER_OPEN_FOR seconds,
+    # then BREAKER_HALF_OPEN_PROBES trial calls decide whether it closes again.
+    BREAKER_WINDOW: float = float(os.getenv("BREAKER_WINDOW", 60))
+    BREAKER_MIN_CALLS: int = int(os.getenv("BREAKER_MIN_CALLS", 5))
+    BREAKER_FAILURE_RATE: float = float(os.getenv("BREAKER_FAILURE_RATE", 0.5))
+    BREAKER_SLOW_CALL: float = float(os.getenv("BREAKER_SLOW_CALL", 2))
+    BREAKER_OPEN_FOR: float = float(os.getenv("BREAKER_OPEN_FOR", 30))
+    BREAKER_HALF_OPEN_PROBES: int = int(os.getenv("BREAKER_HALF_OPEN_PROBES", 1))
+    # Verdict when revocation can't be checked because breakers are open or every OCSP/CRL
+    # source failed ("degraded"):
+    # "pass" counts the certificate as not revoked (as when a responder times out), "caution"
+    # deducts REVOCATION_DEGRADED_PENALTY points, "fail" scores 0. When the request's deadline
+    # runs out during revocation, "pass" is treated as "caution".
+    REVOCATION_DEGRADED_POLICY: str = os.getenv("REVOCATION_DEGRADED_POLICY", "pass").lower()
+    REVOCATION_DEGRADED_PENALTY: int = int(os.getenv("REVOCATION_DEGRADED_PENALTY", 25))
+
+    # Certificate chain cache per (hostname, port). Served fresh for CHAIN_CACHE_TTL seconds,
+    # then served stale for up to CHAIN_CACHE_STALE_TTL more while refreshing in the background.
+    # VERIFY_FORCE_FRESH=true always does a new handshake (high-assurance deployments).
+    CHAIN_CACHE_TTL: int = int(os.getenv("CHAIN_CACHE_TTL", 60))
+    CHAIN_CACHE_STALE_TTL: int = int(os.getenv("CHAIN_CACHE_STALE_TTL", 300))
+    CHAIN_CACHE_MAX_ENTRIES: int = int(os.getenv("CHAIN_CACHE_MAX_ENTRIES", 1000))
+    VERIFY_FORCE_FRESH: bool = os.getenv("VERIFY_FORCE_FRESH", "False").lower() in ("true", "1", "yes")
+
+    # Background verdict warmer: recomputes URL-only verdicts for hot ("hot") or all ("all")
+    # whitelisted domains every WARMER_INTERVAL (+ up to WARMER_JITTER) seconds. The cache keeps
+    # at most VERDICT_CACHE_MAX_ENTRIES verdicts (least recently used evicted first).
+    VERDICT_CACHE_TTL: int = int(os.getenv("VERDICT_CACHE_TTL", 300))
+    VERDICT_CACHE_MAX_ENTRIES: int = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", 5000))
+    WARMER_ENABLED: bool = os.getenv("WARMER_ENABLED", "True").lower() in ("true", "1", "yes")
+    WARMER_MODE: str = os.getenv("WARMER_MODE", "hot")
+    WARMER_TOP_N: int = int(os.getenv("WARMER_TOP_N", 200))
+    WARMER_INTERVAL: int = int(os.getenv("WARMER_INTERVAL", 120))
+    WARMER_JITTER: int = int(os.getenv("WARMER_JITTER", 15))
+    WARMER_CONCURRENCY: int = int(os.getenv("WARMER_CONCURRENCY", 8))
+
+    # Speculative verification: /session/init queues the URL-only stages so the verdict is
+    # usually ready when the phone calls /session/verify. At most SPECULATIVE_QUEUE_SIZE hosts
+    # wait (more are dropped, verify then does the work) and SPECULATIVE_CONCURRENCY run at once.
+    SPECULATIVE_ENABLED: bool = os.getenv("SPECULATIVE_ENABLED", "True").lower() in ("true", "1", "yes")
+    SPECULATIVE_QUEUE_SIZE: int = int(os.getenv("SPECULATIVE_QUEUE_SIZE", 256))
+    SPECULATIVE_CONCURRENCY: int = int(os.getenv("SPECULATIVE_CONCURRENCY", 8))
+    # A verify whose host is still being speculated on waits at most SPECULATIVE_JOIN_TIMEOUT
+    # seconds for that run, so verifying on its own still fits in the request's deadline.
+    SPECULATIVE_JOIN_TIMEOUT: float = float(os.getenv("SPECULATIVE_JOIN_TIMEOUT", 3))
+
+    # CRL cache: LRU bounded by entry count and total revoked serials; optional on-disk tier
+    CRL_CACHE_MAX_ENTRIES: int = int(os.getenv("CRL_CACHE_MAX_ENTRIES", 64))
+    CRL_CACHE_MAX_SERIALS: int = int(os.getenv("CRL_CACHE_MAX_SERIALS", 2_000_000))
+    CRL_CACHE_DIR: str | None = os.getenv("CRL_CACHE_DIR") or None
+    CRL_MIN_REFRESH_INTERVAL: int = int(os.getenv("CRL_MIN_REFRESH_INTERVAL", 300))
+    # When a refresh fails, a CRL is still used for up to CRL_MAX_STALENESS seconds past its
+    # nextUpdate (past its last fetch if it has none); beyond that it counts as unavailable
+    CRL_MAX_STALENESS: int = int(os.getenv("CRL_MAX_STALENESS", 86400))
+
+    # OCSP response cache: reused until nextUpdate (or DEFAULT_TTL when absent), never beyond MAX_TTL
+    OCSP_CACHE_MAX_ENTRIES: int = int(os.getenv("OCSP_CACHE_MAX_ENTRIES", 10000))
+    OCSP_DEFAULT_TTL: int = int(os.getenv("OCSP_DEFAULT_TTL", 3600))
+    OCSP_MAX_TTL: int = int(os.getenv("OCSP_MAX_TTL", 7 * 24 * 3600))
+
+    # Intermediate CA certificates learned from server chains / AIA caIssuers, keyed by SKI
+    INTERMEDIATE_CACHE_MAX_ENTRIES: int = int(os.getenv("INTERMEDIATE_CACHE_MAX_ENTRIES", 512))
     
     # Allow badssl.com domains for SSL testing when TEST_SSL is True
     TEST_SSL: bool = os.getenv("TEST_SSL", "False").lower() in ("true", "1", "yes")    
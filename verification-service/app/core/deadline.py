@@ -0,0 +1,62 @@
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+
+
+class Deadline:
+    """
+    Absolute time budget for one piece of work, on the monotonic clock. Passed down the
+    call chain (endpoint -> VerificationEngine -> SSLVerifier -> HTTP fetches) so every
+    stage gets what is left instead of its own full timeout. Read-only once created,
+    so it can be shared with executor threads.
+    """
+
+    __slots__ = ("expires_at", "clock")
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.clock() >= self.expires_at
+
+    def budget(self, cap: float) -> float:
+        """Seconds a stage may take: its own cap, or less if the deadline comes first."""
+        return min(cap, self.remaining())
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware: starts the clock for routes listed in settings.REQUEST_DEADLINES
+    ("METHOD /path" -> seconds; a path also covers everything below it) when the request
+    arrives, and leaves the Deadline in request.state.deadline for the endpoint to pass on.
+    """
+
+    def __init__(self, app: ASGIApp, deadlines: Optional[Dict[str, float]] = None):
+        self.app = app
+        routes: List[Tuple[str, str, float]] = []
+        for route, seconds in (deadlines if deadlines is not None else settings.REQUEST_DEADLINES).items():
+            method, path = route.split(" ", 1)
+            routes.append((method.upper(), path.rstrip("/"), float(seconds)))
+        # Longest path first, so a more specific route wins
+        self.routes = sorted(routes, key=lambda r: len(r[1]), reverse=True)
+
+    def match(self, method: str, path: str) -> Optional[float]:
+        for route_method, prefix, seconds in self.routes:
+            if route_method == method and (path == prefix or path.startswith(prefix + "/")):
+                return seconds
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            seconds = self.match(scope["method"], scope["path"])
+            if seconds is not None:
+                scope.setdefault("state", {})["deadline"] = Deadline(seconds)
+        await self.app(scope, receive, send)
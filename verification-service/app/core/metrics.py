@@ -0,0 +1,81 @@
+"""
+In-process latency histograms for /metrics.
+
+Fixed cumulative buckets (Prometheus-style `le` bounds, in seconds) so recording is O(log
+buckets) and memory stays constant; quantiles are estimated from the buckets. Each worker
+keeps its own registry.
+"""
+import bisect
+import threading
+from typing import Dict, Optional, Sequence
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (None if empty or in +Inf)."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum = self._count, self._sum
+        cumulative = {}
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            cumulative[str(bound)] = seen
+        cumulative["+Inf"] = total
+        return {
+            "count": total,
+            "sum": round(value_sum, 6),
+            "mean": round(value_sum / total, 6) if total else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+
+_histograms: Dict[str, Histogram] = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create the named histogram."""
+    with _registry_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(buckets)
+        return _histograms[name]
+
+
+def snapshot() -> dict:
+    with _registry_lock:
+        items = list(_histograms.items())
+    return {name: hist.snapshot() for name, hist in items}
@@ -1,42 +1,275 @@
 from fastapi import Request, HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.config import settings
 from app.services.session_manager import session_manager
+import math
 import time
 import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# GCRA (generic cell rate algorithm), i.e. a token bucket that stores one timestamp per key:
+# the theoretical arrival time (TAT) at which the bucket will be full again. A request of
+# `cost` moves TAT forward by cost * interval (interval = 60 / rpm); it is allowed while TAT
+# stays within `burst` intervals of now. No window edges, so no 2x bursts at the minute
+# boundary, and `burst` requests may arrive back to back.
+#
+# The script takes `cost` tokens and, if the bucket has them, up to `want` in total: the
+# extra ones are a lease the worker spends without coming back to Redis. Returns the number
+# of tokens granted (0 = rejected), then the slack (or the wait) and the reset time.
+#
+# In Redis this is one EVALSHA per check. `now` comes from the caller's clock (injectable for
+# tests); workers are assumed to share NTP time.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tolerance = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local want = tonumber(ARGV[5])
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+local available = math.floor((tolerance - (tat - now)) / interval + 1e-9)
+if available < cost then
+    return {0, tostring(tat + cost * interval - tolerance - now), tostring(tat - now)}
+end
+local granted = math.min(available, want)
+local new_tat = tat + granted * interval
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {granted, tostring(tolerance - (new_tat - now)), tostring(new_tat - now)}
+"""
+
+
+class RateLimitStatus(NamedTuple):
+    allowed: bool
+    limit: int              # sustained requests per minute
+    remaining: int          # requests of cost 1 that would still pass right now (<= burst)
+    retry_after: float      # seconds until this request would pass (0 if allowed)
+    reset_after: float      # seconds until the bucket is full again
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def gcra(tat: Optional[float], now: float, interval: float, tolerance: float,
+         cost: int, want: Optional[int] = None) -> Tuple[int, float, float, float]:
+    """
+    The GCRA step (same as GCRA_SCRIPT): (granted, new TAT, slack or wait, reset_after).
+    granted is 0 when the bucket doesn't have `cost` tokens; then the third value is the
+    wait in seconds, otherwise the unused tolerance.
+    """
+    tat = now if tat is None or tat < now else tat
+    available = math.floor((tolerance - (tat - now)) / interval + 1e-9)
+    if available < cost:
+        return 0, tat, tat + cost * interval - tolerance - now, tat - now
+    granted = min(available, want or cost)
+    new_tat = tat + granted * interval
+    return granted, new_tat, tolerance - (new_tat - now), new_tat - now
+
+
+class LocalBuckets:
+    """GCRA state for the most recently seen keys; an evicted key starts again with a full bucket."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+        # key -> (tokens left, expires_at) taken from the shared bucket in advance
+        self._leases: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    def take(self, key: str, now: float, interval: float, tolerance: float, cost: int) -> Tuple[int, float, float]:
+        granted, tat, slack_or_wait, reset_after = gcra(self._tats.get(key), now, interval, tolerance, cost)
+        self._tats[key] = tat
+        self._tats.move_to_end(key)
+        if len(self._tats) > self.max_keys:
+            self._tats.popitem(last=False)
+        return granted, slack_or_wait, reset_after
+
+    def spend_lease(self, key: str, now: float, cost: int) -> bool:
+        lease = self._leases.get(key)
+        if lease is None:
+            return False
+        tokens, expires_at = lease
+        if expires_at <= now or tokens < cost:
+            del self._leases[key]
+            return False
+        self._leases[key] = (tokens - cost, expires_at)
+        return True
+
+    def add_lease(self, key: str, tokens: int, expires_at: float) -> None:
+        if tokens <= 0:
+            return
+        self._leases[key] = (tokens, expires_at)
+        self._leases.move_to_end(key)
+        if len(self._leases) > self.max_keys:
+            self._leases.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+
 class RateLimiter:
-    def __init__(self, requests_per_minute: int = 60, burst: int = 5):
+    """
+    Two tiers. Every check first runs the bucket in-process (bounded LRU per key): this
+    worker's own traffic is a lower bound on the key's total, so a local rejection is
+    always right and costs no Redis call - a flood from one IP is shed here. What passes
+    is checked against the shared Redis bucket, taking a short lease of a few extra
+    tokens that later requests for the same key spend locally.
+
+    Leased tokens are spent from the shared bucket up front, so a key spread over several
+    workers may be limited slightly early; with SESSION_BACKEND=memory the local tier is
+    the whole limiter.
+    """
+
+    def __init__(self, requests_per_minute: int = 60, burst: int = 5, clock: Callable[[], float] = time.time,
+                 lease_size: int = settings.RATE_LIMIT_LEASE_SIZE,
+                 lease_ttl: float = settings.RATE_LIMIT_LEASE_TTL,
+                 local_keys: int = settings.RATE_LIMIT_LOCAL_KEYS,
+                 redis_client=session_manager.redis):
         self.rpm = requests_per_minute
         self.burst = burst
-        self.redis = session_manager.redis
-
-    def check(self, key: str):
-        # Redis Key for rate limiting
-        # Use Fixed Window for simplicity or Token Bucket. 
-        # Let's use simple Fixed Window with expiry
-        current_minute = int(time.time() // 60)
-        redis_key = f"rate_limit:{key}:{current_minute}"
-        
+        # Shared tier; None (SESSION_BACKEND=memory) leaves only the local one
+        self.redis = redis_client
+        self.clock = clock
+        # Seconds between requests at the sustained rate; a full bucket absorbs `burst` of them
+        self.interval = 60.0 / requests_per_minute
+        self.tolerance = self.interval * burst
+        self.lease_size = max(1, min(lease_size, burst))
+        self.lease_ttl = lease_ttl
+        self._script = self.redis.register_script(GCRA_SCRIPT) if self.redis is not None else None
+        self._local = LocalBuckets(local_keys)
+        self._stats = {"checks": 0, "local_rejected": 0, "lease_hits": 0, "redis_calls": 0, "redis_rejected": 0}
+
+    def _status(self, granted: int, slack_or_wait: float, reset_after: float) -> RateLimitStatus:
+        if granted:
+            return RateLimitStatus(True, self.rpm, int(slack_or_wait / self.interval + 1e-9), 0.0, reset_after)
+        return RateLimitStatus(False, self.rpm, 0, slack_or_wait, reset_after)
+
+    async def check(self, key: str, cost: int = 1) -> RateLimitStatus:
+        """
+        Take `cost` requests from `key`'s bucket. Raises 429 (with Retry-After) when it
+        doesn't have them; otherwise returns the status for X-RateLimit-* headers.
+        """
+        now = self.clock()
+        self._stats["checks"] += 1
+
+        status = self._status(*self._local.take(key, now, self.interval, self.tolerance, cost))
+        if not status.allowed:
+            self._stats["local_rejected"] += 1
+        elif self.redis is not None:
+            if self._local.spend_lease(key, now, cost):
+                # Prepaid in Redis by an earlier request; the local status stands in for the shared one
+                self._stats["lease_hits"] += 1
+            else:
+                status = await self._check_shared(key, now, cost)
+
+        if not status.allowed:
+            raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=status.headers())
+        return status
+
+    async def _check_shared(self, key: str, now: float, cost: int) -> RateLimitStatus:
+        self._stats["redis_calls"] += 1
         try:
-            # Atomic increment
-            # Pipeline for atomicity optional but good practice
-            pipe = self.redis.pipeline()
-            pipe.incr(redis_key)
-            pipe.expire(redis_key, 60) # Expire in 60 seconds
-            result = pipe.execute()
-            
-            count = result[0]
-            
-            if count > self.rpm:
-                raise HTTPException(status_code=429, detail="Rate limit exceeded")
-                
+            granted, slack_or_wait, reset_after = await self._script(
+                keys=[f"rate_limit:{key}"],
+                args=[repr(now), repr(self.interval), repr(self.tolerance), cost, cost + self.lease_size - 1],
+            )
         except Exception as e:
-            if isinstance(e, HTTPException):
-                raise e
             # Fail closed for security: if rate limiting fails, block the request
             # This prevents DoS attacks when Redis is unavailable
             logger.error(f"Rate Limit Error: {e}")
             raise HTTPException(status_code=503, detail="Rate limiting service unavailable")
+        granted = int(granted)
+        if not granted:
+            self._stats["redis_rejected"] += 1
+        self._local.add_lease(key, granted - cost, now + self.lease_ttl)
+        status = self._status(granted, float(slack_or_wait), float(reset_after))
+        # The leased tokens are still this client's to use
+        return status._replace(remaining=status.remaining + granted - cost) if granted else status
+
+    def stats(self) -> dict:
+        return dict(self._stats, local_keys=len(self._local))
+
+class RateLimitPolicy:
+    """
+    Route -> (bucket, cost) table from settings.RATE_LIMIT_POLICY, with one RateLimiter
+    per bucket. Routes sharing a bucket share its budget, so a costly route can be
+    charged several tokens per request.
+    """
+
+    def __init__(self, policy: dict):
+        self.limiters = {
+            name: RateLimiter(requests_per_minute=bucket["rpm"], burst=bucket.get("burst", 5))
+            for name, bucket in policy["buckets"].items()
+        }
+        routes: List[Tuple[str, str, str, int]] = []
+        for route, rule in policy["routes"].items():
+            method, path = route.split(" ", 1)
+            if rule["bucket"] not in self.limiters:
+                raise ValueError(f"Rate limit route {route!r} uses unknown bucket {rule['bucket']!r}")
+            routes.append((method.upper(), path.rstrip("/"), rule["bucket"], int(rule.get("cost", 1))))
+        # Longest path first, so a more specific route wins
+        self.routes = sorted(routes, key=lambda r: len(r[1]), reverse=True)
+
+    def match(self, method: str, path: str) -> Optional[Tuple[str, int]]:
+        """(bucket, cost) for a request, or None if it isn't limited."""
+        for route_method, prefix, bucket, cost in self.routes:
+            if route_method == method and (path == prefix or path.startswith(prefix + "/")):
+                return bucket, cost
+        return None
+
+    def stats(self) -> dict:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware: a limited route is charged before routing, body parsing or
+    validation run, and an over-budget request is answered here with 429 (or 503 when
+    the limiter is unavailable). Allowed responses get the X-RateLimit-* headers.
+    """
+
+    def __init__(self, app: ASGIApp, policy: Optional[RateLimitPolicy] = None):
+        self.app = app
+        self.policy = policy or rate_limit_policy
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rule = self.policy.match(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        bucket, cost = rule
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+        try:
+            status = await self.policy.limiters[bucket].check(f"{bucket}:{client_ip}", cost)
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+            await response(scope, receive, send)
+            return
+
+        extra_headers = [(name.lower().encode(), value.encode()) for name, value in status.headers().items()]
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + extra_headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
 
 rate_limiter = RateLimiter() # Global instance or dependency
+rate_limit_policy = RateLimitPolicy(settings.RATE_LIMIT_POLICY)
@@ -1,14 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import router
 from app.core.config import settings
+from app.core.deadline import DeadlineMiddleware
+from app.core.rate_limit import RateLimitMiddleware
+from app.services.http_client import http_client
+from app.services.session_manager import session_manager
+from app.services.speculative_verifier import speculative_verifier
+from app.services.verdict_warmer import verdict_warmer
+from app.services.whitelist_checker import trust_anchor_repository
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background jobs run for the lifetime of the worker and are cancelled on shutdown
+    tasks = [asyncio.create_task(trust_anchor_repository.run_refresh_loop())]
+    if settings.WARMER_ENABLED:
+        tasks.append(asyncio.create_task(verdict_warmer.run()))
+    if settings.SPECULATIVE_ENABLED:
+        tasks.append(asyncio.create_task(speculative_verifier.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await session_manager.close()
+    http_client.close()
 
 app = FastAPI(
     title="Gov Verify Service",
     description="Verification Service for Gov Verify System",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Per-IP rate limits, checked before routing/body parsing. Added before CORS so that CORS
+# wraps it and 429 responses still carry the CORS headers the browser needs to read them.
+app.add_middleware(RateLimitMiddleware)
+
+# Per-route time budgets (settings.REQUEST_DEADLINES), started before rate limiting and body parsing
+app.add_middleware(DeadlineMiddleware)
+
 # CORS config allowing everything for MVP
 app.add_middleware(
     CORSMiddleware,
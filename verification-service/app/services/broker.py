@@ -0,0 +1,210 @@
+"""
+Pub/sub broker for cross-request (and cross-worker) notifications.
+
+Producers `publish(channel, message)`; consumers hold a subscription while they wait:
+
+    async with broker.subscribe("session-events:<nonce>") as subscription:
+        message = await subscription.get(timeout=25)
+
+Messages are short strings and delivery is at-most-once: a consumer must be able to
+re-read the real state after a wake-up or a timeout, never rely on the message alone.
+
+  - RedisBroker    Redis pub/sub; one shared connection per worker, refcounted per channel,
+                   so only channels that have a local subscriber are subscribed on Redis
+  - InMemoryBroker same interface inside one process (single worker, tests)
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Local mailbox for one subscriber; bounded so a stuck consumer can't grow it."""
+
+    def __init__(self, channel: str, maxsize: int = 16):
+        self.channel = channel
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, message: str) -> None:
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Notifications only say "look again"; dropping one when many are queued loses nothing
+            pass
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Next message, or None after `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker(ABC):
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._stats = {"published": 0, "delivered": 0}
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str) -> int:
+        """Publish and return how many subscribers (workers, for Redis) received it."""
+        raise NotImplementedError
+
+    async def _on_first_subscriber(self, channel: str) -> None:
+        pass
+
+    async def _wait_subscribed(self, channel: str) -> None:
+        pass
+
+    async def _on_last_unsubscribe(self, channel: str) -> None:
+        pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[Subscription]:
+        subscription = Subscription(channel)
+        subscribers = self._subscriptions.setdefault(channel, set())
+        subscribers.add(subscription)
+        try:
+            if len(subscribers) == 1:
+                await self._on_first_subscriber(channel)
+            else:
+                await self._wait_subscribed(channel)
+            yield subscription
+        finally:
+            subscribers.discard(subscription)
+            if not subscribers and self._subscriptions.get(channel) is subscribers:
+                del self._subscriptions[channel]
+                await self._on_last_unsubscribe(channel)
+
+    def _dispatch(self, channel: str, message: str) -> None:
+        for subscription in list(self._subscriptions.get(channel, ())):
+            subscription.deliver(message)
+            self._stats["delivered"] += 1
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return dict(self._stats, channels=len(self._subscriptions))
+
+
+class InMemoryBroker(Broker):
+    async def publish(self, channel: str, message: str) -> int:
+        self._stats["published"] += 1
+        receivers = len(self._subscriptions.get(channel, ()))
+        self._dispatch(channel, message)
+        return receivers
+
+
+class RedisBroker(Broker):
+    """
+    Redis pub/sub with one PubSub connection per worker. A reader task routes incoming
+    messages to local subscriptions; if the connection drops it reconnects with backoff
+    and re-subscribes every channel that still has a local subscriber (waiters time out
+    and re-read state meanwhile, so nothing hangs).
+    """
+
+    def __init__(self, client, reconnect_delay: float = 1.0):
+        super().__init__()
+        self.redis = client
+        self.reconnect_delay = reconnect_delay
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._broken = False
+        self._stats["reconnects"] = 0
+
+    async def publish(self, channel: str, message: str) -> int:
+        receivers = await self.redis.publish(channel, message)
+        self._stats["published"] += 1
+        return receivers
+
+    async def _on_first_subscriber(self, channel: str) -> None:
+        async with self._lock:
+            self._ensure_reader()
+            try:
+                await self._pubsub.subscribe(channel)
+            except Exception as e:
+                # Keep the local subscription; the reader reconnects and re-subscribes it
+                logger.error(f"Subscribe to {channel} failed: {e}")
+                self._broken = True
+
+    async def _wait_subscribed(self, channel: str) -> None:
+        # Another subscriber's SUBSCRIBE may still be in flight; don't return before it lands
+        async with self._lock:
+            pass
+
+    async def _on_last_unsubscribe(self, channel: str) -> None:
+        async with self._lock:
+            if self._pubsub is not None and channel not in self._subscriptions:
+                try:
+                    await self._pubsub.unsubscribe(channel)
+                except Exception as e:
+                    # The reader will rebuild the subscription set on reconnect anyway
+                    logger.warning(f"Unsubscribe from {channel} failed: {e}")
+
+    def _ensure_reader(self) -> None:
+        if self._pubsub is None:
+            self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self) -> None:
+        while True:
+            try:
+                if self._broken:
+                    await asyncio.sleep(self.reconnect_delay)
+                    await self._reconnect()
+                    continue
+                if not self._pubsub.subscribed:
+                    # Nothing to listen to yet (or all channels dropped): idle cheaply
+                    await asyncio.sleep(0.05)
+                    continue
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message and message["type"] == "message":
+                    channel = message["channel"]
+                    data = message["data"]
+                    self._dispatch(
+                        channel.decode() if isinstance(channel, bytes) else channel,
+                        data.decode() if isinstance(data, bytes) else data,
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broker connection lost: {e}; reconnecting in {self.reconnect_delay}s")
+                self._broken = True
+
+    async def _reconnect(self) -> None:
+        async with self._lock:
+            old, self._pubsub = self._pubsub, self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await old.aclose()
+            except Exception:
+                pass
+            self._stats["reconnects"] += 1
+            channels = list(self._subscriptions)
+            self._broken = False
+            if channels:
+                try:
+                    await self._pubsub.subscribe(*channels)
+                except Exception as e:
+                    logger.error(f"Re-subscribe failed: {e}")
+                    self._broken = True
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+
+
+def make_broker(redis_client=None) -> Broker:
+    """Redis pub/sub when sessions are in Redis, otherwise in-process."""
+    if redis_client is None:
+        return InMemoryBroker()
+    return RedisBroker(redis_client)
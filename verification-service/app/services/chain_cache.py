@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from cryptography import x509
+
+logger = logging.getLogger(__name__)
+
+ChainKey = Tuple[str, int]
+
+
+class ChainEntry:
+    """
+    A parsed certificate chain for one (hostname, port) plus the verdicts that only depend
+    on the chain itself, precomputed once so cache hits skip straight to revocation.
+    """
+
+    __slots__ = ("chain", "expiry", "hostname_match", "metadata", "fetched_at")
+
+    def __init__(self, chain: List[x509.Certificate], expiry: Tuple[bool, str],
+                 hostname_match: bool, metadata: dict):
+        self.chain = chain
+        self.expiry = expiry
+        self.hostname_match = hostname_match
+        self.metadata = metadata
+        self.fetched_at = time.monotonic()
+
+    @property
+    def leaf(self) -> x509.Certificate:
+        return self.chain[0]
+
+    @property
+    def issuer(self) -> Optional[x509.Certificate]:
+        return self.chain[1] if len(self.chain) > 1 else None
+
+
+class ChainCache:
+    """
+    Per-(hostname, port) certificate chain cache with stale-while-revalidate.
+
+    - Younger than `ttl`: served from memory.
+    - Between `ttl` and `ttl + stale_ttl`: served from memory while one background task refreshes it.
+    - Older or missing: loaded inline (a fresh TLS handshake).
+    Concurrent loads of the same key share one handshake. A `force_fresh=True` call never
+    joins one: it may have started before the caller asked, so the caller gets a handshake
+    of its own (still stored for everyone else). Failed loads are not cached.
+    """
+
+    def __init__(self, loader: Callable[[str, int], Awaitable[Optional[ChainEntry]]],
+                 ttl: float = 60, stale_ttl: float = 300, max_entries: int = 1000):
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[ChainKey, ChainEntry]" = OrderedDict()
+        self._loading: Dict[ChainKey, asyncio.Future] = {}
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "forced": 0, "refreshes": 0, "errors": 0}
+
+    async def get(self, hostname: str, port: int = 443, force_fresh: bool = False) -> Optional[ChainEntry]:
+        key = (hostname, port)
+        if force_fresh:
+            self._stats["forced"] += 1
+            return await self._load_own(key)
+        if self.ttl <= 0:
+            self._stats["forced"] += 1
+            return await self._load(key)
+
+        entry = self._entries.get(key)
+        if entry:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self._stats["stale_hits"] += 1
+                self._schedule_refresh(key)
+                return entry
+
+        self._stats["misses"] += 1
+        return await self._load(key)
+
+    def stats(self) -> dict:
+        return dict(self._stats, entries=len(self._entries), loading=len(self._loading))
+
+    def _schedule_refresh(self, key: ChainKey):
+        if key in self._loading:
+            return
+        self._stats["refreshes"] += 1
+        task = asyncio.create_task(self._load(key))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task):
+        self._refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Background chain refresh failed: {task.exception()}")
+
+    async def _load(self, key: ChainKey) -> Optional[ChainEntry]:
+        pending = self._loading.get(key)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            entry = await self.loader(*key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self._stats["errors"] += 1
+            future.set_exception(e)
+            # Mark retrieved so an unobserved failure doesn't log "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            if entry:
+                self._store(key, entry)
+            future.set_result(entry)
+            return entry
+        finally:
+            self._loading.pop(key, None)
+
+    async def _load_own(self, key: ChainKey) -> Optional[ChainEntry]:
+        """A handshake for this caller alone; concurrent shared loads of `key` are left alone."""
+        try:
+            entry = await self.loader(*key)
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        if entry:
+            self._store(key, entry)
+        return entry
+
+    def _store(self, key: ChainKey, entry: ChainEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List
+from urllib.parse import urlparse
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Breaker for one endpoint, over a rolling window of `window` seconds kept as
+    `buckets` fixed slices (bounded memory whatever the traffic).
+
+    - closed: calls go through. Once the window holds at least `min_calls` and the share
+      of failed calls (errors, or slower than `slow_call` seconds) reaches `failure_rate`,
+      it opens.
+    - open: calls are refused at once for `open_for` seconds.
+    - half_open: up to `probes` calls go through; if they all succeed the breaker closes
+      with an empty window, the first failure opens it again.
+
+    Thread-safe: callers are executor threads.
+    """
+
+    def __init__(self, window: float = 60, buckets: int = 10, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call: float = 2.0, open_for: float = 30, probes: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.bucket_span = window / buckets
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_for = open_for
+        self.probes = probes
+        self.clock = clock
+        self._lock = threading.Lock()
+        # slice index -> [calls, failures]
+        self._buckets: "OrderedDict[int, List[int]]" = OrderedDict()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probes_passed = 0
+        self._stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(self.clock())
+
+    def _current_state(self, now: float) -> str:
+        # Caller holds self._lock
+        if self._state == OPEN and now - self._opened_at >= self.open_for:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probes_passed = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. Every allowed call must be followed by record()."""
+        with self._lock:
+            state = self._current_state(self.clock())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes_in_flight + self._probes_passed < self.probes:
+                self._probes_in_flight += 1
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def release(self):
+        """An allowed call that never reached the endpoint: frees its half-open probe slot, counts nothing."""
+        with self._lock:
+            if self._current_state(self.clock()) == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record(self, ok: bool, duration: float):
+        """Outcome of an allowed call; a call slower than `slow_call` counts as a failure."""
+        failed = not ok or duration > self.slow_call
+        with self._lock:
+            now = self.clock()
+            self._stats["calls"] += 1
+            self._stats["failures"] += failed
+            state = self._current_state(now)
+            if state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed:
+                    self._open(now)
+                else:
+                    self._probes_passed += 1
+                    if self._probes_passed >= self.probes:
+                        self._state = CLOSED
+                        self._buckets.clear()
+                return
+            if state == OPEN:
+                # A call let through before the breaker opened; nothing left to decide
+                return
+
+            slot = int(now // self.bucket_span)
+            bucket = self._buckets.get(slot)
+            if bucket is None:
+                bucket = self._buckets[slot] = [0, 0]
+            bucket[0] += 1
+            bucket[1] += failed
+            calls, failures = self._window_totals(slot)
+            if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                self._open(now)
+
+    def _window_totals(self, slot: int):
+        # Caller holds self._lock; drops slices that fell out of the window
+        oldest = slot - int(round(self.window / self.bucket_span)) + 1
+        while self._buckets and next(iter(self._buckets)) < oldest:
+            self._buckets.popitem(last=False)
+        calls = sum(b[0] for b in self._buckets.values())
+        failures = sum(b[1] for b in self._buckets.values())
+        return calls, failures
+
+    def _open(self, now: float):
+        # Caller holds self._lock
+        self._state = OPEN
+        self._opened_at = now
+        self._buckets.clear()
+        self._stats["opened"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = self.clock()
+            state = self._current_state(now)
+            calls, failures = self._window_totals(int(now // self.bucket_span))
+            stats = dict(self._stats, state=state, window_calls=calls, window_failures=failures)
+            if state == OPEN:
+                stats["retry_in_s"] = round(self.open_for - (now - self._opened_at), 1)
+            return stats
+
+
+class BreakerRegistry:
+    """
+    One CircuitBreaker per endpoint (scheme://host:port), created on first use with the
+    shared settings. Kept for the `max_endpoints` most recently used endpoints.
+    """
+
+    def __init__(self, max_endpoints: int = 256, **breaker_kwargs):
+        self.max_endpoints = max_endpoints
+        self.breaker_kwargs = breaker_kwargs
+        self._breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        parsed = urlparse(url)
+        try:
+            port = parsed.port
+        except ValueError:
+            # Out-of-range port; requests rejects the URL itself, the breaker just needs a key
+            port = None
+        port = port or (443 if parsed.scheme == "https" else 80)
+        return f"{parsed.scheme}://{parsed.hostname}:{port}"
+
+    def get(self, url: str) -> CircuitBreaker:
+        key = self.endpoint(url)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(**self.breaker_kwargs)
+                if len(self._breakers) > self.max_endpoints:
+                    self._breakers.popitem(last=False)
+            self._breakers.move_to_end(key)
+            return breaker
+
+    def state(self, url: str) -> str:
+        """State of the endpoint's breaker without creating one (never-called endpoints are closed)."""
+        with self._lock:
+            breaker = self._breakers.get(self.endpoint(url))
+        return breaker.state if breaker is not None else CLOSED
+
+    def states(self, urls: List[str]) -> Dict[str, str]:
+        return {self.endpoint(url): self.state(url) for url in urls}
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return {key: breaker.stats() for key, breaker in breakers}
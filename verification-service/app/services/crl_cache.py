@@ -0,0 +1,297 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterator, List, Optional
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+from app.core.config import settings
+from app.services.http_client import HTTPClient, http_client as shared_http_client
+
+logger = logging.getLogger(__name__)
+
+
+class CRLEntry:
+    """Parsed CRL reduced to what a revocation check needs: a set of revoked serials."""
+
+    __slots__ = ("url", "revoked_serials", "next_update", "etag", "last_modified", "fetched_at", "expires_at")
+
+    def __init__(self, url: str, revoked_serials: FrozenSet[int], next_update: Optional[float],
+                 etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.url = url
+        self.revoked_serials = revoked_serials
+        self.next_update = next_update
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.expires_at = 0.0
+        self.refresh_expiry(fetched_at)
+
+    def refresh_expiry(self, now: float):
+        # Trust the CRL's own nextUpdate; past it (or without one) revalidate at a bounded interval
+        if self.next_update and self.next_update > now:
+            self.expires_at = self.next_update
+        else:
+            self.expires_at = now + settings.CRL_MIN_REFRESH_INTERVAL
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def is_usable(self, now: float, max_staleness: float) -> bool:
+        """Whether a stale entry may still stand in when a refresh fails."""
+        return now < (self.next_update or self.fetched_at) + max_staleness
+
+    def is_revoked(self, serial_number: int) -> bool:
+        return serial_number in self.revoked_serials
+
+
+class CRLCache:
+    """
+    Process-wide CRL cache keyed by distribution-point URL.
+
+    - Entries stay valid until the CRL's nextUpdate, then are revalidated with
+      If-None-Match / If-Modified-Since so an unchanged CRL costs a 304, not a download.
+    - Memory is bounded LRU-style by entry count and by total number of indexed serials.
+    - With `disk_dir` set, raw DER plus validators are persisted and reloaded after a restart.
+    - If a refresh fails, the stale entry is used until `max_staleness` seconds past its
+      nextUpdate; after that the CRL is unavailable (None).
+    Thread-safe: revocation checks run on the verification executor.
+    """
+
+    def __init__(self, max_entries: int = 64, max_serials: int = 2_000_000, disk_dir: Optional[str] = None,
+                 http_client: Optional[HTTPClient] = None, max_staleness: float = 86400):
+        self.http = http_client or shared_http_client
+        self.max_entries = max_entries
+        self.max_serials = max_serials
+        self.max_staleness = max_staleness
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._entries: "OrderedDict[str, CRLEntry]" = OrderedDict()
+        self._serial_count = 0
+        self._lock = threading.Lock()
+        # One download per URL at a time; other threads wait and reuse the result.
+        # url -> [lock, threads holding or waiting for it]; dropped when the last one leaves
+        self._url_locks: Dict[str, List] = {}
+        self._stats = {"hits": 0, "misses": 0, "revalidated": 0, "downloads": 0, "disk_loads": 0, "errors": 0,
+                       "stale_served": 0, "lock_timeouts": 0}
+
+        if self.disk_dir:
+            try:
+                self.disk_dir.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"CRL disk cache disabled, cannot create {self.disk_dir}: {e}")
+                self.disk_dir = None
+
+    def get(self, url: str, timeout: float = 5) -> Optional[CRLEntry]:
+        """
+        Return a fresh CRL entry for `url`, fetching or revalidating as needed, all within
+        `timeout` seconds (including any wait for another thread's download). A stale entry
+        if that fails, None if there is no usable one.
+        """
+        entry = self._lookup(url)
+        if entry and entry.is_fresh(time.time()):
+            self._count("hits")
+            return entry
+
+        give_up_at = time.monotonic() + timeout
+        with self._url_lock(url, timeout) as acquired:
+            if not acquired:
+                self._count("lock_timeouts")
+                return self._stale(entry)
+
+            # Another thread may have refreshed it while we waited
+            entry = self._lookup(url)
+            now = time.time()
+            if entry and entry.is_fresh(now):
+                self._count("hits")
+                return entry
+
+            self._count("misses")
+            if entry is None:
+                entry = self._load_from_disk(url)
+                if entry and entry.is_fresh(now):
+                    self._store(entry)
+                    return entry
+
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                return self._stale(entry)
+            try:
+                return self._fetch(url, entry, remaining)
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"CRL fetch failed for {url}: {e}")
+                return self._stale(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), serials=self._serial_count)
+
+    def _fetch(self, url: str, previous: Optional[CRLEntry], timeout: float) -> Optional[CRLEntry]:
+        headers = {}
+        if previous:
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+
+        resp = self.http.get(url, headers=headers, timeout=timeout, breaker=True)
+        now = time.time()
+
+        if resp.status_code == 304 and previous:
+            self._count("revalidated")
+            previous.fetched_at = now
+            previous.refresh_expiry(now)
+            self._store(previous)
+            self._save_meta(previous)
+            return previous
+
+        if resp.status_code != 200:
+            raise requests.HTTPError(f"HTTP {resp.status_code}")
+
+        self._count("downloads")
+        entry = self._parse(url, resp.content, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), now)
+        self._store(entry)
+        self._save_to_disk(entry, resp.content)
+        return entry
+
+    @staticmethod
+    def _parse(url: str, data: bytes, etag: Optional[str], last_modified: Optional[str], fetched_at: float) -> CRLEntry:
+        if data.lstrip().startswith(b"-----BEGIN"):
+            crl = x509.load_pem_x509_crl(data, default_backend())
+        else:
+            crl = x509.load_der_x509_crl(data, default_backend())
+
+        next_update = getattr(crl, "next_update_utc", None)
+        if next_update is None and crl.next_update is not None:
+            next_update = crl.next_update.replace(tzinfo=datetime.timezone.utc)
+
+        return CRLEntry(
+            url=url,
+            revoked_serials=frozenset(revoked.serial_number for revoked in crl),
+            next_update=next_update.timestamp() if next_update else None,
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=fetched_at,
+        )
+
+    def _stale(self, entry: Optional[CRLEntry]) -> Optional[CRLEntry]:
+        # A stale CRL still lists everything revoked up to its issue time, but not forever
+        if entry is None or not entry.is_usable(time.time(), self.max_staleness):
+            return None
+        self._count("stale_served")
+        return entry
+
+    def _lookup(self, url: str) -> Optional[CRLEntry]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                self._entries.move_to_end(url)
+            return entry
+
+    def _store(self, entry: CRLEntry):
+        with self._lock:
+            old = self._entries.pop(entry.url, None)
+            if old:
+                self._serial_count -= len(old.revoked_serials)
+            self._entries[entry.url] = entry
+            self._serial_count += len(entry.revoked_serials)
+
+            # Evict least recently used, but never the entry we just stored
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._serial_count > self.max_serials
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._serial_count -= len(evicted.revoked_serials)
+
+    @contextmanager
+    def _url_lock(self, url: str, timeout: float) -> Iterator[bool]:
+        """Hold `url`'s download lock; yields False if it didn't come free within `timeout` seconds."""
+        with self._lock:
+            slot = self._url_locks.get(url)
+            if slot is None:
+                slot = self._url_locks[url] = [threading.Lock(), 0]
+            slot[1] += 1
+        acquired = slot[0].acquire(timeout=max(0.0, timeout))
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                slot[0].release()
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._url_locks[url]
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    # --- Disk tier -------------------------------------------------------
+
+    def _disk_paths(self, url: str):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.disk_dir / f"{digest}.crl", self.disk_dir / f"{digest}.json"
+
+    def _save_to_disk(self, entry: CRLEntry, data: bytes):
+        if not self.disk_dir:
+            return
+        crl_path, _ = self._disk_paths(entry.url)
+        try:
+            tmp_path = crl_path.with_suffix(".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, crl_path)
+            self._save_meta(entry)
+        except OSError as e:
+            logger.warning(f"Could not persist CRL for {entry.url}: {e}")
+
+    def _save_meta(self, entry: CRLEntry):
+        if not self.disk_dir:
+            return
+        _, meta_path = self._disk_paths(entry.url)
+        try:
+            meta = {
+                "url": entry.url,
+                "etag": entry.etag,
+                "last_modified": entry.last_modified,
+                "fetched_at": entry.fetched_at,
+            }
+            tmp_path = meta_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp_path, meta_path)
+        except OSError as e:
+            logger.warning(f"Could not persist CRL metadata for {entry.url}: {e}")
+
+    def _load_from_disk(self, url: str) -> Optional[CRLEntry]:
+        if not self.disk_dir:
+            return None
+        crl_path, meta_path = self._disk_paths(url)
+        try:
+            if not crl_path.exists() or not meta_path.exists():
+                return None
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta.get("url") != url:
+                return None
+            entry = self._parse(url, crl_path.read_bytes(), meta.get("etag"), meta.get("last_modified"), meta.get("fetched_at", 0))
+            self._count("disk_loads")
+            return entry
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable on-disk CRL for {url}: {e}")
+            return None
+
+
+# Global instance
+crl_cache = CRLCache(
+    max_entries=settings.CRL_CACHE_MAX_ENTRIES,
+    max_serials=settings.CRL_CACHE_MAX_SERIALS,
+    disk_dir=settings.CRL_CACHE_DIR,
+    max_staleness=settings.CRL_MAX_STALENESS,
+)
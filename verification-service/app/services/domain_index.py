@@ -0,0 +1,75 @@
+from typing import Iterable, Iterator
+
+# Marks "a whitelisted domain ends at this node". Labels are always str, so this never collides.
+_END = object()
+
+
+class DomainIndex:
+    """
+    Immutable reversed-label trie over the whitelist ("podatki.gov.pl" is stored as pl -> gov -> podatki).
+
+    A lookup walks the hostname's labels right to left once, so checking every parent
+    suffix costs one dict probe per label and no string joins, and it stops at the first
+    label that leads nowhere. A set of domains would need a slice and a hash per parent
+    suffix: on par for short hostnames, but 2-4x slower on deep or crafted ones (see
+    benchmarks/bench_domain_index.py). Build a new index on refresh and swap the reference;
+    never mutate one that is in use.
+
+    Matching rules (same as the original set-based check):
+      - the full hostname is whitelisted, or
+      - it is "www." + a whitelisted domain, or
+      - any parent suffix of at least two labels (TLD+1, e.g. "gov.pl") is whitelisted,
+        or is "www." + a whitelisted domain (which adds something only for single-label
+        entries: "a.www.intranet" matches "intranet", "a.intranet" doesn't).
+    """
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, domains: Iterable[str]):
+        root: dict = {}
+        size = 0
+        for domain in domains:
+            node = root
+            for label in reversed(domain.split(".")):
+                node = node.setdefault(label, {})
+            if _END not in node:
+                node[_END] = True
+                size += 1
+        self._root = root
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[str]:
+        stack = [(self._root, [])]
+        while stack:
+            node, path = stack.pop()
+            for label, child in node.items():
+                if label is _END:
+                    yield ".".join(reversed(path))
+                else:
+                    stack.append((child, path + [label]))
+
+    def contains(self, domain: str) -> bool:
+        """Exact membership, no parent matching."""
+        node = self._root
+        for label in reversed(domain.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+        return _END in node
+
+    def matches(self, hostname: str) -> bool:
+        labels = hostname.split(".")
+        count = len(labels)
+        node = self._root
+        depth = 0
+        for label in reversed(labels):
+            node = node.get(label)
+            if node is None:
+                return False
+            depth += 1
+            if _END in node and (depth > 1 or depth == count or labels[-depth - 1] == "www"):
+                return True
+        return False
@@ -0,0 +1,342 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import DecodeError, EmptyPoolError, ProtocolError, ReadTimeoutError
+from urllib3.util import Timeout as PoolTimeout
+
+from app.core.config import settings
+from app.services.circuit_breaker import BreakerRegistry
+
+Timeout = Union[None, float, Tuple[float, float]]
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """The endpoint's circuit breaker is open; the request was not sent."""
+
+
+class PoolTimeoutError(requests.ConnectTimeout):
+    """No pooled connection to the host became free within the connect timeout; the request was not sent."""
+
+
+class DNSCache:
+    """
+    Thread-safe host -> address cache with a fixed TTL. The OCSP responders, CRL hosts and
+    the whitelist API are a handful of names looked up over and over; a new connection to
+    them (after an idle one was dropped) then costs no resolver round-trip.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def resolve(self, host: str, port: int) -> str:
+        """An address for `host` (unchanged if it already is one); raises socket.gaierror like the resolver."""
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[1] > now:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return cached[0]
+            self._stats["misses"] += 1
+        address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4][0]
+        with self._lock:
+            self._entries[key] = (address, now + self.ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return address
+
+    def forget(self, host: str, port: int):
+        """Drop a cached address that failed to connect, so the next attempt resolves again."""
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+def _pool_classes(client: "HTTPClient") -> Dict[str, type]:
+    """
+    urllib3 pool classes whose connections resolve through `client`'s DNS cache and count
+    new sockets, and whose wait for a free connection is bounded (see BoundedWaitMixin).
+    """
+
+    class CachedDNSMixin:
+        def _new_conn(self):
+            # Only the address we dial changes; TLS SNI and certificate checks still use self.host
+            host = self._dns_host
+            self._dns_host = client.dns.resolve(host, self.port)
+            try:
+                sock = super()._new_conn()
+            except Exception:
+                client.dns.forget(host, self.port)
+                raise
+            finally:
+                self._dns_host = host
+            client._count("connections_opened")
+            return sock
+
+    class CachedHTTPConnection(CachedDNSMixin, HTTPConnection):
+        pass
+
+    class CachedHTTPSConnection(CachedDNSMixin, HTTPSConnection):
+        pass
+
+    class BoundedWaitMixin:
+        def urlopen(self, method, url, *args, pool_timeout=None, **kwargs):
+            # requests never passes pool_timeout, so a full blocking pool would wait forever;
+            # wait at most the connect timeout, which callers derive from their budget
+            if pool_timeout is None:
+                timeout = kwargs.get("timeout")
+                if isinstance(timeout, PoolTimeout) and isinstance(timeout.connect_timeout, (int, float)):
+                    pool_timeout = timeout.connect_timeout
+            return super().urlopen(method, url, *args, pool_timeout=pool_timeout, **kwargs)
+
+        def _get_conn(self, timeout=None):
+            started = time.monotonic()
+            try:
+                return super()._get_conn(timeout=timeout)
+            finally:
+                client._local.pool_wait += time.monotonic() - started
+
+    class CachedHTTPConnectionPool(BoundedWaitMixin, HTTPConnectionPool):
+        ConnectionCls = CachedHTTPConnection
+
+    class CachedHTTPSConnectionPool(BoundedWaitMixin, HTTPSConnectionPool):
+        ConnectionCls = CachedHTTPSConnection
+
+    return {"http": CachedHTTPConnectionPool, "https": CachedHTTPSConnectionPool}
+
+
+class _PoolWait(threading.local):
+    pool_wait = 0.0
+
+
+# Body read size when a request has a total budget (a CRL is typically 10 KB - 10 MB)
+_BODY_CHUNK = 64 * 1024
+
+# Raised before anything is sent: the URL is ours to blame, not the endpoint
+_CLIENT_ERRORS = (requests.exceptions.InvalidSchema, requests.exceptions.MissingSchema, requests.exceptions.InvalidURL)
+
+
+class HTTPClient:
+    """
+    Shared keep-alive HTTP client for the outbound fetches (OCSP, CRL, AIA caIssuers and the
+    whitelist API). One requests.Session with a pooled adapter: connections to a host are
+    reused instead of paying a TCP + TLS handshake per request.
+
+    - At most `per_host` connections per host. Pools block, so a burst of revocation checks
+      for one CA waits for a free connection rather than opening more sockets. The wait is
+      bounded by the request's connect timeout; past it the request fails with
+      PoolTimeoutError without being sent.
+    - Pools for up to `max_hosts` hosts are kept (least recently used ones are closed).
+    - Addresses are cached for `dns_ttl` seconds (see DNSCache).
+    - `timeout` is (connect, read) in seconds, read being per socket read as in requests.
+      A single number is the caller's budget for the whole request: the connect part is
+      capped at connect_timeout, the headers must arrive within what is left, and the body
+      is read in chunks, each socket read bounded by the remainder, failing with
+      requests.ReadTimeout once it is spent (a trickling CRL can't outlast the deadline).
+    - Requests made with breaker=True go through a per-endpoint circuit breaker (see
+      circuit_breaker.py): errors, 5xx answers and slow calls count as failures, and while
+      the breaker is open they fail at once with CircuitOpenError. A call is slow by its time
+      to the response headers, so a large CRL on a fast responder isn't; time spent waiting
+      for a pooled connection doesn't count either. Neither a pool timeout nor
+      an unusable URL (InvalidSchema, InvalidURL, ...) counts as a failure of the endpoint.
+
+    Callers run on worker threads (the verification executor, the whitelist refresh), so
+    the interface stays blocking; requests.Session is safe to share between them.
+    Errors are the usual requests exceptions.
+    """
+
+    def __init__(self, max_hosts: int = 32, per_host: int = 8, connect_timeout: float = 3,
+                 read_timeout: float = 10, dns_ttl: float = 300, breakers: BreakerRegistry = None):
+        self.max_hosts = max_hosts
+        self.per_host = per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.dns = DNSCache(ttl=dns_ttl)
+        self.breakers = breakers or BreakerRegistry()
+        self._lock = threading.Lock()
+        # Per calling thread: seconds the current request spent waiting for a pooled connection
+        self._local = _PoolWait()
+        self._stats = {"requests": 0, "errors": 0, "connections_opened": 0, "short_circuited": 0,
+                       "pool_timeouts": 0}
+
+        self._adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=per_host, pool_block=True)
+        self._adapter.poolmanager.pool_classes_by_scheme = _pool_classes(self)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = f"{settings.PROJECT_NAME} verification-service"
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _timeout(self, timeout: Timeout) -> Union[Tuple[float, float], PoolTimeout]:
+        if timeout is None:
+            return self.connect_timeout, self.read_timeout
+        if isinstance(timeout, tuple):
+            return timeout
+        # urllib3 caps the wait for the headers at what the connect left of `total`
+        return PoolTimeout(total=timeout, connect=min(self.connect_timeout, timeout), read=timeout)
+
+    @staticmethod
+    def _read_body(response: requests.Response, deadline: Optional[float]):
+        """
+        Read a streamed response's body into response.content. With a `deadline`
+        (time.monotonic()), every socket read gets only what is left of it.
+        """
+        if deadline is None:
+            response.content
+            return
+        # The connection's socket; urllib3 sets its timeout again before the next request on it
+        connection = getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        # read1 returns what has arrived instead of waiting for a full chunk, so a trickling
+        # body meets the socket timeout; urllib3 < 2.3 has only read, checked between chunks
+        read = getattr(response.raw, "read1", response.raw.read)
+        chunks = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.exceptions.ReadTimeout(f"Body of {response.url} not read within the request budget")
+            if sock is not None:
+                sock.settimeout(remaining)
+            # Same translation as requests' iter_content
+            try:
+                chunk = read(_BODY_CHUNK, decode_content=True)
+            except ReadTimeoutError as e:
+                raise requests.exceptions.ReadTimeout(e)
+            except ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e)
+            except DecodeError as e:
+                raise requests.exceptions.ContentDecodingError(e)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        response._content = b"".join(chunks)
+        response._content_consumed = True
+        response.raw.release_conn()
+
+    def request(self, method: str, url: str, timeout: Timeout = None, breaker: bool = False,
+                **kwargs) -> requests.Response:
+        circuit = self.breakers.get(url) if breaker else None
+        if circuit is not None and not circuit.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(f"Circuit open for {self.breakers.endpoint(url)}")
+        self._count("requests")
+        self._local.pool_wait = 0.0
+        started = time.monotonic()
+        first_byte = None
+        ok = False
+        stream = kwargs.pop("stream", False)
+        # A scalar timeout is a total budget, enforced on the body too (see _read_body)
+        deadline = started + timeout if isinstance(timeout, (int, float)) else None
+        try:
+            response = self.session.request(method, url, timeout=self._timeout(timeout), stream=True, **kwargs)
+            first_byte = time.monotonic() - started
+            if not stream:
+                # What requests does for a non-streamed response: read it all, release the connection
+                try:
+                    self._read_body(response, deadline)
+                except Exception:
+                    response.close()
+                    raise
+            ok = response.status_code < 500
+            return response
+        except EmptyPoolError as e:
+            self._count("pool_timeouts")
+            if circuit is not None:
+                circuit.release()
+                circuit = None
+            raise PoolTimeoutError(f"No free connection for {url}") from e
+        except _CLIENT_ERRORS:
+            self._count("errors")
+            if circuit is not None:
+                circuit.release()
+                circuit = None
+            raise
+        except requests.RequestException:
+            self._count("errors")
+            raise
+        finally:
+            if circuit is not None:
+                # Latency to the headers (the whole call if none came), from when the connection
+                # was acquired rather than from when we queued for it
+                elapsed = first_byte if first_byte is not None else time.monotonic() - started
+                circuit.record(ok, elapsed - self._local.pool_wait)
+
+    def get(self, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        return self.request("GET", url, timeout=timeout, **kwargs)
+
+    def post(self, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        return self.request("POST", url, timeout=timeout, **kwargs)
+
+    def breaker_states(self, urls: List[str]) -> Dict[str, str]:
+        """Breaker state per endpoint of `urls` (closed for endpoints never called with breaker=True)."""
+        return self.breakers.states(urls)
+
+    def close(self):
+        self.session.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        requests_made = stats["requests"]
+        # Share of requests that went out on an already open connection
+        stats["reuse_rate"] = (
+            round(max(0, requests_made - stats["connections_opened"]) / requests_made, 3) if requests_made else None
+        )
+        stats["dns"] = self.dns.stats()
+        stats["pools"] = self._pool_stats()
+        stats["breakers"] = self.breakers.stats()
+        return stats
+
+    def _pool_stats(self) -> List[dict]:
+        pools = self._adapter.poolmanager.pools
+        result = []
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            result.append({
+                "host": f"{key.key_scheme}://{key.key_host}:{key.key_port or ''}".rstrip(":"),
+                "requests": pool.num_requests,
+                "connections": pool.num_connections,
+                # The pool's queue holds a slot (idle connection or placeholder) per connection not in use
+                "in_use": self.per_host - pool.pool.qsize() if pool.pool is not None else 0,
+                "max": self.per_host,
+            })
+        return result
+
+
+# Global instance
+http_client = HTTPClient(
+    max_hosts=settings.HTTP_POOL_MAX_HOSTS,
+    per_host=settings.HTTP_POOL_PER_HOST,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    read_timeout=settings.HTTP_READ_TIMEOUT,
+    dns_ttl=settings.HTTP_DNS_TTL,
+    breakers=BreakerRegistry(
+        window=settings.BREAKER_WINDOW,
+        min_calls=settings.BREAKER_MIN_CALLS,
+        failure_rate=settings.BREAKER_FAILURE_RATE,
+        slow_call=settings.BREAKER_SLOW_CALL,
+        open_for=settings.BREAKER_OPEN_FOR,
+        probes=settings.BREAKER_HALF_OPEN_PROBES,
+    ),
+)
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives.serialization import pkcs7
+from cryptography.x509.oid import ExtensionOID, AuthorityInformationAccessOID
+
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.services.http_client import HTTPClient, http_client as shared_http_client
+
+logger = logging.getLogger(__name__)
+
+
+def subject_key_id(cert: x509.Certificate) -> Optional[str]:
+    try:
+        return cert.extensions.get_extension_for_oid(ExtensionOID.SUBJECT_KEY_IDENTIFIER).value.digest.hex()
+    except x509.ExtensionNotFound:
+        return None
+
+
+def authority_key_id(cert: x509.Certificate) -> Optional[str]:
+    try:
+        key_id = cert.extensions.get_extension_for_oid(ExtensionOID.AUTHORITY_KEY_IDENTIFIER).value.key_identifier
+        return key_id.hex() if key_id else None
+    except x509.ExtensionNotFound:
+        return None
+
+
+def is_issued_by(cert: x509.Certificate, issuer: x509.Certificate) -> bool:
+    if cert.issuer != issuer.subject:
+        return False
+    try:
+        cert.verify_directly_issued_by(issuer)
+        return True
+    except Exception:
+        return False
+
+
+class IntermediateCache:
+    """
+    Long-lived cache of CA certificates keyed by subject key identifier, filled from
+    server-sent chains and by chasing the AIA caIssuers URL of certificates whose issuer
+    was not sent. Intermediates rotate over years, so entries are only evicted LRU-style.
+    Failed caIssuers URLs are remembered for `failure_ttl` seconds (the `max_failed` most
+    recent ones) so an outage doesn't cost a timeout per verify.
+    """
+
+    def __init__(self, max_entries: int = 512, failure_ttl: float = 300, max_failed: int = 256,
+                 http_client: Optional[HTTPClient] = None):
+        self.http = http_client or shared_http_client
+        self.max_entries = max_entries
+        self.failure_ttl = failure_ttl
+        self.max_failed = max_failed
+        self._by_key_id: "OrderedDict[str, x509.Certificate]" = OrderedDict()
+        # url -> when it failed, oldest first
+        self._failed_urls: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "fetches": 0, "fetch_errors": 0, "learned": 0}
+
+    def remember(self, certs: List[x509.Certificate]):
+        """Index CA certificates seen in a server-sent chain."""
+        for cert in certs:
+            key_id = subject_key_id(cert)
+            if key_id:
+                with self._lock:
+                    if key_id not in self._by_key_id:
+                        self._stats["learned"] += 1
+                    self._store(key_id, cert)
+
+    def find_issuer(self, cert: x509.Certificate, timeout: float = 3) -> Optional[x509.Certificate]:
+        """
+        Return the issuer of `cert` from the cache, or fetch it via AIA caIssuers, trying
+        the URLs in turn within `timeout` seconds in total.
+        """
+        key_id = authority_key_id(cert)
+        if key_id:
+            with self._lock:
+                issuer = self._by_key_id.get(key_id)
+                if issuer is not None:
+                    self._by_key_id.move_to_end(key_id)
+                    self._stats["hits"] += 1
+            if issuer is not None and is_issued_by(cert, issuer):
+                return issuer
+
+        deadline = Deadline(timeout)
+        for url in self._ca_issuer_urls(cert):
+            if deadline.expired:
+                break
+            for candidate in self._fetch(url, deadline.remaining()):
+                if is_issued_by(cert, candidate):
+                    candidate_id = subject_key_id(candidate) or key_id
+                    if candidate_id:
+                        with self._lock:
+                            self._store(candidate_id, candidate)
+                    return candidate
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._by_key_id))
+
+    @staticmethod
+    def _ca_issuer_urls(cert: x509.Certificate) -> List[str]:
+        try:
+            aia = cert.extensions.get_extension_for_oid(ExtensionOID.AUTHORITY_INFORMATION_ACCESS)
+        except x509.ExtensionNotFound:
+            return []
+        return [
+            desc.access_location.value for desc in aia.value
+            if desc.access_method == AuthorityInformationAccessOID.CA_ISSUERS
+            and isinstance(desc.access_location, x509.UniformResourceIdentifier)
+        ]
+
+    def _fetch(self, url: str, timeout: float) -> List[x509.Certificate]:
+        with self._lock:
+            self._forget_failures(time.monotonic())
+            if url in self._failed_urls:
+                return []
+            self._stats["fetches"] += 1
+        try:
+            resp = self.http.get(url, timeout=timeout)
+            resp.raise_for_status()
+            return self._parse(resp.content)
+        except Exception as e:
+            logger.warning(f"AIA caIssuers fetch failed for {url}: {e}")
+            with self._lock:
+                self._stats["fetch_errors"] += 1
+                self._failed_urls[url] = time.monotonic()
+                self._failed_urls.move_to_end(url)
+                while len(self._failed_urls) > self.max_failed:
+                    self._failed_urls.popitem(last=False)
+            return []
+
+    def _forget_failures(self, now: float):
+        # Caller holds self._lock; entries are in failure order, so expired ones are at the front
+        while self._failed_urls and now - next(iter(self._failed_urls.values())) >= self.failure_ttl:
+            self._failed_urls.popitem(last=False)
+
+    @staticmethod
+    def _parse(data: bytes) -> List[x509.Certificate]:
+        # caIssuers may serve a single DER/PEM certificate or a PKCS#7 "certs-only" bundle (.p7c)
+        if data.lstrip().startswith(b"-----BEGIN"):
+            if b"PKCS7" in data:
+                return pkcs7.load_pem_pkcs7_certificates(data)
+            return x509.load_pem_x509_certificates(data)
+        try:
+            return [x509.load_der_x509_certificate(data)]
+        except ValueError:
+            return pkcs7.load_der_pkcs7_certificates(data)
+
+    def _store(self, key_id: str, cert: x509.Certificate):
+        # Caller holds self._lock
+        self._by_key_id[key_id] = cert
+        self._by_key_id.move_to_end(key_id)
+        while len(self._by_key_id) > self.max_entries:
+            self._by_key_id.popitem(last=False)
+
+
+# Global instance
+intermediate_cache = IntermediateCache(max_entries=settings.INTERMEDIATE_CACHE_MAX_ENTRIES)
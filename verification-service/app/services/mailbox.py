@@ -0,0 +1,84 @@
+"""
+Short-lived per-channel mailboxes for messages published before anyone was listening.
+
+A sender puts the message in the channel's mailbox, then publishes it; a socket that
+connects later reads the mailbox. Entries are never removed on read (every socket on
+the channel should see them); they disappear after the TTL, and each mailbox keeps only
+its newest `max_messages`.
+
+  - RedisMailbox  a capped list per channel with a TTL, visible to every worker
+  - MemoryMailbox the same inside one process (single worker, tests)
+"""
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List
+
+
+class Mailbox(ABC):
+    @abstractmethod
+    async def put(self, channel: str, message: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def read(self, channel: str) -> List[str]:
+        """All live messages for `channel`, oldest first."""
+        raise NotImplementedError
+
+
+class RedisMailbox(Mailbox):
+    def __init__(self, client, ttl: int, max_messages: int):
+        self.redis = client
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    @staticmethod
+    def _key(channel: str) -> str:
+        return f"mailbox:{channel}"
+
+    async def put(self, channel: str, message: str) -> None:
+        key = self._key(channel)
+        pipe = self.redis.pipeline()
+        pipe.rpush(key, message)
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.ttl)
+        await pipe.execute()
+
+    async def read(self, channel: str) -> List[str]:
+        messages = await self.redis.lrange(self._key(channel), 0, -1)
+        return [m.decode() if isinstance(m, bytes) else m for m in messages]
+
+
+class MemoryMailbox(Mailbox):
+    """Channels ordered by last write; since the TTL is fixed, expired ones are always at the front."""
+
+    def __init__(self, ttl: int, max_messages: int, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._clock = clock
+        self._boxes: "OrderedDict[str, tuple]" = OrderedDict()  # channel -> (expires_at, [messages])
+
+    def _prune(self) -> None:
+        now = self._clock()
+        while self._boxes:
+            channel, (expires_at, _) = next(iter(self._boxes.items()))
+            if expires_at > now:
+                break
+            del self._boxes[channel]
+
+    async def put(self, channel: str, message: str) -> None:
+        self._prune()
+        _, messages = self._boxes.pop(channel, (None, []))
+        messages = (messages + [message])[-self.max_messages:]
+        self._boxes[channel] = (self._clock() + self.ttl, messages)
+
+    async def read(self, channel: str) -> List[str]:
+        self._prune()
+        box = self._boxes.get(channel)
+        return list(box[1]) if box else []
+
+
+def make_mailbox(redis_client, ttl: int, max_messages: int) -> Mailbox:
+    if redis_client is None:
+        return MemoryMailbox(ttl, max_messages)
+    return RedisMailbox(redis_client, ttl, max_messages)
@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OCSPResult:
+    """Outcome of one OCSP lookup: GOOD, REVOKED or UNKNOWN, valid until `expires_at`."""
+
+    __slots__ = ("status", "this_update", "next_update", "expires_at")
+
+    def __init__(self, status: str, this_update: Optional[float], next_update: Optional[float]):
+        self.status = status
+        self.this_update = this_update
+        self.next_update = next_update
+        now = time.time()
+        # Responses without nextUpdate are cached briefly; never past the responder's own validity
+        self.expires_at = next_update if next_update else now + settings.OCSP_DEFAULT_TTL
+        self.expires_at = min(self.expires_at, now + settings.OCSP_MAX_TTL)
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+
+class _Flight:
+    """A lookup in progress; concurrent callers for the same key wait on it instead of querying."""
+
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[OCSPResult] = None
+
+
+class OCSPCache:
+    """
+    OCSP responses keyed by (issuer key hash, serial), reused until the response's nextUpdate.
+    Identical concurrent lookups are single-flighted: one responder round-trip, N answers.
+    Thread-safe: revocation checks run on the verification executor.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], OCSPResult]" = OrderedDict()
+        self._flights: Dict[Tuple[str, int], _Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(cert: x509.Certificate, issuer: x509.Certificate) -> Tuple[str, int]:
+        issuer_key = issuer.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        return hashlib.sha1(issuer_key).hexdigest(), cert.serial_number
+
+    def lookup(self, key: Tuple[str, int], fetch: Callable[[], Optional[OCSPResult]],
+               wait_timeout: float = 10) -> Optional[OCSPResult]:
+        """Return a cached result for `key`, joining an in-flight lookup or calling `fetch` once."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result and result.is_fresh(time.time()):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return result
+
+            flight = self._flights.get(key)
+            if flight:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self._stats["misses"] += 1
+                leader = True
+
+        if not leader:
+            flight.done.wait(wait_timeout)
+            return flight.result
+
+        try:
+            flight.result = fetch()
+        except Exception as e:
+            logger.warning(f"OCSP lookup failed: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                if flight.result is not None:
+                    self._store(key, flight.result)
+            flight.done.set()
+        return flight.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), in_flight=len(self._flights))
+
+    def _store(self, key: Tuple[str, int], result: OCSPResult):
+        # Caller holds self._lock
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Global instance
+ocsp_cache = OCSPCache(max_entries=settings.OCSP_CACHE_MAX_ENTRIES)
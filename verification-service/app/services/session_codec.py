@@ -0,0 +1,211 @@
+"""
+Compact binary encoding for session records stored in Redis.
+
+A record is one string value instead of a hash of JSON fields. Status is a one-byte code at
+a fixed offset, so the Lua transitions flip it in place with GETRANGE/SETRANGE. Proximity
+is a packed tail after `base_length`, so it can be replaced without decoding the rest. The
+verification result is not part of the record; it lives in its own key (compact JSON),
+written once when the session is consumed.
+
+Layout (little-endian), version 1:
+
+    header     u8 version | u8 status | f64 created_at | u8 flags | u16 base_length
+    url        u16 length | UTF-8
+    ip         u8 length  | packed 4/16-byte address (flags & IP_PACKED) or UTF-8
+    ua         u16 length | UTF-8
+    proximity  optional, from base_length to the end:
+               u8 proximity flags | ble_uuid (16 bytes if UUID_PACKED, else u8 length | UTF-8)
+               | u8 length | timestamp UTF-8
+
+Field lengths are bounded before they get here (URL and User-Agent in /session/init,
+BLE fields by the BluetoothData model); encoding raises ValueError rather than truncate.
+"""
+import json
+import socket
+import struct
+from typing import Optional
+
+VERSION = 1
+HEADER = struct.Struct("<BBdBH")  # status is at byte offset 1, base_length at offset 11
+
+# Interned status codes; one byte each so Lua can compare and SETRANGE them
+STATUS_CODES = {"PENDING": 0, "VERIFYING": 1, "CONSUMED": 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+IP_PACKED = 0x1
+
+FOUND = 0x1
+SUPPORTED = 0x2
+CONFIRMED = 0x4
+UUID_PACKED = 0x8
+
+U8 = struct.Struct("<B")
+U16 = struct.Struct("<H")
+
+
+class SessionCodecError(ValueError):
+    """The stored value isn't a session record this version can read."""
+
+
+def status_byte(status: str) -> bytes:
+    return bytes([STATUS_CODES[status]])
+
+
+def status_name(code: bytes) -> str:
+    return STATUS_NAMES[code[0]]
+
+
+def _pack_ip(ip: str) -> Optional[bytes]:
+    # Only pack canonical spellings, so decoding gives back the exact same string
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            packed = socket.inet_pton(family, ip)
+        except OSError:
+            continue
+        return packed if socket.inet_ntop(family, packed) == ip else None
+    return None
+
+
+def _unpack_ip(data: bytes) -> str:
+    return socket.inet_ntop(socket.AF_INET if len(data) == 4 else socket.AF_INET6, data)
+
+
+def _pack_uuid(value: str) -> Optional[bytes]:
+    # Canonical lowercase 8-4-4-4-12 form only, as produced by crypto.randomUUID()
+    if len(value) != 36 or value.count("-") != 4:
+        return None
+    try:
+        packed = bytes.fromhex(value.replace("-", ""))
+    except ValueError:
+        return None
+    return packed if len(packed) == 16 and _unpack_uuid(packed) == value else None
+
+
+def _unpack_uuid(data: bytes) -> str:
+    h = data.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _short(value: Optional[str], limit: int) -> bytes:
+    data = (value or "").encode("utf-8")
+    if len(data) > limit:
+        raise ValueError(f"field too long for the session record ({len(data)} > {limit} bytes)")
+    return data
+
+
+def encode_proximity(proximity: dict) -> bytes:
+    flags = 0
+    if proximity.get("found"):
+        flags |= FOUND
+    if proximity.get("supported"):
+        flags |= SUPPORTED
+    if proximity.get("confirmed"):
+        flags |= CONFIRMED
+
+    ble_uuid = proximity.get("ble_uuid") or ""
+    packed = _pack_uuid(ble_uuid)
+    if packed is not None:
+        flags |= UUID_PACKED
+        uuid_part = packed
+    else:
+        data = _short(ble_uuid, 0xFF)
+        uuid_part = U8.pack(len(data)) + data
+
+    timestamp = _short(proximity.get("timestamp"), 0xFF)
+    return U8.pack(flags) + uuid_part + U8.pack(len(timestamp)) + timestamp
+
+
+def decode_proximity(data: bytes) -> dict:
+    flags = data[0]
+    position = 1
+    if flags & UUID_PACKED:
+        ble_uuid = _unpack_uuid(data[position:position + 16])
+        position += 16
+    else:
+        length = data[position]
+        ble_uuid = data[position + 1:position + 1 + length].decode("utf-8")
+        position += 1 + length
+    length = data[position]
+    timestamp = data[position + 1:position + 1 + length].decode("utf-8")
+    return {
+        "ble_uuid": ble_uuid,
+        "found": bool(flags & FOUND),
+        "timestamp": timestamp,
+        "supported": bool(flags & SUPPORTED),
+        "confirmed": bool(flags & CONFIRMED),
+    }
+
+
+def encode_session(session: dict) -> bytes:
+    flags = 0
+    ip = session.get("ip")
+    ip_data = b""
+    if ip:
+        packed = _pack_ip(ip)
+        if packed is not None:
+            flags |= IP_PACKED
+            ip_data = packed
+        else:
+            ip_data = _short(ip, 0xFF)
+
+    url = _short(session["url"], 0xFFFF)
+    ua = _short(session.get("ua"), 0xFFFF)
+    body = (
+        U16.pack(len(url)) + url
+        + U8.pack(len(ip_data)) + ip_data
+        + U16.pack(len(ua)) + ua
+    )
+    base_length = HEADER.size + len(body)
+    header = HEADER.pack(
+        VERSION, STATUS_CODES[session.get("status", "PENDING")],
+        float(session.get("created_at") or 0), flags, base_length,
+    )
+    record = header + body
+    if session.get("proximity"):
+        record += encode_proximity(session["proximity"])
+    return record
+
+
+def decode_session(record: bytes) -> dict:
+    if len(record) < HEADER.size:
+        raise SessionCodecError("record too short")
+    version, status, created_at, flags, base_length = HEADER.unpack_from(record, 0)
+    if version != VERSION:
+        raise SessionCodecError(f"unsupported session record version {version}")
+
+    position = HEADER.size
+    (length,) = U16.unpack_from(record, position)
+    url = record[position + 2:position + 2 + length].decode("utf-8")
+    position += 2 + length
+
+    length = record[position]
+    ip_data = record[position + 1:position + 1 + length]
+    position += 1 + length
+    if not ip_data:
+        ip = None
+    elif flags & IP_PACKED:
+        ip = _unpack_ip(ip_data)
+    else:
+        ip = ip_data.decode("utf-8")
+
+    (length,) = U16.unpack_from(record, position)
+    ua = record[position + 2:position + 2 + length].decode("utf-8") or None
+
+    session = {
+        "url": url,
+        "created_at": created_at,
+        "status": STATUS_NAMES[status],
+        "ip": ip,
+        "ua": ua,
+    }
+    if len(record) > base_length:
+        session["proximity"] = decode_proximity(record[base_length:])
+    return session
+
+
+def encode_result(result: dict) -> bytes:
+    return json.dumps(result, separators=(",", ":")).encode("utf-8")
+
+
+def decode_result(data: bytes) -> dict:
+    return json.loads(data)
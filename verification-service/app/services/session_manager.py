@@ -1,21 +1,36 @@
+import asyncio
+import logging
 import time
-import json
-import redis
-from typing import Dict, Optional, Literal
+from typing import Optional, Literal, Tuple
 from app.core.config import settings
 from app.core.security import generate_nonce
+from app.services.broker import Broker, make_broker
+from app.services.session_store import SessionStore, make_session_store
+
+logger = logging.getLogger(__name__)
+
+# Session lifecycle: PENDING -> VERIFYING (claimed by one /session/verify) -> CONSUMED.
+# A failed verification releases VERIFYING back to PENDING so the user can rescan.
+# Storage and atomicity are the SessionStore engine's job (Redis or in-process).
+# Leaving VERIFYING is announced on the broker so long-poll / SSE waiters wake at once.
+
+# Statuses a waiting web client keeps waiting on
+WAITING_STATUSES = ("PENDING", "VERIFYING")
 
 class SessionManager:
-    def __init__(self):
-        # Redis connection
-        self.redis = redis.Redis(
-            host=settings.REDIS_HOST, 
-            port=settings.REDIS_PORT, 
-            db=0, 
-            decode_responses=True
-        )
-
-    def create_session(self, url: str, ip: str = None, ua: str = None) -> str:
+    def __init__(self, store: Optional[SessionStore] = None, broker: Optional[Broker] = None):
+        # `is None`, not `or`: an empty MemorySessionStore is falsy (it has __len__)
+        self.store = store if store is not None else make_session_store()
+        # Shared with the rate limiters; None with the in-process store
+        self.redis = self.store.redis
+        # Status-change notifications: Redis pub/sub, or in-process with the memory store
+        self.broker = broker if broker is not None else make_broker(self.redis)
+
+    @staticmethod
+    def _events_channel(nonce: str) -> str:
+        return f"session-events:{nonce}"
+
+    async def create_session(self, url: str, ip: str = None, ua: str = None) -> str:
         nonce = generate_nonce()
         session_data = {
             "url": url,
@@ -23,44 +38,71 @@ class SessionManager:
             "status": "PENDING",
             "ip": ip,
             "ua": ua,
-            # Result stored as JSON string eventually
         }
-        # Use simple hash or just JSON string. JSON string with setex is easier for TTL.
-        self.redis.setex(
-            f"session:{nonce}",
-            settings.SESSION_TTL,
-            json.dumps(session_data)
-        )
+        await self.store.create(nonce, session_data, settings.SESSION_TTL)
         return nonce
 
-    def get_session(self, nonce: str) -> Optional[dict]:
-        data = self.redis.get(f"session:{nonce}")        
-        if not data:
+    async def get_session(self, nonce: str) -> Optional[dict]:
+        session = await self.store.get(nonce)
+        if not session:
             return {"status": "EXPIRED"} # Or None, but logic expects object for status check
-        
-        return json.loads(data)
-    
-    def update_status(self, nonce: str, status: Literal["CONSUMED"], result: Optional[dict] = None) -> None:
-        key = f"session:{nonce}"
-        data = self.redis.get(key)
-        if data:
-            session = json.loads(data)
-            session["status"] = status
-            if result:
-                session["result"] = result
-                
-            # Update and keep remaining TTL or reset?
-            # Usually we keep content but maybe shorten TTL if consumed?
-            # Let's just update content and keep same TTL logic (resetting to full TTL or keeping it alive)
-            # setex resets TTL. Consumed sessions shouldn't live forever but user needs to see result.
-            self.redis.setex(key, settings.SESSION_TTL, json.dumps(session))
-    
-    def update_proximity(self, nonce: str, bluetooth_data: dict) -> None:
-        key = f"session:{nonce}"
-        data = self.redis.get(key)
-        if data:
-            session = json.loads(data)
-            session["proximity"] = bluetooth_data
-            self.redis.setex(key, settings.SESSION_TTL, json.dumps(session))
+
+        return session
+
+    async def claim_session(self, nonce: str) -> Tuple[str, Optional[dict]]:
+        """
+        Atomically move a PENDING session to VERIFYING.
+
+        Returns ("CLAIMED", session) for the single caller that won, otherwise
+        (current_status, None) - "VERIFYING", "CONSUMED" or "EXPIRED". The claimed
+        session carries "speculative" when a verdict was prepared at init.
+        """
+        return await self.store.claim(nonce)
+
+    async def release_session(self, nonce: str) -> bool:
+        """Return a claimed session to PENDING (verification failed before producing a result)."""
+        return await self.store.release(nonce)
+
+    async def update_status(self, nonce: str, status: Literal["CONSUMED"], result: Optional[dict] = None) -> bool:
+        """
+        Store the result and move a claimed session to `status`. Returns False if the
+        session isn't VERIFYING (expired meanwhile). The TTL is reset so the web client
+        still has time to read the result.
+        """
+        finished = await self.store.finish(nonce, status, result, settings.SESSION_TTL)
+        if finished:
+            try:
+                await self.broker.publish(self._events_channel(nonce), status)
+            except Exception as e:
+                # Waiters still see the new status when their timeout re-reads the session
+                logger.warning(f"Failed to publish status change for {nonce}: {e}")
+        return finished
+
+    async def wait_for_update(self, nonce: str, timeout: float) -> dict:
+        """
+        Long-poll: the session as soon as it leaves PENDING/VERIFYING, or as it is after
+        `timeout` seconds. Subscribes before reading, so a change that lands between the
+        read and the wait still wakes it.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        async with self.broker.subscribe(self._events_channel(nonce)) as subscription:
+            while True:
+                session = await self.get_session(nonce)
+                remaining = deadline - loop.time()
+                if session.get("status") not in WAITING_STATUSES or remaining <= 0:
+                    return session
+                await subscription.get(timeout=remaining)
+
+    async def update_proximity(self, nonce: str, bluetooth_data: dict) -> bool:
+        return await self.store.set_proximity(nonce, bluetooth_data, settings.SESSION_TTL)
+
+    async def attach_speculative(self, nonce: str, result: dict) -> None:
+        """Store a URL-only verdict computed ahead of time; the winning claim gets it back."""
+        await self.store.set_speculative(nonce, result, settings.SESSION_TTL)
+
+    async def close(self) -> None:
+        await self.broker.close()
+        await self.store.close()
 
 session_manager = SessionManager()
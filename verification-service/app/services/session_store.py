@@ -0,0 +1,345 @@
+"""
+Session storage engines behind SessionManager.
+
+Both engines implement the same small contract (SessionStore): create a record with a TTL,
+read it, and the atomic transitions PENDING -> VERIFYING -> CONSUMED (or back to PENDING)
+plus a proximity write. SESSION_BACKEND picks one:
+
+  - "redis"  (default) shared across workers/replicas; compact binary records,
+             transitions are server-side Lua
+  - "memory" in-process dict with timer-wheel expiry and no encoding at all; for
+             single-worker deployments and local runs that don't need Redis
+"""
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Set, Tuple
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.services import session_codec
+
+ClaimResult = Tuple[str, Optional[dict]]
+
+_PENDING = session_codec.status_byte("PENDING")
+_VERIFYING = session_codec.status_byte("VERIFYING")
+
+
+class SessionStore(ABC):
+    """
+    Storage contract for session records (plain dicts: url, created_at, status, ip, ua,
+    proximity, result). Every method is a single atomic step; a missing or expired
+    record reads as None / loses every transition.
+    """
+
+    # Redis client for components that share the connection (rate limiting); None in-process
+    redis = None
+
+    @abstractmethod
+    async def create(self, nonce: str, session: dict, ttl: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, nonce: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim(self, nonce: str) -> ClaimResult:
+        """PENDING -> VERIFYING. ("CLAIMED", session) for the winner, else (status, None)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, nonce: str) -> bool:
+        """VERIFYING -> PENDING."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def finish(self, nonce: str, status: str, result: Optional[dict], ttl: int) -> bool:
+        """VERIFYING -> `status`, storing `result` and resetting the TTL."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_proximity(self, nonce: str, proximity: dict, ttl: int) -> bool:
+        """Store proximity data on an existing session and reset its TTL."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_speculative(self, nonce: str, result: dict, ttl: int) -> None:
+        """
+        Attach a URL-only verdict computed ahead of the verify. claim() returns it as
+        session["speculative"]; finish() drops it.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+# Redis engine: each session is one compact binary record (see session_codec) plus, once
+# consumed, a separate result key, and until then possibly a speculative-verdict key. Each transition is one Lua script that flips the status
+# byte in place, so it runs in one round-trip with no read-modify-write race. Status
+# codes are passed in ARGV so the scripts don't hard-code the codec's values.
+
+# KEYS[1] record, KEYS[2] speculative verdict. ARGV[1] PENDING, ARGV[2] VERIFYING.
+# Returns {"CLAIMED", record, speculative or nil} for the winner, {status_code} otherwise,
+# {"EXPIRED"} when gone.
+CLAIM_SCRIPT = """
+local status = redis.call('GETRANGE', KEYS[1], 1, 1)
+if status == '' then
+    return {'EXPIRED'}
+end
+if status ~= ARGV[1] then
+    return {status}
+end
+redis.call('SETRANGE', KEYS[1], 1, ARGV[2])
+return {'CLAIMED', redis.call('GET', KEYS[1]), redis.call('GET', KEYS[2])}
+"""
+
+# KEYS[1] record, KEYS[2] result key, KEYS[3] speculative verdict (no longer needed).
+# ARGV[1] VERIFYING, ARGV[2] new status, ARGV[3] encoded result ('' for none), ARGV[4] TTL.
+# Only the claimant may finish.
+FINISH_SCRIPT = """
+if redis.call('GETRANGE', KEYS[1], 1, 1) ~= ARGV[1] then
+    return 0
+end
+redis.call('SETRANGE', KEYS[1], 1, ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if ARGV[3] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[4])
+end
+redis.call('DEL', KEYS[3])
+return 1
+"""
+
+# KEYS[1] record. ARGV[1] VERIFYING, ARGV[2] PENDING.
+# Hands a claimed session back after a failed verification.
+RELEASE_SCRIPT = """
+if redis.call('GETRANGE', KEYS[1], 1, 1) ~= ARGV[1] then
+    return 0
+end
+redis.call('SETRANGE', KEYS[1], 1, ARGV[2])
+return 1
+"""
+
+# KEYS[1] record. ARGV[1] packed proximity, ARGV[2] TTL. Replaces the tail after
+# base_length (u16 at byte offset 11). Never resurrects an expired session.
+PROXIMITY_SCRIPT = """
+local record = redis.call('GET', KEYS[1])
+if not record then
+    return 0
+end
+local base = string.byte(record, 12) + string.byte(record, 13) * 256
+redis.call('SET', KEYS[1], string.sub(record, 1, base) .. ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+
+class RedisSessionStore(SessionStore):
+    def __init__(self, client: redis.Redis):
+        self.redis = client
+        # Script objects run via EVALSHA and reload themselves after a SCRIPT FLUSH / failover
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self._finish = client.register_script(FINISH_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+        self._proximity = client.register_script(PROXIMITY_SCRIPT)
+
+    @classmethod
+    def from_settings(cls) -> "RedisSessionStore":
+        # One bounded asyncio pool per worker, shared with the rate limiters.
+        # Records are binary, so responses are not decoded.
+        pool = redis.BlockingConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=0,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        )
+        return cls(redis.Redis(connection_pool=pool))
+
+    @staticmethod
+    def _keys(nonce: str) -> List[str]:
+        # The {nonce} hash tag keeps all of a session's keys in one cluster slot for the scripts
+        return [f"session:{{{nonce}}}", f"session:{{{nonce}}}:result", f"session:{{{nonce}}}:speculative"]
+
+    async def create(self, nonce: str, session: dict, ttl: int) -> None:
+        await self.redis.set(self._keys(nonce)[0], session_codec.encode_session(session), ex=ttl)
+
+    async def get(self, nonce: str) -> Optional[dict]:
+        record, result = await self.redis.mget(self._keys(nonce)[:2])
+        if record is None:
+            return None
+        session = session_codec.decode_session(record)
+        if result is not None:
+            session["result"] = session_codec.decode_result(result)
+        return session
+
+    async def claim(self, nonce: str) -> ClaimResult:
+        record, _, speculative_key = self._keys(nonce)
+        reply = await self._claim(
+            keys=[record, speculative_key],
+            args=[_PENDING, _VERIFYING],
+        )
+        if reply[0] == b"EXPIRED":
+            return "EXPIRED", None
+        if reply[0] != b"CLAIMED":
+            return session_codec.status_name(reply[0]), None
+        session = session_codec.decode_session(reply[1])
+        if len(reply) > 2 and reply[2] is not None:
+            session["speculative"] = session_codec.decode_result(reply[2])
+        return "CLAIMED", session
+
+    async def release(self, nonce: str) -> bool:
+        return bool(await self._release(
+            keys=self._keys(nonce)[:1],
+            args=[_VERIFYING, _PENDING],
+        ))
+
+    async def finish(self, nonce: str, status: str, result: Optional[dict], ttl: int) -> bool:
+        return bool(await self._finish(
+            keys=self._keys(nonce),
+            args=[
+                _VERIFYING,
+                session_codec.status_byte(status),
+                session_codec.encode_result(result) if result else b"",
+                ttl,
+            ],
+        ))
+
+    async def set_proximity(self, nonce: str, proximity: dict, ttl: int) -> bool:
+        return bool(await self._proximity(
+            keys=self._keys(nonce)[:1],
+            args=[session_codec.encode_proximity(proximity), ttl],
+        ))
+
+    async def set_speculative(self, nonce: str, result: dict, ttl: int) -> None:
+        # No existence check: a verdict for a session that is already gone just expires
+        await self.redis.set(self._keys(nonce)[2], session_codec.encode_result(result), ex=ttl)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+        await self.redis.connection_pool.disconnect()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process engine: records are the session dicts themselves, so there is no
+    encoding and no round-trip. Every method runs without awaiting, which makes each one
+    atomic on the event loop.
+
+    Expiry uses a hashed timer wheel: `slots` buckets of `tick` seconds, each holding the
+    nonces due in it. Every call advances the wheel to now and drops due records, so
+    expiring N sessions costs O(N) spread over traffic, with no full scans and no
+    background task. A record whose TTL was reset stays in its old bucket and is
+    re-filed when that bucket comes round.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, clock=time.monotonic):
+        self.tick = tick
+        self._clock = clock
+        self._records: Dict[str, dict] = {}
+        self._expires: Dict[str, float] = {}
+        self._wheel: List[Set[str]] = [set() for _ in range(slots)]
+        self._current_tick = self._tick_of(clock())
+
+    def __len__(self) -> int:
+        self._advance()
+        return len(self._records)
+
+    def _tick_of(self, at: float) -> int:
+        return int(at // self.tick)
+
+    def _schedule(self, nonce: str, ttl: int) -> None:
+        expires_at = self._clock() + ttl
+        self._expires[nonce] = expires_at
+        self._wheel[self._tick_of(expires_at) % len(self._wheel)].add(nonce)
+
+    def _advance(self) -> None:
+        now = self._clock()
+        target = self._tick_of(now)
+        # After an idle gap longer than one turn, visiting each slot once is enough
+        start = max(self._current_tick + 1, target - len(self._wheel) + 1)
+        for tick in range(start, target + 1):
+            slot = self._wheel[tick % len(self._wheel)]
+            for nonce in list(slot):
+                expires_at = self._expires.get(nonce)
+                if expires_at is None:
+                    slot.discard(nonce)
+                elif expires_at <= now:
+                    slot.discard(nonce)
+                    del self._expires[nonce]
+                    del self._records[nonce]
+                elif self._tick_of(expires_at) % len(self._wheel) != tick % len(self._wheel):
+                    # TTL was extended (or is more than one turn away): move it to its real slot
+                    slot.discard(nonce)
+                    self._wheel[self._tick_of(expires_at) % len(self._wheel)].add(nonce)
+        self._current_tick = max(self._current_tick, target)
+
+    def _live(self, nonce: str) -> Optional[dict]:
+        self._advance()
+        session = self._records.get(nonce)
+        # The wheel has tick resolution; don't serve a record that expired within the tick
+        if session is not None and self._expires[nonce] <= self._clock():
+            return None
+        return session
+
+    async def create(self, nonce: str, session: dict, ttl: int) -> None:
+        self._advance()
+        self._records[nonce] = {name: value for name, value in session.items() if value is not None}
+        self._schedule(nonce, ttl)
+
+    async def get(self, nonce: str) -> Optional[dict]:
+        session = self._live(nonce)
+        if session is None:
+            return None
+        return {name: value for name, value in session.items() if name != "speculative"}
+
+    async def claim(self, nonce: str) -> ClaimResult:
+        session = self._live(nonce)
+        if session is None:
+            return "EXPIRED", None
+        if session["status"] != "PENDING":
+            return session["status"], None
+        session["status"] = "VERIFYING"
+        return "CLAIMED", dict(session)
+
+    async def release(self, nonce: str) -> bool:
+        session = self._live(nonce)
+        if session is None or session["status"] != "VERIFYING":
+            return False
+        session["status"] = "PENDING"
+        return True
+
+    async def finish(self, nonce: str, status: str, result: Optional[dict], ttl: int) -> bool:
+        session = self._live(nonce)
+        if session is None or session["status"] != "VERIFYING":
+            return False
+        session["status"] = status
+        if result:
+            session["result"] = result
+        session.pop("speculative", None)
+        self._schedule(nonce, ttl)
+        return True
+
+    async def set_proximity(self, nonce: str, proximity: dict, ttl: int) -> bool:
+        session = self._live(nonce)
+        if session is None:
+            return False
+        session["proximity"] = proximity
+        self._schedule(nonce, ttl)
+        return True
+
+    async def set_speculative(self, nonce: str, result: dict, ttl: int) -> None:
+        session = self._live(nonce)
+        if session is not None:
+            session["speculative"] = result
+
+
+def make_session_store() -> SessionStore:
+    if settings.SESSION_BACKEND == "memory":
+        return MemorySessionStore()
+    if settings.SESSION_BACKEND != "redis":
+        raise ValueError(f"Unknown SESSION_BACKEND {settings.SESSION_BACKEND!r} (expected 'redis' or 'memory')")
+    return RedisSessionStore.from_settings()
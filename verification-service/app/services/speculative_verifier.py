@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.services.session_manager import session_manager
+from app.services.verdict_cache import VerdictKey
+from app.services.verification_engine import verification_engine
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    """One queued or running host: the sessions waiting for it and the eventual verdict."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.nonces: List[str] = []
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class SpeculativeVerifier:
+    """
+    Runs the URL-only verification stages as soon as /session/init knows the URL, and
+    attaches the verdict to the session so /session/verify only adds the per-session
+    checks.
+
+    Work is keyed by (hostname, port): sessions for a host that is already queued or
+    running share its run. The queue is bounded; when it is full the session is simply
+    not speculated on. Verdicts for whitelisted hosts are also put in the engine's
+    verdict cache, and a fresh cache entry is attached without any new work.
+
+    A verify that arrives while its host is still running on this worker waits for
+    that run instead of starting another one, for at most `join_timeout` seconds.
+    """
+
+    def __init__(self, engine=verification_engine, sessions=session_manager,
+                 queue_size: int = 256, concurrency: int = 8, join_timeout: float = 3):
+        self.engine = engine
+        self.sessions = sessions
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.join_timeout = join_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Dict[VerdictKey, _Pending] = {}
+        self._stats = {
+            "scheduled": 0,
+            "deduplicated": 0,
+            "dropped": 0,
+            "completed": 0,
+            "failed": 0,
+            # At verify time: verdict attached to the session / joined a run on this worker / neither
+            "ready": 0,
+            "joined": 0,
+            "missed": 0,
+            # Joined a run that didn't finish within the join timeout
+            "join_timeouts": 0,
+        }
+
+    async def run(self):
+        """Start the workers; meant to be started as a background task at app startup."""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+        finally:
+            self._queue = None
+            for pending in self._pending.values():
+                pending.done.cancel()
+            self._pending.clear()
+
+    def schedule(self, nonce: str, url: str) -> None:
+        """Queue the URL-only stages for `url` on behalf of session `nonce`. Never blocks."""
+        key = self.engine._target_key(url)
+        if key is None or self._queue is None:
+            return
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.nonces.append(nonce)
+            self._stats["deduplicated"] += 1
+            return
+        pending = _Pending(url)
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            return
+        pending.nonces.append(nonce)
+        self._pending[key] = pending
+        self._stats["scheduled"] += 1
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            pending = self._pending[key]
+            try:
+                result = await self._verify(key, pending.url)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Speculative verification of {key[0]}:{key[1]} failed: {e}")
+                self._stats["failed"] += 1
+                result = None
+            finally:
+                del self._pending[key]
+            pending.done.set_result(result)
+            if result is None:
+                continue
+            self._stats["completed"] += 1
+            for nonce in pending.nonces:
+                try:
+                    await self.sessions.attach_speculative(nonce, result)
+                except Exception as e:
+                    logger.warning(f"Attaching speculative verdict to {nonce} failed: {e}")
+
+    async def _verify(self, key: VerdictKey, url: str) -> Optional[Dict[str, Any]]:
+        """A shareable URL-only verdict, or None if this one hit a transient failure."""
+        if not settings.VERIFY_FORCE_FRESH:
+            cached = self.engine.verdict_cache.get(key)
+            if cached is not None:
+                return cached
+        result = await self.engine.verify_url(url)
+        if not self.engine.is_cacheable(result):
+            return None
+        if self.engine.is_whitelisted(result):
+            self.engine.verdict_cache.put(key, result)
+        return result
+
+    async def prepared_for(self, session: dict, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        For /session/verify: the verdict attached to the claimed session, or the result
+        of a run for its host still in progress on this worker, or None. The run is waited
+        for `join_timeout` seconds at most (less if `deadline` comes first), leaving the
+        caller time to verify on its own.
+        """
+        if session.get("speculative") is not None:
+            self._stats["ready"] += 1
+            return session["speculative"]
+        key = self.engine._target_key(session.get("url", ""))
+        pending = self._pending.get(key) if key else None
+        if pending is None:
+            self._stats["missed"] += 1
+            return None
+        self._stats["joined"] += 1
+        # Shielded: a cancelled verify must not cancel the run other sessions wait on
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(pending.done), deadline.budget(self.join_timeout) if deadline else self.join_timeout
+            )
+        except asyncio.TimeoutError:
+            self._stats["join_timeouts"] += 1
+            return None
+
+    def stats(self) -> dict:
+        used = self._stats["ready"] + self._stats["joined"] + self._stats["missed"]
+        return dict(
+            self._stats,
+            queued=self._queue.qsize() if self._queue is not None else 0,
+            in_progress=len(self._pending),
+            ready_rate=round(self._stats["ready"] / used, 3) if used else None,
+        )
+
+
+# Global instance
+speculative_verifier = SpeculativeVerifier(
+    queue_size=settings.SPECULATIVE_QUEUE_SIZE,
+    concurrency=settings.SPECULATIVE_CONCURRENCY,
+    join_timeout=settings.SPECULATIVE_JOIN_TIMEOUT,
+)
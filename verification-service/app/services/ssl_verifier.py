@@ -1,55 +1,104 @@
 import ssl
+import _ssl
 import socket
 from urllib.parse import urlparse
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.x509.oid import ExtensionOID
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, ed448, padding, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, ExtensionOID
 from cryptography.x509.ocsp import OCSPRequestBuilder, OCSPResponseStatus
-import requests
 import datetime
 from typing import Tuple, List, Optional
+from app.core.deadline import Deadline
+from app.services.crl_cache import crl_cache
+from app.services.ocsp_cache import ocsp_cache, OCSPResult
+from app.services.intermediate_cache import intermediate_cache, is_issued_by
+from app.services.http_client import HTTPClient, http_client as shared_http_client
+
+
+def _fetchable(url: str) -> bool:
+    return urlparse(url).scheme in ("http", "https")
+
+
+def _verify_signature(public_key, signature: bytes, data: bytes, algorithm) -> None:
+    """Raises InvalidSignature (or TypeError for unsupported keys) unless `signature` is valid."""
+    if isinstance(public_key, rsa.RSAPublicKey):
+        public_key.verify(signature, data, padding.PKCS1v15(), algorithm)
+    elif isinstance(public_key, ec.EllipticCurvePublicKey):
+        public_key.verify(signature, data, ec.ECDSA(algorithm))
+    elif isinstance(public_key, (ed25519.Ed25519PublicKey, ed448.Ed448PublicKey)):
+        public_key.verify(signature, data)
+    else:
+        raise TypeError(f"Unsupported OCSP signing key: {type(public_key).__name__}")
+
 
 class SSLVerifier:
-    def get_cert_chain(self, hostname: str, port: int = 443) -> List[x509.Certificate]:
+    MAX_CHAIN_DEPTH = 4
+
+    def __init__(self, http_client: Optional[HTTPClient] = None):
+        # Pooled keep-alive client shared with the CRL/caIssuers caches and the whitelist refresh
+        self.http = http_client or shared_http_client
+        self.crl_cache = crl_cache
+        self.ocsp_cache = ocsp_cache
+        self.intermediate_cache = intermediate_cache
+
+    def get_cert_chain(self, hostname: str, port: int = 443, timeout: float = 5) -> List[x509.Certificate]:
         """
-        Retrieves the certificate chain from the server.
-        Note: Python's ssl module doesn't easily give the full chain including root unless configured blindly.
-        We will rely on what the server sends and peer certificate.
-        For a robust implementation, we might need to fetch intermediates if missing.
+        Retrieves the certificate chain from the server: [leaf, issuer, ...].
+        Uses every certificate the server sent when the runtime exposes them, and fetches a
+        missing issuer via the AIA caIssuers URL (cached by key identifier), so OCSP can run.
+        `timeout` covers the connect, the handshake and every caIssuers fetch together.
         """
+        budget = Deadline(timeout)
         context = ssl.create_default_context()
         context.check_hostname = False # We verify manually
         context.verify_mode = ssl.CERT_NONE # We verify manually to get the cert even if unrelated error
 
         try:
-            with socket.create_connection((hostname, port), timeout=5) as sock:
+            with socket.create_connection((hostname, port), timeout=timeout) as sock:
+                # The handshake gets what the connect left, not a fresh timeout
+                sock.settimeout(max(budget.remaining(), 0.01))
                 with context.wrap_socket(sock, server_hostname=hostname) as ssock:
                     peercert_der = ssock.getpeercert(binary_form=True)
                     if not peercert_der:
                         raise Exception("No certificate provided")
-                    
-                    # In a real rigorous implementation, we'd want to use a library that handles the full handshake inspection 
-                    # to get all sent certificates. stored in unverified_context usually.
-                    # Let's try to get full chain if possible or at least the peer cert.
-                    # Python's SSLContext doesn't expose the full chain easily in getpeercert without verify_mode.
-                    # Let's switch strategy: Use verify_mode=CERT_REQUIRED but with a custom context 
-                    # that doesn't fail on hostname (we check later) but fails on chain?
-                    # Actually, for deep inspection (including OCSP extraction), we just need the leaf cert 
-                    # and its issuer. 
-                    
-                    leaf_cert = x509.load_der_x509_certificate(peercert_der, default_backend())
-                    return [leaf_cert]
-                    # Note: Getting the full chain including issuer for OCSP check usually requires the issuer to be sent 
-                    # or in trust store. `ssock.get_unverified_chain()` is available in recent python? 
-                    # No, it's not standard. 
-                    # We will primarily check the Leaf Certificate for Revocation and Hostname.
-                    # If we can't get issuer, we can't easily sign OCSP request.
-                    
+                    sent_chain_der = self._unverified_chain_der(ssock)
         except Exception as e:
             print(f"SSL Connection failed: {e}")
             return []
 
+        leaf_cert = x509.load_der_x509_certificate(peercert_der, default_backend())
+        chain = [leaf_cert]
+        # Keep only the certificates that actually link up from the leaf; servers sometimes send extras
+        sent = [x509.load_der_x509_certificate(der, default_backend()) for der in sent_chain_der[1:]]
+        self.intermediate_cache.remember(sent)
+        for cert in sent:
+            if is_issued_by(chain[-1], cert):
+                chain.append(cert)
+
+        # Chase missing intermediates (AIA caIssuers) until we reach a self-issued cert or the depth cap
+        while len(chain) < self.MAX_CHAIN_DEPTH and chain[-1].issuer != chain[-1].subject and not budget.expired:
+            issuer = self.intermediate_cache.find_issuer(chain[-1], timeout=budget.remaining())
+            if issuer is None:
+                break
+            chain.append(issuer)
+        return chain
+
+    @staticmethod
+    def _unverified_chain_der(ssock: ssl.SSLSocket) -> List[bytes]:
+        """DER of every certificate the peer sent. Python 3.13+ has a public API; 3.10-3.12 only the private one."""
+        getter = getattr(ssock, "get_unverified_chain", None) or getattr(
+            getattr(ssock, "_sslobj", None), "get_unverified_chain", None
+        )
+        if getter is None:
+            return []
+        try:
+            certs = getter() or []
+        except Exception:
+            return []
+        return [c if isinstance(c, bytes) else c.public_bytes(_ssl.ENCODING_DER) for c in certs]
+
     def verify_hostname(self, cert: x509.Certificate, hostname: str) -> bool:
         try:
             # Check Subject Alternative Names
@@ -85,55 +134,130 @@ class SSLVerifier:
                 return True
         return False
 
-    def check_revocation(self, cert: x509.Certificate, issuer: Optional[x509.Certificate] = None) -> Tuple[bool, str]:
+    def revocation_sources(self, cert: x509.Certificate) -> Tuple[List[str], List[str]]:
         """
-        Returns (is_revoked, reason)
+        (OCSP responder URLs, CRL distribution point URLs) named in the certificate, limited
+        to http(s): other schemes (ldap:// distribution points are common) can't be fetched
+        and would only cost a slot in the race.
         """
-        # 1. OCSP
+        ocsp_urls, crl_urls = [], []
         try:
             aia = cert.extensions.get_extension_for_oid(ExtensionOID.AUTHORITY_INFORMATION_ACCESS)
-            ocsps = [desc.access_location.value for desc in aia.value if desc.access_method.dotted_string == "1.3.6.1.5.5.7.48.1"]
-            if ocsps and issuer:
-                for ocsp_url in ocsps:
-                    builder = OCSPRequestBuilder()
-                    builder = builder.add_certificate(cert, issuer, hashes.SHA256())
-                    req = builder.build()
-                    try:
-                        resp = requests.post(ocsp_url, data=req.public_bytes(serialization.Encoding.DER), headers={'Content-Type': 'application/ocsp-request'}, timeout=3)
-                        if resp.status_code == 200:
-                            ocsp_resp = x509.ocsp.load_der_ocsp_response(resp.content)
-                            if ocsp_resp.response_status == OCSPResponseStatus.SUCCESSFUL:
-                                if ocsp_resp.certificate_status == x509.ocsp.OCSPCertStatus.REVOKED:
-                                    return True, "OCSP: Revoked"
-                                if ocsp_resp.certificate_status == x509.ocsp.OCSPCertStatus.GOOD:
-                                    # If good, we can return False immediately if we trust OCSP
-                                    pass
-                    except Exception:
-                        pass
+            ocsp_urls = [desc.access_location.value for desc in aia.value if desc.access_method.dotted_string == "1.3.6.1.5.5.7.48.1"]
         except x509.ExtensionNotFound:
             pass
-
-        # 2. CRL
         try:
             cdp = cert.extensions.get_extension_for_oid(ExtensionOID.CRL_DISTRIBUTION_POINTS)
             for point in cdp.value:
-                for full_name in point.full_name:
+                for full_name in point.full_name or ():
                     if isinstance(full_name, x509.UniformResourceIdentifier):
-                        crl_url = full_name.value
-                        try:
-                            # Basic caching could be here
-                            resp = requests.get(crl_url, timeout=5)
-                            if resp.status_code == 200:
-                                crl = x509.load_der_x509_crl(resp.content, default_backend())
-                                if crl.get_revoked_certificate_by_serial_number(cert.serial_number):
-                                    return True, "CRL: Revoked"
-                        except Exception:
-                            pass
+                        crl_urls.append(full_name.value)
         except x509.ExtensionNotFound:
             pass
-        
-        return False, "Not Revoked"
-            
+        return [url for url in ocsp_urls if _fetchable(url)], [url for url in crl_urls if _fetchable(url)]
+
+    def check_ocsp(self, cert: x509.Certificate, issuer: x509.Certificate, ocsp_urls: List[str],
+                   deadline: Optional[Deadline] = None) -> Optional[Tuple[bool, str]]:
+        """(is_revoked, reason) from OCSP, or None when no responder gave a definitive answer in time."""
+        # Cached until the response's nextUpdate; concurrent identical lookups share one round-trip
+        result = self.ocsp_cache.lookup(
+            self.ocsp_cache.make_key(cert, issuer),
+            lambda: self._query_ocsp(cert, issuer, ocsp_urls, deadline),
+            wait_timeout=deadline.budget(10) if deadline else 10
+        )
+        if result and result.status == "REVOKED":
+            return True, "OCSP: Revoked"
+        if result and result.status == "GOOD":
+            return False, "OCSP: Good"
+        return None
+
+    def check_crl(self, cert: x509.Certificate, crl_url: str,
+                  deadline: Optional[Deadline] = None) -> Optional[Tuple[bool, str]]:
+        """(is_revoked, reason) from one distribution point's CRL, or None if it couldn't be loaded in time."""
+        timeout = deadline.budget(5) if deadline else 5
+        if timeout <= 0:
+            return None
+        # Cached per distribution point; the entry holds a pre-indexed serial set
+        entry = self.crl_cache.get(crl_url, timeout=timeout)
+        if entry is None:
+            return None
+        if entry.is_revoked(cert.serial_number):
+            return True, "CRL: Revoked"
+        return False, "CRL: Not Revoked"
+
+    def _query_ocsp(self, cert: x509.Certificate, issuer: x509.Certificate, ocsp_urls: List[str],
+                    deadline: Optional[Deadline] = None) -> Optional[OCSPResult]:
+        """Ask each responder in turn; first SUCCESSFUL response wins. None if none answered in time."""
+        builder = OCSPRequestBuilder()
+        # SHA-1 CertID is what RFC 5019 responders (most public CAs) are required to accept
+        builder = builder.add_certificate(cert, issuer, hashes.SHA1())
+        req = builder.build()
+        for ocsp_url in ocsp_urls:
+            timeout = deadline.budget(3) if deadline else 3
+            if timeout <= 0:
+                break
+            try:
+                resp = self.http.post(ocsp_url, data=req.public_bytes(serialization.Encoding.DER), headers={'Content-Type': 'application/ocsp-request'}, timeout=timeout, breaker=True)
+                if resp.status_code != 200:
+                    continue
+                ocsp_resp = x509.ocsp.load_der_ocsp_response(resp.content)
+                if ocsp_resp.response_status != OCSPResponseStatus.SUCCESSFUL:
+                    continue
+                if not self._is_authentic(ocsp_resp, req, issuer):
+                    # Unsigned or mis-addressed answers are an error, never a GOOD
+                    continue
+                return OCSPResult(
+                    status=ocsp_resp.certificate_status.name,
+                    this_update=self._to_timestamp(ocsp_resp, "this_update"),
+                    next_update=self._to_timestamp(ocsp_resp, "next_update"),
+                )
+            except Exception:
+                pass
+        return None
+
+    @staticmethod
+    def _is_authentic(ocsp_resp, req, issuer: x509.Certificate) -> bool:
+        """
+        True if the response answers `req` and is signed by the issuer itself or by a
+        responder certificate the issuer signed for OCSPSigning (RFC 6960 4.2.2.2).
+        """
+        if (ocsp_resp.serial_number != req.serial_number
+                or ocsp_resp.issuer_key_hash != req.issuer_key_hash
+                or ocsp_resp.issuer_name_hash != req.issuer_name_hash):
+            return False
+        signers = [c for c in ocsp_resp.certificates if SSLVerifier._is_ocsp_responder(c, issuer)] + [issuer]
+        for signer in signers:
+            try:
+                _verify_signature(signer.public_key(), ocsp_resp.signature,
+                                  ocsp_resp.tbs_response_bytes, ocsp_resp.signature_hash_algorithm)
+                return True
+            except Exception:
+                continue
+        return False
+
+    @staticmethod
+    def _is_ocsp_responder(responder: x509.Certificate, issuer: x509.Certificate) -> bool:
+        if not is_issued_by(responder, issuer):
+            return False
+        try:
+            eku = responder.extensions.get_extension_for_oid(ExtensionOID.EXTENDED_KEY_USAGE).value
+        except x509.ExtensionNotFound:
+            return False
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return (ExtendedKeyUsageOID.OCSP_SIGNING in eku
+                and responder.not_valid_before_utc <= now <= responder.not_valid_after_utc)
+
+    @staticmethod
+    def _to_timestamp(ocsp_resp, field: str) -> Optional[float]:
+        # cryptography>=43 exposes timezone-aware *_utc properties; older versions return naive UTC
+        if hasattr(ocsp_resp, f"{field}_utc"):
+            value = getattr(ocsp_resp, f"{field}_utc")
+        else:
+            value = getattr(ocsp_resp, field)
+            if value is not None:
+                value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp() if value else None
+
     def check_expiry(self, cert: x509.Certificate) -> Tuple[bool, str]:
         """
         Returns (is_valid, reason)
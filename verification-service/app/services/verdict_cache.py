@@ -0,0 +1,64 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+VerdictKey = Tuple[str, int]
+
+
+class VerdictCache:
+    """
+    URL-only verification results (whitelist, TLS, hostname, revocation, metadata) per
+    (hostname, port), filled by the background warmer. Also counts demand per key so the
+    warmer knows which domains are hot. Holds at most `max_entries` verdicts; the least
+    recently used one is evicted on put.
+    """
+
+    def __init__(self, ttl: float = 300, max_tracked: int = 5000, max_entries: int = 5000):
+        self.ttl = ttl
+        self.max_tracked = max_tracked
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[VerdictKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._demand: Counter = Counter()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: VerdictKey) -> Optional[Dict[str, Any]]:
+        self._demand[key] += 1
+        if len(self._demand) > self.max_tracked:
+            self._demand = Counter(dict(self._demand.most_common(self.max_tracked // 2)))
+
+        cached = self._entries.get(key)
+        if cached and time.time() - cached[0] < self.ttl:
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return cached[1]
+        self._stats["misses"] += 1
+        return None
+
+    def put(self, key: VerdictKey, result: Dict[str, Any]):
+        self._entries[key] = (time.time(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def hot_keys(self, limit: int) -> List[VerdictKey]:
+        return [key for key, _ in self._demand.most_common(limit)]
+
+    def decay(self):
+        """Halve demand counts so hotness follows recent traffic rather than all-time totals."""
+        self._demand = Counter({key: count // 2 for key, count in self._demand.items() if count > 1})
+
+    def prune(self):
+        now = time.time()
+        for key in [k for k, (stored_at, _) in self._entries.items() if now - stored_at >= self.ttl]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        now = time.time()
+        ages = [now - stored_at for stored_at, _ in self._entries.values()]
+        return dict(
+            self._stats,
+            entries=len(self._entries),
+            oldest_age_s=round(max(ages), 1) if ages else None,
+            mean_age_s=round(sum(ages) / len(ages), 1) if ages else None,
+        )
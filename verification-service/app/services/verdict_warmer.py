@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import random
+import time
+from typing import List
+
+from app.core.config import settings
+from app.services.verdict_cache import VerdictKey
+from app.services.verification_engine import verification_engine
+
+logger = logging.getLogger(__name__)
+
+
+class VerdictWarmer:
+    """
+    Periodically recomputes URL-only verdicts for whitelisted domains so /session/verify
+    is a cache lookup plus the per-session checks.
+
+    mode="hot" warms the `top_n` most requested whitelisted hosts, mode="all" every
+    whitelisted domain. Demand for other hosts is ignored: anyone can post arbitrary URLs,
+    and their verdicts must never take cache slots from real ones.
+    Work is spread with per-item jitter and capped by a semaphore so a cycle never floods
+    the executor or the target sites.
+    """
+
+    def __init__(self, engine=verification_engine, mode: str = "hot", top_n: int = 200,
+                 interval: float = 120, jitter: float = 15, concurrency: int = 8):
+        self.engine = engine
+        self.mode = mode
+        self.top_n = top_n
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self._stats = {
+            "cycles": 0,
+            "last_cycle_at": None,
+            "last_cycle_duration_s": None,
+            "last_targets": 0,
+            "last_warmed": 0,
+            "last_errors": 0,
+        }
+
+    async def run(self):
+        """Warm forever; meant to be started as a background task at app startup."""
+        while True:
+            try:
+                await self.warm_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Verdict warm cycle failed: {e}")
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+
+    async def warm_once(self):
+        started = time.monotonic()
+        targets = self._targets()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        warmed = 0
+        errors = 0
+
+        async def warm(key: VerdictKey):
+            nonlocal warmed, errors
+            # Spread start times so a cycle doesn't open `concurrency` handshakes in the same instant
+            await asyncio.sleep(random.uniform(0, self.jitter))
+            async with semaphore:
+                hostname, port = key
+                try:
+                    url = f"https://{hostname}/" if port == 443 else f"https://{hostname}:{port}/"
+                    result = await self.engine.verify_url(url, force_fresh=True)
+                except Exception as e:
+                    errors += 1
+                    logger.warning(f"Warming {hostname}:{port} failed: {e}")
+                    return
+                if self.engine.is_cacheable(result) and self.engine.is_whitelisted(result):
+                    self.engine.verdict_cache.put(key, result)
+                    warmed += 1
+
+        await asyncio.gather(*(warm(key) for key in targets))
+        self.engine.verdict_cache.decay()
+        self.engine.verdict_cache.prune()
+
+        self._stats.update(
+            cycles=self._stats["cycles"] + 1,
+            last_cycle_at=time.time(),
+            last_cycle_duration_s=round(time.monotonic() - started, 2),
+            last_targets=len(targets),
+            last_warmed=warmed,
+            last_errors=errors,
+        )
+
+    def _targets(self) -> List[VerdictKey]:
+        # Over-fetch so rejected hosts in the demand counts don't crowd out real ones
+        hot = self.engine.verdict_cache.hot_keys(self.top_n * 2)
+        targets = [key for key in hot if self.engine.tar.is_trusted_host(key[0])][:self.top_n]
+        if self.mode == "all":
+            seen = set(targets)
+            targets += [(domain, 443) for domain in self.engine.tar.domains() if (domain, 443) not in seen]
+        return targets
+
+    def stats(self) -> dict:
+        last_targets = self._stats["last_targets"]
+        coverage = self._stats["last_warmed"] / last_targets if last_targets else None
+        return dict(
+            self._stats,
+            mode=self.mode,
+            coverage=round(coverage, 3) if coverage is not None else None,
+            verdict_cache=self.engine.verdict_cache.stats(),
+        )
+
+
+# Global instance
+verdict_warmer = VerdictWarmer(
+    mode=settings.WARMER_MODE,
+    top_n=settings.WARMER_TOP_N,
+    interval=settings.WARMER_INTERVAL,
+    jitter=settings.WARMER_JITTER,
+    concurrency=settings.WARMER_CONCURRENCY,
+)
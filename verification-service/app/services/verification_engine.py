@@ -1,27 +1,170 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Callable
 from urllib.parse import urlparse
 
+from cryptography import x509
+
 from app.core.config import settings
+from app.core.deadline import Deadline
 from app.services.whitelist_checker import trust_anchor_repository
 from app.services.ssl_verifier import ssl_verifier
+from app.services.chain_cache import ChainCache, ChainEntry
+from app.services.verdict_cache import VerdictCache
+
+logger = logging.getLogger(__name__)
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _detached(coro) -> asyncio.Future:
+    """
+    Run `coro` as its own task and return a shielded view of it: a caller that stops
+    waiting (deadline) doesn't cancel work other requests share, and a late failure
+    nobody waits for any more isn't reported as "exception was never retrieved".
+    """
+    task = asyncio.ensure_future(coro)
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return asyncio.shield(task)
+
 
 class VerificationEngine:
     def __init__(self):
         self.tar = trust_anchor_repository
         self.ssl_verifier = ssl_verifier
+        # Bounded pool for the blocking stages (raw TLS socket, OCSP/CRL requests).
+        # Keeps the event loop free while capping how many sockets we open at once.
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.VERIFY_MAX_WORKERS,
+            thread_name_prefix="verify"
+        )
+        # Parsed chains + chain-only verdicts per (hostname, port), refreshed in the background
+        self.chain_cache = ChainCache(
+            self._load_chain,
+            ttl=settings.CHAIN_CACHE_TTL,
+            stale_ttl=settings.CHAIN_CACHE_STALE_TTL,
+            max_entries=settings.CHAIN_CACHE_MAX_ENTRIES
+        )
+        # URL-only verdicts precomputed by the background warmer (app/services/verdict_warmer.py)
+        self.verdict_cache = VerdictCache(ttl=settings.VERDICT_CACHE_TTL, max_entries=settings.VERDICT_CACHE_MAX_ENTRIES)
 
-    def verify(self, url: str, web_ip: str = None, mobile_ip: str = None, proximity: dict = None) -> Dict[str, Any]:
+    async def _run_stage(self, func: Callable, *args, timeout: float, **kwargs):
+        """Run a blocking stage on the executor, raising asyncio.TimeoutError after `timeout` seconds."""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        return await asyncio.wait_for(loop.run_in_executor(self._executor, call), timeout)
+
+    async def _load_chain(self, hostname: str, port: int) -> ChainEntry | None:
+        """TLS handshake on the executor, then precompute everything that depends only on the chain."""
+        chain = await self._run_stage(
+            self.ssl_verifier.get_cert_chain, hostname, port,
+            # Socket timeout slightly below the stage budget so the worker thread frees itself
+            max(settings.TLS_STAGE_TIMEOUT - 1, 1),
+            timeout=settings.TLS_STAGE_TIMEOUT
+        )
+        if not chain:
+            return None
+        leaf_cert = chain[0]
+        return ChainEntry(
+            chain,
+            expiry=self.ssl_verifier.check_expiry(leaf_cert),
+            hostname_match=self.ssl_verifier.verify_hostname(leaf_cert, hostname),
+            metadata=self._assess_metadata(leaf_cert)
+        )
+
+    async def verify(self, url: str, web_ip: str = None, mobile_ip: str = None, proximity: dict = None,
+                     force_fresh: bool = False, prepared: Dict[str, Any] = None,
+                     deadline: Deadline = None) -> Dict[str, Any]:
         """
         Performs deep verification and calculates Trust Score.
+        URL-only stages come from `prepared` (computed speculatively at session init) or
+        the pre-warmed verdict cache when available; the per-session checks are always
+        applied on top.
         Proximity: BT proximity data from session (if available)
+        force_fresh: bypass all caches and do a new TLS handshake (high-assurance checks)
+        deadline: overall budget of the request (see verify_url)
+        """
+        if prepared is not None and not force_fresh and self.is_cacheable(prepared):
+            return self._apply_session_checks(prepared, web_ip=web_ip, mobile_ip=mobile_ip, proximity=proximity)
+        key = self._target_key(url)
+        result = None
+        if key and not (force_fresh or settings.VERIFY_FORCE_FRESH):
+            result = self.verdict_cache.get(key)
+        if result is None:
+            result = await self.verify_url(url, force_fresh=force_fresh, deadline=deadline)
+            if key and self.is_cacheable(result) and self.is_whitelisted(result):
+                self.verdict_cache.put(key, result)
+        return self._apply_session_checks(result, web_ip=web_ip, mobile_ip=mobile_ip, proximity=proximity)
+
+    def _apply_session_checks(self, result: Dict[str, Any], web_ip: str = None, mobile_ip: str = None,
+                              proximity: dict = None) -> Dict[str, Any]:
+        """Per-session layer over a (possibly shared, cached) URL verdict. Never mutates `result`."""
+        return {
+            "score": result["score"],
+            "verdict": result["verdict"],
+            "logs": list(result["logs"]),
+            "details": dict(result["details"])
+        }
+
+    @staticmethod
+    def _target_key(url: str) -> Tuple[str, int] | None:
+        try:
+            parsed = urlparse(url)
+            return (parsed.hostname, parsed.port or 443) if parsed.hostname else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    def is_cacheable(result: Dict[str, Any]) -> bool:
+        """Only share verdicts that didn't hit a transient failure (unreachable host, timeouts)."""
+        details = result.get("details") or {}
+        revocation = str(details.get("revocation", ""))
+        return (
+            details.get("ssl_valid") != "FAIL"
+            and "timeout" not in revocation
+            and "degraded" not in revocation
+            and "deadline_exceeded" not in details
+        )
+
+    @staticmethod
+    def is_whitelisted(result: Dict[str, Any]) -> bool:
+        """
+        Whether the verdict is for a whitelisted host. Only those are worth caching: a
+        rejection costs no handshake to recompute, and arbitrary URLs would fill the cache.
+        """
+        return (result.get("details") or {}).get("whitelist") == "PASS"
+
+    async def verify_url(self, url: str, force_fresh: bool = False, deadline: Deadline = None) -> Dict[str, Any]:
         """
+        URL-only stages: whitelist, TLS chain, expiry, hostname, revocation and metadata.
+        The result is independent of the session, so it can be cached and shared.
+
+        Stages run cheapest first and each failure returns at once, so a host off the
+        whitelist never costs a handshake and a bad chain never costs a CRL download.
+        Expiry, hostname and metadata come precomputed with the chain; revocation races
+        its sources (see _check_revocation). Milliseconds per stage go to details["timings_ms"].
+
+        Every stage gets what is left of `deadline` (default: VERIFY_DEADLINE from now), capped
+        by its own timeout. Out of time before the chain is known, the verdict is ERROR; out of
+        time during revocation, it is partial (revocation UNKNOWN, REVOCATION_DEGRADED_POLICY
+        applies, but never milder than "caution"). Either way details["deadline_exceeded"] names the stage and nothing is cached.
+        """
+        deadline = deadline or Deadline(settings.VERIFY_DEADLINE)
         score = 100
         logs = []
-        is_trusted = False
         
         parsed = urlparse(url)
-        hostname = parsed.netloc
+        try:
+            hostname = parsed.hostname
+            port = parsed.port or 443
+        except ValueError:
+            hostname = None
         scheme = parsed.scheme.lower()
         
         if not hostname:
@@ -39,8 +182,10 @@ class VerificationEngine:
             "hostname_match": "UNKNOWN",
             "chain_integrity": "UNKNOWN",
             "ip_correlation": "SKIPPED",
-            "bt_proximity": "UNKNOWN"
+            "bt_proximity": "UNKNOWN",
+            "timings_ms": {}
         }            
+        timings = details["timings_ms"]
         
 
         # 1. Whitelist Check (40%)
@@ -48,7 +193,11 @@ class VerificationEngine:
         # Plan says: Whitelist is CRITICAL (40%). 
         # Actually plan says: Status Whitelist vs gov.pl list -> CRITICAL (40). Fail -> Score 0.
         
-        if self.tar.is_trusted(url):
+        # In-memory index lookup; refreshes happen in the background (see TrustAnchorRepository)
+        started = time.perf_counter()
+        trusted = self.tar.is_trusted_host(hostname)
+        timings["whitelist"] = _elapsed_ms(started)
+        if trusted:
             details["whitelist"] = "PASS"
             logs.append("Domain is in official whitelist.")
         else:
@@ -58,18 +207,31 @@ class VerificationEngine:
             return self._build_result(score, logs, details)
 
         # 2. SSL Connection & Chain (10%)
-        chain = self.ssl_verifier.get_cert_chain(hostname)
-        if not chain:
+        started = time.perf_counter()
+        try:
+            # A shared (single-flight) load keeps TLS_STAGE_TIMEOUT; this request stops waiting at its deadline
+            entry = await asyncio.wait_for(
+                _detached(self.chain_cache.get(hostname, port, force_fresh=force_fresh or settings.VERIFY_FORCE_FRESH)),
+                deadline.remaining()
+            )
+        except asyncio.TimeoutError:
+            entry = None
+            if deadline.expired:
+                timings["tls"] = _elapsed_ms(started)
+                return self._deadline_result("tls", logs, details)
+            logs.append(f"TLS handshake timed out after {settings.TLS_STAGE_TIMEOUT}s.")
+        timings["tls"] = _elapsed_ms(started)
+        if not entry:
             details["ssl_valid"] = "FAIL"
             logs.append("Failed to retrieve SSL certificate.")
             score -= 10 # Cannot verify anything else
             return self._build_result(score, logs, details)
         
         details["ssl_valid"] = "PASS"
-        leaf_cert = chain[0] # The server cert
+        leaf_cert = entry.leaf # The server cert
         
         # 2.1 Check Expiry (Implicitly critical part of SSL validity)
-        is_valid_date, reason_date = self.ssl_verifier.check_expiry(leaf_cert)
+        is_valid_date, reason_date = entry.expiry
         if not is_valid_date:
             details["ssl_valid"] = f"FAIL ({reason_date})"
             logs.append(f"Certificate validity check failed: {reason_date}")
@@ -78,7 +240,7 @@ class VerificationEngine:
 
         # 3. Hostname Verification (25%)
         # Plan: HIGH (25%). Fail -> Score 0.
-        if self.ssl_verifier.verify_hostname(leaf_cert, hostname):
+        if entry.hostname_match:
             details["hostname_match"] = "PASS"
             logs.append("Certificate matches hostname.")
         else:
@@ -89,67 +251,183 @@ class VerificationEngine:
 
         # 4. Revocation Check (20%)
         # Plan: HIGH (20%). Fail -> Score 0.
-        # We need issuer for OCSP. Python's basic SSL doesn't easily give issuer cert unless we fetch full chain.
-        # We will attempt check if we can. If we only have leaf, we might skip or try to find issuer URL (AIA).
-        # ssl_verifier.check_revocation handles missing issuer gracefully (skips OCSP if no issuer but tries CRL).
-        # However, plan says "Mandatory Real Time Revocation Checks".
-        # We passed only leaf cert. Let's assume we can't fully do OCSP without issuer. 
-        # CRL usually works with just leaf as it has the URL.
-        
-        # Attempt to get issuer from chain if available, else None
-        issuer = chain[1] if len(chain) > 1 else None
+        # OCSP needs the issuer. The chain carries it when the server sent it or when it was
+        # fetched via AIA caIssuers; _check_revocation falls back to CRL without it.
+        issuer = entry.issuer
+        ocsp_urls, crl_urls = self.ssl_verifier.revocation_sources(leaf_cert)
         
-        is_revoked, reason = self.ssl_verifier.check_revocation(leaf_cert, issuer)
+        started = time.perf_counter()
+        deadline_hit = False
+        try:
+            is_revoked, reason = await asyncio.wait_for(
+                self._check_revocation(leaf_cert, issuer, ocsp_urls, crl_urls, timings, deadline),
+                deadline.budget(settings.REVOCATION_STAGE_TIMEOUT)
+            )
+        except asyncio.TimeoutError:
+            # Same outcome as an unreachable OCSP/CRL endpoint, but made visible in details
+            is_revoked, reason = False, "Timeout"
+            deadline_hit = deadline.expired
+            if not deadline_hit:
+                details["revocation"] = "UNKNOWN (timeout)"
+                logs.append(f"Revocation check timed out after {settings.REVOCATION_STAGE_TIMEOUT}s.")
+        timings["revocation"] = _elapsed_ms(started)
+
+        # Circuit breakers of this certificate's OCSP/CRL endpoints (see http_client.py)
+        breakers = self.ssl_verifier.http.breaker_states(ocsp_urls + crl_urls)
+        details["revocation_breakers"] = breakers
+        open_endpoints = [endpoint for endpoint, state in breakers.items() if state != "closed"]
+        unavailable = reason == "Unavailable"
+        if deadline_hit or unavailable or (not is_revoked and reason in ("Not Revoked", "Timeout") and open_endpoints):
+            # No answer because the budget ran out, every source failed or known-bad endpoints
+            # were skipped: partial verdict under the degraded-mode policy
+            if deadline_hit:
+                details["revocation"] = "UNKNOWN (deadline)"
+                details["deadline_exceeded"] = "revocation"
+                logs.append("Verification deadline reached before revocation status was known.")
+            else:
+                details["revocation"] = "UNKNOWN (degraded)"
+                if open_endpoints:
+                    logs.append(f"Revocation status unavailable, circuit open for {', '.join(open_endpoints)}.")
+                else:
+                    logs.append("Revocation status unavailable, no OCSP/CRL source answered.")
+            policy = settings.REVOCATION_DEGRADED_POLICY
+            if deadline_hit and policy == "pass":
+                # A check we gave up on is never as good as a clean one, whatever the policy
+                policy = "caution"
+            if policy == "fail":
+                logs.append("Degraded-mode policy: fail.")
+                score = 0
+                return self._build_result(score, logs, details)
+            if policy == "caution":
+                logs.append(f"Degraded-mode policy: caution (-{settings.REVOCATION_DEGRADED_PENALTY}).")
+                score -= settings.REVOCATION_DEGRADED_PENALTY
+
         if is_revoked:
             details["revocation"] = f"FAIL ({reason})"
             logs.append(f"Certificate is REVOKED: {reason}")
             score = 0
             return self._build_result(score, logs, details)
-        else:
+        elif details["revocation"] == "UNKNOWN":
             details["revocation"] = "PASS"
-            logs.append("Certificate is NOT revoked (OCSP/CRL checked).")
+            logs.append(f"Certificate is NOT revoked ({reason}).")
 
         # 5. Metadata / Chain Integrity (Remaining 5% - 15%)
         # Plan says: Chain Integrity (10%), Metadata (5%).
         # Since we are here, we assume basic SSL handshake worked, so chain is likely trusted by system.
         details["chain_integrity"] = "PASS" # Implicitly pass if we got here via standard lib or assumed
         
-        # 5.1 Suspicious Metadata Checks (can reduce score to trigger CAUTION)
+        # 5.1 Suspicious Metadata Checks (precomputed with the chain, can reduce score to trigger CAUTION)
+        metadata = entry.metadata
+        score -= metadata["penalty"]
+        if metadata["unsafe"]:
+            score = 0
+        logs.extend(metadata["logs"])
+        details["metadata"] = metadata["label"]
+        
+        return self._build_result(score, logs, details)
+
+    async def _check_revocation(self, cert: x509.Certificate, issuer: Optional[x509.Certificate],
+                                ocsp_urls: List[str], crl_urls: List[str], timings: Dict[str, float],
+                                deadline: Optional[Deadline] = None) -> Tuple[bool, str]:
+        """
+        Races the revocation sources on the executor. OCSP (one small request) starts first;
+        every CRL distribution point starts REVOCATION_HEDGE_DELAY seconds later, or at once
+        if OCSP returns without an answer or isn't available. The first definitive answer
+        wins and the rest are cancelled - their downloads still finish in the background and
+        fill the caches. OCSP only answers once the response is authenticated (see
+        SSLVerifier._query_ocsp), so a forged GOOD can't beat the CRL. If sources were raced
+        but none answered, the reason is "Unavailable" and verify applies the degraded-mode
+        policy; a certificate without any sources counts as not revoked, as before.
+        Each source's HTTP timeouts are cut to what is left of `deadline`.
+        """
+        crl_urls = list(crl_urls)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        pending: Dict[asyncio.Future, str] = {}
+
+        def launch(label: str, func: Callable, *args):
+            pending[loop.run_in_executor(self._executor, functools.partial(func, *args))] = label
+
+        def launch_crls(urls: List[str]):
+            for i, crl_url in enumerate(urls):
+                launch("crl" if i == 0 else f"crl{i + 1}", self.ssl_verifier.check_crl, cert, crl_url, deadline)
+            urls.clear()
+
+        if ocsp_urls and issuer:
+            launch("ocsp", self.ssl_verifier.check_ocsp, cert, issuer, ocsp_urls, deadline)
+        else:
+            launch_crls(crl_urls)
+        hedge_at = loop.time() + settings.REVOCATION_HEDGE_DELAY
+
+        raced = bool(pending)
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, hedge_at - loop.time()) if crl_urls else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    label = pending.pop(future)
+                    timings[label] = _elapsed_ms(started)
+                    try:
+                        answer = future.result()
+                    except Exception as e:
+                        logger.warning(f"Revocation source {label} failed: {e}")
+                        answer = None
+                    if answer is not None:
+                        return answer
+                # Hedge time reached, or everything so far came back empty: bring in the CRLs
+                if crl_urls and (not done or not pending):
+                    launch_crls(crl_urls)
+        finally:
+            for future in pending:
+                future.cancel()
+        return False, "Unavailable" if raced else "Not Revoked"
+
+    def _assess_metadata(self, leaf_cert) -> Dict[str, Any]:
+        """Suspicious-metadata heuristics for the leaf certificate: score penalty, logs and a details label."""
+        penalty = 0
+        unsafe = False
+        logs = []
+        labels = []
         now = datetime.now(timezone.utc)
         
         # Check if certificate is very new (possible phishing campaign)
         cert_age = (now - leaf_cert.not_valid_before_utc).days
         if cert_age < 7:
-            score -= 15
+            penalty += 15
             logs.append(f"CAUTION: Certificate is very new ({cert_age} days old). Possible phishing.")
-            details["metadata"] = "SUSPICIOUS_NEW_CERT"
+            labels.append("SUSPICIOUS_NEW_CERT")
         
         # Check if certificate expires soon (legitimate sites renew early)
         days_until_expiry = (leaf_cert.not_valid_after_utc - now).days
         if days_until_expiry < 30:
-            score -= 10
+            penalty += 10
             logs.append(f"CAUTION: Certificate expires soon ({days_until_expiry} days remaining).")
-            if "metadata" in details:
-                details["metadata"] += ",EXPIRING_SOON"
-            else:
-                details["metadata"] = "EXPIRING_SOON"
+            labels.append("EXPIRING_SOON")
         
         # Check if self-signed (issuer == subject)
         if leaf_cert.issuer == leaf_cert.subject:
-            score = 0
+            unsafe = True
             logs.append("UNSAFE: Self-signed certificate detected.")
-            if "metadata" in details:
-                details["metadata"] += ",SELF_SIGNED"
-            else:
-                details["metadata"] = "SELF_SIGNED"
+            labels.append("SELF_SIGNED")
         
-        if "metadata" not in details:
-            details["metadata"] = "PASS"
-        
-        return self._build_result(score, logs, details)
+        return {
+            "penalty": penalty,
+            "unsafe": unsafe,
+            "logs": logs,
+            "label": ",".join(labels) if labels else "PASS"
+        }
+
+    def _deadline_result(self, stage: str, logs: list, details: dict) -> Dict[str, Any]:
+        """Out of time before the certificate could be judged: ERROR, not a guess."""
+        details["deadline_exceeded"] = stage
+        logs.append(f"Verification deadline reached during the {stage} stage; result incomplete.")
+        return self._build_result(0, logs, details, verdict="ERROR")
 
-    def _build_result(self, score: int, logs: list, details: dict) -> Dict[str, Any]:
-        verdict = "TRUSTED" if score >= 90 else "CAUTION" if score >= 70 else "UNSAFE"
+    def _build_result(self, score: int, logs: list, details: dict, verdict: str = None) -> Dict[str, Any]:
+        verdict = verdict or ("TRUSTED" if score >= 90 else "CAUTION" if score >= 70 else "UNSAFE")
         return {
             "score": score,
             "verdict": verdict,
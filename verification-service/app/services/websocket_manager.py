@@ -1,8 +1,17 @@
-from typing import Dict, Set
+from typing import Dict, Optional, Set, Tuple
 from fastapi import WebSocket
+import functools
 import json
 import logging
 import asyncio
+import time
+import uuid
+
+from app.core import metrics
+from app.core.config import settings
+from app.services.broker import Broker
+from app.services.mailbox import Mailbox, make_mailbox
+from app.services.session_manager import session_manager
 
 logger = logging.getLogger(__name__)
 
@@ -10,82 +19,231 @@ class WebSocketManager:
     """
     Manages WebSocket connections for mobile devices.
     Maps logical channel keys (e.g. BLE UUIDs) to WebSocket connections.
+
+    Sockets live on whichever worker accepted them, so messages go through the broker:
+    each worker subscribes to "ws:<channel_key>" for as long as it holds a socket for that
+    key and forwards what arrives to its local sockets. The verify request can therefore
+    land on any worker or replica, with no sticky routing.
+
+    The phone often connects after verification finished, so every message is also put
+    in the channel's mailbox before it is published, and connect() flushes the mailbox
+    to the new socket once its subscription is live. A socket can see a message both
+    ways; ids delivered to each socket are remembered so it gets each message once.
+
+    On the wire between workers a message is "<id> <sent_at> <json>": the JSON is what
+    the phone receives, serialised once by the sender and never re-encoded.
+
+    Delivery to a channel's sockets runs concurrently, with at most `send_concurrency`
+    sends in flight on this worker. A socket that doesn't take a message within
+    `send_timeout` seconds is evicted (closed) so it can't hold up anyone else.
     """
     MAX_CONNECTIONS_PER_NONCE = 5  # Limit connections per channel to prevent abuse
-    
-    def __init__(self):
-        # Map channel_key (nonce or BLE UUID) -> Set of WebSocket connections
+
+    def __init__(self, broker: Broker, mailbox: Mailbox,
+                 send_timeout: float = settings.WS_SEND_TIMEOUT,
+                 send_concurrency: int = settings.WS_SEND_CONCURRENCY):
+        self.broker = broker
+        self.mailbox = mailbox
+        self.send_timeout = send_timeout
+        self._send_slots = asyncio.Semaphore(send_concurrency)
+        # Map channel_key (nonce or BLE UUID) -> Set of WebSocket connections on this worker
         self.active_connections: Dict[str, Set[WebSocket]] = {}
-    
+        # channel_key -> (task relaying broker messages to the local sockets, future set once
+        # its subscription is live). Dropped when the task ends, so the next connect resubscribes.
+        self._listeners: Dict[str, Tuple[asyncio.Task, asyncio.Future]] = {}
+        # socket -> ids of the messages already sent to it
+        self._delivered: Dict[WebSocket, Set[str]] = {}
+        self._stats = {
+            "sent": 0, "delivered_live": 0, "delivered_mailbox": 0, "duplicates": 0,
+            # dropped: a message a socket didn't get; evicted: sockets closed for being too slow
+            "send_errors": 0, "dropped": 0, "evicted": 0,
+        }
+        # Seconds from verification result to the phone's socket, by delivery path
+        self._latency = {
+            "live": metrics.histogram("ws_delivery_live_seconds"),
+            "mailbox": metrics.histogram("ws_delivery_mailbox_seconds"),
+        }
+
+    @staticmethod
+    def _broker_channel(channel_key: str) -> str:
+        return f"ws:{channel_key}"
+
     async def connect(self, websocket: WebSocket, channel_key: str):
         """Register a WebSocket connection for a logical channel (typically BLE UUID)"""
 
         logger.warning("___________________________________SEEEEEEEEEEEEEEEEEEEEEEEEEEEEX")
         await websocket.accept()
-        
+
         if channel_key not in self.active_connections:
             self.active_connections[channel_key] = set()
-        
+
         # Check connection limit
         if len(self.active_connections[channel_key]) >= self.MAX_CONNECTIONS_PER_NONCE:
             logger.warning(f"Connection limit reached for channel: {channel_key}")
             await websocket.close(code=1008, reason="Too many connections for this session")
             return
-        
+
         self.active_connections[channel_key].add(websocket)
+        self._delivered[websocket] = set()
+        listener = self._listeners.get(channel_key)
+        if listener is None:
+            subscribed = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._listen(channel_key, subscribed))
+            listener = self._listeners[channel_key] = (task, subscribed)
+            task.add_done_callback(functools.partial(self._listener_done, channel_key, listener))
+        # Don't report the socket as connected before this worker can receive its messages;
+        # every connector waits, not just the one that started the listener. Shielded so a
+        # connector going away doesn't cancel the subscription for the others.
+        await asyncio.shield(listener[1])
         logger.info(
             f"WebSocket connected for channel: {channel_key}. "
             f"Total connections for this channel: {len(self.active_connections[channel_key])}"
         )
-    
+
+        # Anything sent before now is in the mailbox; anything after arrives through the
+        # subscription (possibly both - _send skips repeats)
+        try:
+            pending = await self.mailbox.read(channel_key)
+        except Exception as e:
+            logger.error(f"Reading mailbox for channel {channel_key} failed: {e}")
+            return
+        for envelope in pending:
+            if not await self._send(websocket, *self._unpack(envelope), "mailbox"):
+                await self._evict(websocket, channel_key)
+                break
+
     def disconnect(self, websocket: WebSocket, channel_key: str):
         """Remove a WebSocket connection"""
+        self._delivered.pop(websocket, None)
         if channel_key in self.active_connections:
             self.active_connections[channel_key].discard(websocket)
-            
-            # Clean up empty sets
+
+            # Clean up empty sets, and stop listening once this worker has no socket left
             if not self.active_connections[channel_key]:
                 del self.active_connections[channel_key]
-            
+                listener = self._listeners.pop(channel_key, None)
+                if listener is not None:
+                    listener[0].cancel()
+
             logger.info(f"WebSocket disconnected for channel: {channel_key}")
-    
-    async def send_verification_success(self, channel_key: str, verification_result: dict):
+
+    def _listener_done(self, channel_key: str, listener: Tuple[asyncio.Task, asyncio.Future], task: asyncio.Task):
+        # A relay that died (broker error) must not stay registered, or no later connect on
+        # this channel would ever subscribe again
+        if self._listeners.get(channel_key) is listener:
+            del self._listeners[channel_key]
+
+    async def _listen(self, channel_key: str, subscribed: asyncio.Future):
+        try:
+            async with self.broker.subscribe(self._broker_channel(channel_key)) as subscription:
+                subscribed.set_result(None)
+                while True:
+                    message = await subscription.get()
+                    await self._send_local(channel_key, message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket relay for channel {channel_key} failed: {e}")
+        finally:
+            if not subscribed.done():
+                subscribed.set_result(None)
+
+    @staticmethod
+    def _unpack(envelope: str):
+        message_id, sent_at, payload = envelope.split(" ", 2)
+        return message_id, float(sent_at), payload
+
+    async def _send(self, websocket: WebSocket, message_id: str, sent_at: float, payload: str, path: str) -> bool:
         """
-        Send verification success message to all connected clients for this channel.
+        Send one message to one socket unless it already has it. False if the socket
+        failed or was too slow and should be dropped.
         """
-        # Wait up to 3 seconds for a mobile client to connect
-        if channel_key not in self.active_connections or not self.active_connections.get(channel_key):
-            logger.info(f"No WebSocket yet for channel {channel_key}, waiting up to 3s")
-            for _ in range(30):  # 30 * 0.1s = 3s
-                await asyncio.sleep(0.1)
-                if channel_key in self.active_connections and self.active_connections[channel_key]:
-                    break
-            else:
-                logger.warning(f"No WebSocket connections found for channel: {channel_key} (waited 3s)")
-                return
-        
-        message = {
+        delivered = self._delivered.get(websocket)
+        if delivered is None:
+            return True  # disconnected meanwhile
+        if message_id in delivered:
+            self._stats["duplicates"] += 1
+            return True
+        # Mark before awaiting so the relay and a mailbox flush can't both send it
+        delivered.add(message_id)
+        try:
+            # Waiting for a slot doesn't count against the socket, only the send itself
+            async with self._send_slots:
+                await asyncio.wait_for(websocket.send_text(payload), self.send_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket didn't take a message within {self.send_timeout}s; evicting it")
+            self._stats["dropped"] += 1
+            self._stats["evicted"] += 1
+            return False
+        except Exception as e:
+            logger.error(f"Error sending message to WebSocket: {e}")
+            self._stats["dropped"] += 1
+            self._stats["send_errors"] += 1
+            return False
+        self._stats[f"delivered_{path}"] += 1
+        self._latency[path].observe(max(0.0, time.time() - sent_at))
+        return True
+
+    async def _evict(self, websocket: WebSocket, channel_key: str):
+        self.disconnect(websocket, channel_key)
+        try:
+            # A stuck peer may not take the close frame either; don't wait on it for long
+            await asyncio.wait_for(websocket.close(code=1013, reason="Too slow"), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _send_local(self, channel_key: str, message: str):
+        # Create a copy of the connections set to avoid RuntimeError if set is modified during iteration
+        # This prevents race conditions when disconnect() is called concurrently
+        connections_copy = list(self.active_connections.get(channel_key, ()))
+        if not connections_copy:
+            return
+
+        message_id, sent_at, payload = self._unpack(message)
+        results = await asyncio.gather(*(
+            self._send(websocket, message_id, sent_at, payload, "live") for websocket in connections_copy
+        ))
+        logger.info(f"Sent verification success to {sum(results)} WebSocket(s) for channel: {channel_key}")
+
+        # Clean up failed and slow sockets
+        for ws, ok in zip(connections_copy, results):
+            if not ok:
+                await self._evict(ws, channel_key)
+
+    async def send_verification_success(self, channel_key: str, verification_result: dict,
+                                        verified_at: Optional[float] = None):
+        """
+        Send verification success message to all connected clients for this channel,
+        on whichever workers they are connected to, and to any that connect within
+        WS_MAILBOX_TTL seconds. Returns without waiting for a phone to show up.
+        """
+        payload = json.dumps({
             "type": "verification_success",
             "channel": channel_key,
             "result": verification_result
-        }
-        
-        # Create a copy of the connections set to avoid RuntimeError if set is modified during iteration
-        # This prevents race conditions when disconnect() is called concurrently
-        connections_copy = list(self.active_connections[channel_key])
-        
-        disconnected = set()
-        for websocket in connections_copy:
-            try:
-                await websocket.send_json(message)
-                logger.info(f"Sent verification success to WebSocket for channel: {channel_key}")
-            except Exception as e:
-                logger.error(f"Error sending message to WebSocket: {e}")
-                disconnected.add(websocket)
-        
-        # Clean up disconnected sockets
-        for ws in disconnected:
-            self.disconnect(ws, channel_key)
+        })
+        sent_at = verified_at if verified_at is not None else time.time()
+        envelope = f"{uuid.uuid4().hex} {sent_at!r} {payload}"
+        self._stats["sent"] += 1
+
+        # Mailbox first: a socket that connects after the publish still finds it there
+        try:
+            await self.mailbox.put(channel_key, envelope)
+        except Exception as e:
+            logger.error(f"Storing WebSocket message for channel {channel_key} failed: {e}")
+        receivers = await self.broker.publish(self._broker_channel(channel_key), envelope)
+        if not receivers:
+            logger.info(f"No WebSocket connected yet for channel {channel_key}; message left in mailbox")
+
+    def stats(self) -> dict:
+        return dict(
+            self._stats,
+            channels=len(self.active_connections),
+            sockets=sum(len(s) for s in self.active_connections.values()),
+        )
 
 # Global instance
-websocket_manager = WebSocketManager()
\ No newline at end of file
+websocket_manager = WebSocketManager(
+    session_manager.broker,
+    make_mailbox(session_manager.redis, settings.WS_MAILBOX_TTL, settings.WS_MAILBOX_MAX_MESSAGES),
+)
@@ -1,34 +1,50 @@
+import asyncio
 import time
 import requests
 import os
 import json
 from pathlib import Path
 from urllib.parse import urlparse
-from typing import Set
+from typing import Set, List
 from app.core.config import settings
+from app.services.domain_index import DomainIndex
+from app.services.http_client import HTTPClient, http_client as shared_http_client
+from app.services.whitelist_snapshot import SnapshotIndex, domains_from_document, open_snapshot, write_snapshot
 
 
 class TrustAnchorRepository:
-    def __init__(self, api_url: str = None, cache_ttl: int = 3600, json_file_path: str = None):
+    def __init__(self, api_url: str = None, cache_ttl: int = 3600, json_file_path: str = None,
+                 snapshot_path: str = None, http_client: HTTPClient = None):
         """
         Initialize TrustAnchorRepository with API-based whitelist.
         
         Args:
             api_url: URL to the Polish government API for domain whitelist
-            cache_ttl: Cache time-to-live in seconds (default: 1 hour)
+            cache_ttl: Background refresh interval in seconds (default: 1 hour)
             json_file_path: Optional path to JSON file for initial cache loading
+            snapshot_path: Optional path to the binary snapshot (see whitelist_snapshot.py),
+                mmap'd read-only and shared by all workers; rebuilt from JSON/API when stale
+            http_client: Pooled HTTP client for the API pages (default: the shared one)
         """
         self.api_url = api_url or "https://api.dane.gov.pl/1.4/resources/63616,lista-nazw-domeny-govpl-z-usuga-www/data"
         self.cache_ttl = cache_ttl
+        self.http = http_client or shared_http_client
         self.json_file_path = json_file_path or os.path.join(
             Path(__file__).parent.parent, "data", "official_domains.json"
         )
+        self.snapshot_path = snapshot_path or str(Path(self.json_file_path).with_suffix(".gvwl"))
         
-        # Cache for domains set
-        self._domains_cache: Set[str] = set()
+        # Compiled lookup index: in-memory DomainIndex or mmap'd SnapshotIndex, swapped as a whole
+        self._index: DomainIndex | SnapshotIndex = DomainIndex(())
         self._cache_timestamp: float = 0
+        self._source: str | None = None
         
-        # Load initial whitelist (try JSON first, then API)
+        # Refresh bookkeeping exposed via stats()
+        self._last_refresh_attempt: float = 0
+        self._refresh_failures: int = 0
+        self._last_error: str | None = None
+        
+        # Load initial whitelist (try JSON first, then API). Later refreshes run in the background.
         self._load_repository()
 
     def _load_from_json(self) -> Set[str] | None:
@@ -46,25 +62,8 @@ class TrustAnchorRepository:
             with open(json_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
             
-            domains = set()
-            # Handle different JSON formats
-            if isinstance(data, list):
-                # Simple list format: ["gov.pl", "www.gov.pl", ...]
-                for domain in data:
-                    if isinstance(domain, str):
-                        domain = domain.lower().strip()
-                        domains.add(domain)
-                        if domain.startswith("www."):
-                            domains.add(domain[4:])
-            elif isinstance(data, dict):
-                # Object format: {"domains": ["gov.pl", ...]} or {"data": [...]}
-                domain_list = data.get("domains") or data.get("data") or []
-                for domain in domain_list:
-                    if isinstance(domain, str):
-                        domain = domain.lower().strip()
-                        domains.add(domain)
-                        if domain.startswith("www."):
-                            domains.add(domain[4:])
+            # Handle different JSON formats: ["gov.pl", ...], {"domains": [...]}, {"data": [...]}
+            domains = domains_from_document(data)
             
             if domains:
                 print(f"  → Loaded {len(domains)} domains from JSON file")
@@ -92,7 +91,7 @@ class TrustAnchorRepository:
         try:
             while next_url:
                 print(f"  → Fetching page {page} from API...")
-                response = requests.get(next_url, timeout=10)
+                response = self.http.get(next_url, timeout=10)
                 response.raise_for_status()
                 
                 data = response.json()
@@ -132,26 +131,30 @@ class TrustAnchorRepository:
             print(f"❌ ERROR parsing API response: {e}")
             raise
 
-    def _load_repository(self):
+    def _load_repository(self) -> bool:
         """
-        Load whitelist from JSON file (if available) or API and cache it.
-        Uses cached data if still valid.
+        Load whitelist from JSON file (if available) or API and swap it in.
+        Runs at startup and then from the background refresh loop, never on the request path.
+        On failure the last-good snapshot stays in place. Returns True if a new snapshot was loaded.
         """
-        # Check if cache is still valid
         current_time = time.time()
-        if self._domains_cache and (current_time - self._cache_timestamp) < self.cache_ttl:
-            print(f"✅ Using cached whitelist ({len(self._domains_cache)} domains)")
-            return
+        self._last_refresh_attempt = current_time
+        
+        # Fastest path: a binary snapshot at least as new as the JSON file
+        if self._snapshot_is_current():
+            snapshot = open_snapshot(self.snapshot_path)
+            if snapshot is not None:
+                self._set_index(snapshot, source="snapshot", loaded_at=current_time)
+                print(f"✅ Loaded {len(self._index)} domains from snapshot {self.snapshot_path}")
+                return True
         
         # Try loading from JSON file first (for initial cache)
         json_domains = self._load_from_json()
         if json_domains:
-            self._domains_cache = json_domains
-            self._cache_timestamp = current_time
-            print(f"✅ Loaded {len(self._domains_cache)} domains from JSON cache")
-            # Optionally refresh from API in background (but don't block)
+            self._set_domains(json_domains, source="json", loaded_at=current_time)
+            print(f"✅ Loaded {len(self._index)} domains from JSON cache")
             # For now, we'll use JSON if available and only fetch from API if JSON fails
-            return
+            return True
         
         # If JSON not available or failed, try API
         try:
@@ -159,11 +162,7 @@ class TrustAnchorRepository:
             domains = self._fetch_all_pages()
             
             if domains:
-                self._domains_cache = domains
-                self._cache_timestamp = current_time
-                print(f"✅ Loaded {len(self._domains_cache)} domains from API whitelist")
-                
-                # Optionally save to JSON file for next time
+                # Optionally save to JSON file for next time (before the snapshot, so the snapshot is newer)
                 try:
                     json_path = Path(self.json_file_path)
                     json_path.parent.mkdir(parents=True, exist_ok=True)
@@ -172,26 +171,93 @@ class TrustAnchorRepository:
                     print(f"  → Saved whitelist to JSON cache: {json_path}")
                 except Exception as save_error:
                     print(f"  → Warning: Could not save to JSON cache: {save_error}")
+                
+                self._set_domains(domains, source="api", loaded_at=current_time)
+                print(f"✅ Loaded {len(self._index)} domains from API whitelist")
+                return True
             else:
                 raise ValueError("No domains fetched from API")
                 
         except Exception as e:
             print(f"❌ ERROR loading TAR from API: {e}")
+            self._refresh_failures += 1
+            self._last_error = str(e)
             # If we have JSON cache from before, keep using it
-            if self._domains_cache:
-                print(f"⚠️  Keeping existing cache ({len(self._domains_cache)} domains)")
-                return
+            if len(self._index):
+                print(f"⚠️  Keeping existing cache ({len(self._index)} domains)")
+                return False
             
-            # Initialize with hardcoded fallback for critical domains
-            self._domains_cache = {
+            # Initialize with hardcoded fallback for critical domains.
+            # Not stamped as a successful load, so refresh_age keeps growing until a real one succeeds.
+            self._set_domains({
                 "gov.pl",
                 "www.gov.pl",
                 "podatki.gov.pl",
                 "moje.gov.pl",
                 "pacjent.gov.pl",
                 "profil-zaufany.pl"
-            }
-            print(f"⚠️  Using fallback whitelist with {len(self._domains_cache)} domains")
+            }, source="fallback", loaded_at=self._cache_timestamp)
+            print(f"⚠️  Using fallback whitelist with {len(self._index)} domains")
+            return False
+
+    async def run_refresh_loop(self):
+        """
+        Background refresh: every `cache_ttl` seconds rebuild the whitelist in a worker thread
+        and swap it in. Lookups keep using the current snapshot meanwhile. A failed refresh is
+        retried sooner (after 1/10 of the interval) but never drops the last-good snapshot.
+        """
+        retry_delay = max(self.cache_ttl / 10, 30)
+        # Startup may have ended on the hardcoded fallback; don't wait a full interval to retry
+        delay = self.cache_ttl if self._source in ("snapshot", "json", "api") else retry_delay
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                ok = await asyncio.to_thread(self._load_repository)
+            except Exception as e:
+                print(f"❌ Whitelist refresh crashed: {e}")
+                self._refresh_failures += 1
+                self._last_error = str(e)
+                ok = False
+            delay = self.cache_ttl if ok else retry_delay
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "domains": len(self._index),
+            "source": self._source,
+            "refresh_age_s": round(now - self._cache_timestamp, 1) if self._cache_timestamp else None,
+            "last_refresh_attempt_age_s": round(now - self._last_refresh_attempt, 1) if self._last_refresh_attempt else None,
+            "refresh_failures": self._refresh_failures,
+            "last_error": self._last_error,
+        }
+
+    def _snapshot_is_current(self) -> bool:
+        try:
+            snapshot_mtime = os.path.getmtime(self.snapshot_path)
+        except OSError:
+            return False
+        try:
+            return snapshot_mtime >= os.path.getmtime(self.json_file_path)
+        except OSError:
+            return True
+
+    def _set_domains(self, domains: Set[str], source: str, loaded_at: float):
+        """Publish freshly loaded domains, via the shared snapshot when it can be written."""
+        index = None
+        if source != "fallback":
+            try:
+                write_snapshot(domains, self.snapshot_path)
+                index = SnapshotIndex(self.snapshot_path)
+                print(f"  → Saved whitelist snapshot: {self.snapshot_path}")
+            except Exception as e:
+                print(f"  → Warning: Could not write whitelist snapshot: {e}")
+        self._set_index(index or DomainIndex(domains), source, loaded_at)
+
+    def _set_index(self, index: DomainIndex | SnapshotIndex, source: str, loaded_at: float):
+        # The index is fully built before this single reference swap; readers never see a partial one
+        self._index = index
+        self._source = source
+        self._cache_timestamp = loaded_at
 
     def is_trusted(self, url: str) -> bool:
         """
@@ -199,59 +265,39 @@ class TrustAnchorRepository:
         Supports exact match and parent domain matching.
         If TEST_SSL=True, allows all badssl.com subdomains for testing.
         """
-        # Reload if cache expired
-        self._load_repository()
-        
         try:
-            parsed = urlparse(url)
-            domain = parsed.netloc.lower().strip()
-            
-            # Remove port if present
-            if ':' in domain:
-                domain = domain.split(':')[0]
-            
-            # TEST_SSL mode: Allow all badssl.com subdomains for SSL testing
-            if settings.TEST_SSL and domain.endswith(".badssl.com"):
-                print(f"  → TEST_SSL mode: Allowing badssl.com domain: {domain}")
-                return True
-            
-            # Check for exact match
-            if domain in self._domains_cache:
-                return True
-            
-            # Also check without www. prefix if domain starts with www.
-            if domain.startswith("www."):
-                domain_without_www = domain[4:]
-                if domain_without_www in self._domains_cache:
-                    return True
-                
-            # Check for parent domains if not exact match
-            # e.g. "auth.podatki.gov.pl" -> checks "podatki.gov.pl", then "gov.pl"
-            # Security: Ensure at least TLD+1 matching (e.g., "gov.pl" not just "pl")
-            parts = domain.split('.')
-            for i in range(1, len(parts)-1):  # Ensure at least TLD+1 (e.g. gov.pl)
-                parent = ".".join(parts[i:])
-                if parent in self._domains_cache:
-                    return True
-                # Also check parent without www. prefix
-                if parent.startswith("www."):
-                    parent_without_www = parent[4:]
-                    if parent_without_www in self._domains_cache:
-                        return True
-            
-            return False
-        except Exception as e:
-            print(f"⚠️  Error checking domain trust: {e}")
+            hostname = urlparse(url).hostname
+        except ValueError:
             return False
+        return bool(hostname) and self.is_trusted_host(hostname)
+
+    def is_trusted_host(self, hostname: str) -> bool:
+        """
+        Hostname-level check (no URL parsing); `hostname` must not include a port.
+        Pure in-memory lookup against the current snapshot: never blocks on a refresh.
+        """
+        domain = hostname.lower().rstrip(".")
+
+        # TEST_SSL mode: Allow all badssl.com subdomains for SSL testing
+        if settings.TEST_SSL and domain.endswith(".badssl.com"):
+            print(f"  → TEST_SSL mode: Allowing badssl.com domain: {domain}")
+            return True
+
+        # Exact, "www." and parent-suffix (TLD+1 or longer) matches in one pass over the labels
+        return self._index.matches(domain)
+
+    def domains(self) -> List[str]:
+        """Snapshot of all whitelisted domains (used by the verdict warmer)."""
+        return list(self._index)
 
     def get_policy(self, domain: str) -> dict:
         """
         Get policy for a domain (for compatibility).
         Returns default policy since API doesn't provide policy info.
         """
-        if domain in self._domains_cache:
+        if self._index.contains(domain):
             return {"policy": "strict", "allowed_cas": []}
         return {}
 
 # Global instance
-trust_anchor_repository = TrustAnchorRepository()
+trust_anchor_repository = TrustAnchorRepository(cache_ttl=settings.WHITELIST_REFRESH_INTERVAL)
@@ -0,0 +1,244 @@
+"""
+Compact binary whitelist snapshot ("GVWL").
+
+The whitelist is stored pre-normalised as an open-addressing hash table holding every
+whitelisted domain and every parent suffix of one (the nodes of DomainIndex's trie, keyed
+by their full suffix), so a worker can mmap it read-only and answer lookups straight from
+the mapped pages: no JSON parsing, no normalisation and no per-worker copy (the OS shares
+the page cache between uvicorn workers). A lookup probes the hostname's suffixes shortest
+first and, like the trie, stops at the first one that isn't in the table.
+
+Layout (little-endian), version 3:
+
+    header   magic "GVWL" | u16 version | u16 flags | u32 domain_count | u32 slot_count
+             | u32 strings_size | 32-byte SHA-256 of everything after the header | 4 bytes padding
+    slots    slot_count x u64: (string_offset << 17) | (whitelisted << 16) | length, 0 for an
+             empty slot; slot_count is a power of two, a suffix lives at
+             crc32(suffix) & (slot_count - 1) or the first free slot after it (linear probing)
+    strings  UTF-8 domain bytes, concatenated; a parent suffix points into the tail of a domain
+
+Convert the JSON file (or a saved dane.gov.pl API response) with:
+
+    python -m app.services.whitelist_snapshot app/data/official_domains.json app/data/official_domains.gvwl
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Set
+from zlib import crc32
+
+MAGIC = b"GVWL"
+VERSION = 3
+HEADER = struct.Struct("<4sHHIII32s4x")
+SLOT = struct.Struct("<Q")
+SLOT_WHITELISTED = 1 << 16
+MAX_LOAD = 0.5
+
+
+class SnapshotError(ValueError):
+    """The file is not a valid whitelist snapshot (wrong magic, version, size or checksum)."""
+
+
+def normalize_domains(values: Iterable[Any]) -> Set[str]:
+    """
+    Normalise raw whitelist entries: lowercase, strip, and also add the bare domain for
+    "www." entries so both forms match. Accepts plain strings and dane.gov.pl API items
+    ({"attributes": {"col1": {"val": ...}}}).
+    """
+    domains = set()
+    for value in values:
+        if isinstance(value, dict):
+            value = ((value.get("attributes") or {}).get("col1") or {}).get("val")
+        if not isinstance(value, str):
+            continue
+        domain = value.lower().strip()
+        if not domain:
+            continue
+        domains.add(domain)
+        if domain.startswith("www."):
+            domains.add(domain[4:])
+    return domains
+
+
+def domains_from_document(data: Any) -> Set[str]:
+    """Domains from any supported JSON shape: a list, {"domains": [...]}, {"data": [...]} or an API page."""
+    if isinstance(data, list):
+        return normalize_domains(data)
+    if isinstance(data, dict):
+        return normalize_domains(data.get("domains") or data.get("data") or [])
+    return set()
+
+
+def build_snapshot(domains: Iterable[str]) -> bytes:
+    # suffix -> [offset of its bytes in `strings`, whitelisted]
+    nodes = {}
+    strings = bytearray()
+    for domain in sorted({domain.encode("utf-8") for domain in domains if domain}):
+        if len(domain) > 0xFFFF:
+            continue
+        if domain not in nodes:
+            offset = len(strings)
+            strings += domain
+            # Register the domain and its parent suffixes, up to one that is already known
+            start = 0
+            while domain[start:] not in nodes:
+                nodes[domain[start:]] = [offset + start, False]
+                dot = domain.find(b".", start)
+                if dot < 0:
+                    break
+                start = dot + 1
+        nodes[domain][1] = True
+
+    slot_count = 8
+    while slot_count * MAX_LOAD < len(nodes):
+        slot_count *= 2
+    mask = slot_count - 1
+    slots = [0] * slot_count
+    for suffix, (offset, whitelisted) in nodes.items():
+        slot = crc32(suffix) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = (offset << 17) | (SLOT_WHITELISTED if whitelisted else 0) | len(suffix)
+
+    body = struct.pack(f"<{slot_count}Q", *slots) + bytes(strings)
+    domain_count = sum(1 for _, whitelisted in nodes.values() if whitelisted)
+    header = HEADER.pack(MAGIC, VERSION, 0, domain_count, slot_count, len(strings), hashlib.sha256(body).digest())
+    return header + body
+
+
+def write_snapshot(domains: Iterable[str], path: str) -> None:
+    """Atomically (re)write a snapshot. Workers that already mapped the old file keep their view."""
+    data = build_snapshot(domains)
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, target)
+
+
+class SnapshotIndex:
+    """
+    Read-only, mmap-backed whitelist index with the same interface and matching rules as
+    DomainIndex. A lookup probes the hash table once per hostname label, from the TLD
+    down, until a suffix is missing or a whitelisted one matches.
+    """
+
+    def __init__(self, path: str, verify_checksum: bool = True):
+        with open(path, "rb") as f:
+            # mmap refuses empty files, so check the size before mapping
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise SnapshotError("file too small")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _flags, domain_count, slot_count, strings_size, checksum = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise SnapshotError("bad magic")
+        if version != VERSION:
+            raise SnapshotError(f"unsupported version {version}")
+        if slot_count == 0 or slot_count & (slot_count - 1):
+            raise SnapshotError("slot count is not a power of two")
+        if len(self._mm) != HEADER.size + slot_count * SLOT.size + strings_size:
+            raise SnapshotError("truncated or oversized file")
+        if verify_checksum and self._body_digest() != checksum:
+            raise SnapshotError("checksum mismatch")
+
+        self.path = path
+        self._size = domain_count
+        self._mask = slot_count - 1
+        self._strings_offset = HEADER.size + slot_count * SLOT.size
+        slots = memoryview(self._mm)[HEADER.size:self._strings_offset]
+        if sys.byteorder == "little":
+            # Zero-copy view of the mapped slots
+            self._slots = slots.cast("Q")
+        else:
+            self._slots = array("Q", slots)
+            self._slots.byteswap()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[str]:
+        for slot in self._slots:
+            if slot & SLOT_WHITELISTED:
+                start = self._strings_offset + (slot >> 17)
+                yield self._mm[start:start + (slot & 0xFFFF)].decode("utf-8")
+
+    def contains(self, domain: str) -> bool:
+        return bool(self._probe(domain.encode("utf-8")) & SLOT_WHITELISTED)
+
+    def matches(self, hostname: str) -> bool:
+        name = hostname.encode("utf-8")
+        count = name.count(b".") + 1
+        depth = 0
+        end = len(name)
+        while True:
+            dot = name.rfind(b".", 0, end)
+            slot = self._probe(name[dot + 1:])
+            if not slot:
+                return False
+            depth += 1
+            # A single-label entry only matches itself or under a "www" label (see DomainIndex)
+            if slot & SLOT_WHITELISTED and (depth > 1 or depth == count or name[:dot].rsplit(b".", 1)[-1] == b"www"):
+                return True
+            if dot < 0:
+                return False
+            end = dot
+
+    def _probe(self, key: bytes) -> int:
+        """The slot holding suffix `key`, or 0 if it isn't in the table."""
+        slots, mask, length = self._slots, self._mask, len(key)
+        index = crc32(key) & mask
+        slot = slots[index]
+        while slot:
+            if slot & 0xFFFF == length:
+                start = self._strings_offset + (slot >> 17)
+                if self._mm[start:start + length] == key:
+                    return slot
+            index = (index + 1) & mask
+            slot = slots[index]
+        return 0
+
+    def _body_digest(self) -> bytes:
+        # Hash in chunks so verification doesn't copy the whole file onto the heap
+        digest = hashlib.sha256()
+        for start in range(HEADER.size, len(self._mm), 1 << 20):
+            digest.update(self._mm[start:start + (1 << 20)])
+        return digest.digest()
+
+
+def open_snapshot(path: str) -> Optional[SnapshotIndex]:
+    """Open `path` if it exists and is valid, else None (callers fall back to JSON/API)."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return SnapshotIndex(path)
+    except (OSError, ValueError) as e:
+        print(f"  → Ignoring whitelist snapshot {path}: {e}")
+        return None
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) != 2:
+        print("usage: python -m app.services.whitelist_snapshot <input.json> <output.gvwl>")
+        return 2
+    source, target = argv
+    with open(source, "r", encoding="utf-8") as f:
+        domains = domains_from_document(json.load(f))
+    if not domains:
+        print(f"No domains found in {source}")
+        return 1
+    write_snapshot(domains, target)
+    index = SnapshotIndex(target)
+    print(f"Wrote {len(index)} domains to {target} ({os.path.getsize(target)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
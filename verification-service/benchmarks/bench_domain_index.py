@@ -0,0 +1,133 @@
+"""
+Microbenchmark: whitelist lookup with set-based parent-suffix walks vs the compiled DomainIndex
+and the mmap'd binary snapshot (SnapshotIndex).
+
+Builds a synthetic whitelist of N domains under a few public suffixes and times three workloads:
+
+    mixed      exact hits, subdomain (parent) hits, www. variants and misses, 2-4 labels deep
+    deep-hit   6 extra labels under a whitelisted domain
+    deep-miss  8 labels under a public suffix (e.g. a crafted a.b.c.d.e.f.g.h.gov.pl)
+
+The set walks pay a slice and a hash per parent suffix, so their cost grows with the
+hostname's depth; the trie stops at the first label that isn't in the whitelist. On short
+hostnames they are on par; the trie is what keeps deep and crafted hostnames cheap.
+
+Usage (from verification-service/):
+    python -m benchmarks.bench_domain_index --domains 100000 --lookups 500000
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from app.services.domain_index import DomainIndex
+from app.services.whitelist_snapshot import SnapshotIndex, write_snapshot
+
+SUFFIXES = ["gov.pl", "edu.pl", "com.pl", "org.pl", "pl"]
+
+
+def legacy_is_trusted(domains: set, domain: str) -> bool:
+    """The pre-index algorithm from TrustAnchorRepository.is_trusted, minus URL parsing."""
+    if domain in domains:
+        return True
+    if domain.startswith("www."):
+        if domain[4:] in domains:
+            return True
+    parts = domain.split('.')
+    for i in range(1, len(parts) - 1):
+        parent = ".".join(parts[i:])
+        if parent in domains:
+            return True
+        if parent.startswith("www."):
+            if parent[4:] in domains:
+                return True
+    return False
+
+
+def set_walk_is_trusted(domains: set, domain: str) -> bool:
+    """The simplest fast set-based alternative: same rules, suffixes sliced at each dot, no joins."""
+    if domain in domains:
+        return True
+    if domain.startswith("www.") and domain[4:] in domains:
+        return True
+    start = domain.find(".") + 1
+    while start:
+        following = domain.find(".", start)
+        if following < 0:
+            return False
+        if domain[start:] in domains:
+            return True
+        start = following + 1
+    return False
+
+
+def random_label(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(4, 14)))
+
+
+def build(count: int, lookups: int, seed: int = 7):
+    rng = random.Random(seed)
+    domains = {f"{random_label(rng)}.{rng.choice(SUFFIXES[:-1])}" for _ in range(count)}
+    listed = list(domains)
+    queries = []
+    for _ in range(lookups):
+        kind = rng.random()
+        base = rng.choice(listed)
+        if kind < 0.25:
+            queries.append(base)
+        elif kind < 0.5:
+            queries.append(f"{random_label(rng)}.{random_label(rng)}.{base}")
+        elif kind < 0.6:
+            queries.append(f"www.{base}")
+        else:
+            queries.append(f"{random_label(rng)}.{random_label(rng)}.{rng.choice(SUFFIXES)}")
+    return domains, queries
+
+
+def deep_queries(domains: set, lookups: int, seed: int = 11):
+    rng = random.Random(seed)
+    listed = sorted(domains)
+    hits = [".".join(random_label(rng) for _ in range(6)) + "." + rng.choice(listed) for _ in range(lookups)]
+    misses = [".".join(random_label(rng) for _ in range(8)) + "." + rng.choice(SUFFIXES) for _ in range(lookups)]
+    return hits, misses
+
+
+def timed(label: str, func, queries):
+    start = time.perf_counter()
+    hits = sum(1 for q in queries if func(q))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<12} {elapsed * 1e9 / len(queries):8.0f} ns/lookup  ({hits} hits)")
+    return hits
+
+
+def main(count: int, lookups: int):
+    domains, queries = build(count, lookups)
+    deep_hits, deep_misses = deep_queries(domains, lookups)
+    print(f"{len(domains)} domains, {len(queries)} lookups per workload")
+
+    start = time.perf_counter()
+    index = DomainIndex(domains)
+    print(f"  index build  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "official_domains.gvwl")
+        write_snapshot(domains, path)
+        snapshot = SnapshotIndex(path)
+        for workload, workload_queries in (("mixed", queries), ("deep-hit", deep_hits), ("deep-miss", deep_misses)):
+            print(workload)
+            timed("baseline", lambda q: False, workload_queries)
+            legacy_hits = timed("set+loop", lambda q: legacy_is_trusted(domains, q), workload_queries)
+            walk_hits = timed("set walk", lambda q: set_walk_is_trusted(domains, q), workload_queries)
+            index_hits = timed("DomainIndex", index.matches, workload_queries)
+            snapshot_hits = timed("SnapshotIndex", snapshot.matches, workload_queries)
+            assert legacy_hits == walk_hits == index_hits == snapshot_hits, "lookups disagree"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--domains", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=500_000)
+    args = parser.parse_args()
+    main(args.domains, args.lookups)
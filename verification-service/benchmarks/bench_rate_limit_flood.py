@@ -0,0 +1,80 @@
+"""
+Redis load of the rate limiter under a request flood.
+
+Simulates W workers (one RateLimiter each, sharing the Redis bucket) receiving a flood from
+A attacker IPs for S seconds plus a trickle of legitimate clients, and counts how many
+checks reached Redis. The old limiter made one Redis round-trip per check, so
+"Redis calls per check" is the fraction of that load left.
+
+Needs a Redis at REDIS_HOST:REDIS_PORT (e.g. `redis-server --save ""`).
+
+Usage (from verification-service/):
+    python -m benchmarks.bench_rate_limit_flood --workers 4 --attackers 20 --seconds 5 [--lease 1]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import HTTPException
+
+from app.core.rate_limit import RateLimiter
+
+
+async def run(workers: int, attackers: int, legit: int, seconds: float, rpm: int, burst: int, lease: int):
+    limiters = [RateLimiter(requests_per_minute=rpm, burst=burst, lease_size=lease) for _ in range(workers)]
+    if limiters[0].redis is None:
+        raise SystemExit("needs SESSION_BACKEND=redis and a reachable Redis")
+    await limiters[0].redis.delete(*[f"rate_limit:bench-{i}" for i in range(attackers + legit)] or ["-"])
+    rng = random.Random(1)
+    allowed = {"attack": 0, "legit": 0}
+    sent = {"attack": 0, "legit": 0}
+
+    async def one(kind: str, key: str):
+        sent[kind] += 1
+        try:
+            await rng.choice(limiters).check(key)
+            allowed[kind] += 1
+        except HTTPException:
+            pass
+
+    async def attacker(i: int, deadline: float):
+        while time.perf_counter() < deadline:
+            await asyncio.gather(*(one("attack", f"bench-{i}") for _ in range(20)))
+
+    async def user(i: int, deadline: float):
+        while time.perf_counter() < deadline:
+            await one("legit", f"bench-{attackers + i}")
+            await asyncio.sleep(60 / rpm)
+
+    started = time.perf_counter()
+    deadline = started + seconds
+    await asyncio.gather(
+        *(attacker(i, deadline) for i in range(attackers)),
+        *(user(i, deadline) for i in range(legit)),
+    )
+    wall = time.perf_counter() - started
+
+    checks = sum(l.stats()["checks"] for l in limiters)
+    redis_calls = sum(l.stats()["redis_calls"] for l in limiters)
+    local_rejected = sum(l.stats()["local_rejected"] for l in limiters)
+    print(f"{workers} workers, {attackers} attackers + {legit} clients, {wall:.1f} s, lease {lease}")
+    print(f"  checks {checks} ({checks / wall:.0f}/s), Redis calls {redis_calls} ({redis_calls / wall:.0f}/s)")
+    print(f"  Redis calls per check {redis_calls / checks:.4f}, rejected locally {local_rejected}")
+    print(f"  attacker requests allowed {allowed['attack']}/{sent['attack']} "
+          f"(budget {attackers * (burst + rpm * seconds / 60):.0f})")
+    print(f"  legitimate requests allowed {allowed['legit']}/{sent['legit']}")
+    await limiters[0].redis.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--attackers", type=int, default=20)
+    parser.add_argument("--legit", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rpm", type=int, default=60)
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--lease", type=int, default=4, help="tokens leased per Redis call (1 = no lease)")
+    args = parser.parse_args()
+    asyncio.run(run(args.workers, args.attackers, args.legit, args.seconds, args.rpm, args.burst, args.lease))
@@ -0,0 +1,160 @@
+"""
+Session record size and decode cost: JSON blob (the old format) vs the compact binary record.
+
+Builds a representative session (gov.pl URL, IPv4, desktop UA, BLE proximity, and after
+consumption a full VerifyTokenResponse) and reports:
+
+  - payload bytes per session while pending, after proximity, and once consumed,
+    extrapolated to 1M sessions (values only; Redis adds per-key overhead on top)
+  - CPU per poll decode for a pending and a consumed session
+
+With --redis it also writes N sessions of each format to the Redis at REDIS_HOST:REDIS_PORT
+(database --db, which is flushed) and reports the used_memory delta scaled to 1M sessions,
+key overhead included.
+
+Usage (from verification-service/):
+    python -m benchmarks.bench_session_encoding [--redis --sessions 100000]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.services import session_codec
+from app.services.session_store import RedisSessionStore
+
+SESSION = {
+    "url": "https://www.podatki.gov.pl/e-deklaracje/",
+    "created_at": 1792211949.3847537,
+    "status": "PENDING",
+    "ip": "83.24.117.201",
+    "ua": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36",
+}
+PROXIMITY = {
+    "ble_uuid": "6f1c2a7e-4d3b-4f7a-9a51-0c8e2d9b7f10",
+    "found": True,
+    "timestamp": "2026-10-17T10:15:42.118Z",
+    "supported": True,
+    "confirmed": True,
+}
+RESULT = {
+    "verdict": "TRUSTED",
+    "checked_url": SESSION["url"],
+    "timestamp": "2026-10-17T10:15:43.004Z",
+    "client_ip": SESSION["ip"],
+    "user_agent": SESSION["ua"],
+    "device_os": "Windows",
+    "device_browser": "Chrome",
+    "device_brand": None,
+    "is_mobile": False,
+    "trust_score": 100,
+    "logs": [
+        "Domain podatki.gov.pl is on the official whitelist",
+        "SSL certificate valid for 211 more days",
+        "Hostname matches certificate",
+        "OCSP: Good",
+        "Proximity confirmed via BLE",
+    ],
+    "details": {"ssl_valid": "PASS", "revocation": "OCSP: Good", "hostname_match": True, "cert_org": "Ministerstwo Finansów"},
+}
+
+
+def legacy_blob(stage: str) -> bytes:
+    session = dict(SESSION)
+    if stage != "pending":
+        session["proximity"] = PROXIMITY
+    if stage == "consumed":
+        session["status"] = "CONSUMED"
+        session["result"] = RESULT
+    return json.dumps(session).encode("utf-8")
+
+
+def compact(stage: str):
+    session = dict(SESSION)
+    if stage != "pending":
+        session["proximity"] = PROXIMITY
+    if stage == "consumed":
+        session["status"] = "CONSUMED"
+    record = session_codec.encode_session(session)
+    result = session_codec.encode_result(RESULT) if stage == "consumed" else b""
+    return record, result
+
+
+def per_call_us(func, rounds: int = 50_000) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) * 1e6 / rounds
+
+
+def payload_report():
+    print("payload bytes per session (values only)")
+    for stage in ("pending", "proximity", "consumed"):
+        old = len(legacy_blob(stage))
+        record, result = compact(stage)
+        new = len(record) + len(result)
+        print(f"  {stage:<10} json {old:5d} B   compact {len(record):4d} + {len(result):4d} B"
+              f"   -> 1M sessions {old:5.0f} MB vs {new:4.0f} MB")
+
+    print("decode per poll")
+    for stage in ("pending", "consumed"):
+        blob = legacy_blob(stage)
+        record, result = compact(stage)
+
+        def decode_compact():
+            session = session_codec.decode_session(record)
+            if result:
+                session["result"] = session_codec.decode_result(result)
+            return session
+
+        print(f"  {stage:<10} json {per_call_us(lambda: json.loads(blob)):6.2f} us"
+              f"   compact {per_call_us(decode_compact):6.2f} us")
+
+
+async def redis_report(sessions: int, db: int):
+    client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=db)
+    store = RedisSessionStore(client)
+
+    async def used_memory() -> int:
+        return (await client.info("memory"))["used_memory"]
+
+    async def fill(write):
+        await client.flushdb()
+        before = await used_memory()
+        for start in range(0, sessions, 1000):
+            await asyncio.gather(*(write(uuid.uuid4().hex) for _ in range(start, min(sessions, start + 1000))))
+        return (await used_memory() - before) * 1_000_000 / sessions
+
+    blob = legacy_blob("consumed")
+
+    async def write_legacy(nonce):
+        await client.set(f"session:{nonce}", blob, ex=3600)
+
+    async def write_compact(nonce):
+        await store.create(nonce, SESSION, 3600)
+        await store.set_proximity(nonce, PROXIMITY, 3600)
+        await store.claim(nonce)
+        await store.finish(nonce, "CONSUMED", RESULT, 3600)
+
+    print(f"Redis used_memory for 1M consumed sessions (measured with {sessions})")
+    legacy = await fill(write_legacy)
+    new = await fill(write_compact)
+    print(f"  json blob  {legacy / 1e6:7.0f} MB")
+    print(f"  compact    {new / 1e6:7.0f} MB   (record + result key)")
+    await client.flushdb()
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis", action="store_true", help="also measure real Redis memory")
+    parser.add_argument("--db", type=int, default=15, help="Redis database to use (flushed)")
+    parser.add_argument("--sessions", type=int, default=100_000)
+    args = parser.parse_args()
+    payload_report()
+    if args.redis:
+        asyncio.run(redis_report(args.sessions, args.db))
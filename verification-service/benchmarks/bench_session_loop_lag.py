@@ -0,0 +1,108 @@
+"""
+Event-loop lag under concurrent session traffic against a real Redis.
+
+Runs the per-session Redis work of the API (rate-limit check, init, poll, proximity,
+claim, consume) for N sessions with C in flight at once, while a probe samples
+event-loop lag. --sync-baseline replays the old pattern - a synchronous redis.Redis
+called from coroutines (SETEX/GET JSON blobs) - for comparison; there every round-trip
+stalls the whole loop.
+
+Needs a Redis at REDIS_HOST:REDIS_PORT (e.g. `redis-server --save ""`), unless run with
+SESSION_BACKEND=memory to measure the in-process store.
+
+Usage (from verification-service/):
+    python -m benchmarks.bench_session_loop_lag --sessions 5000 --concurrency 500 [--sync-baseline]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import redis as sync_redis
+
+from app.core.config import settings
+from app.core.rate_limit import RateLimiter
+from app.services.session_manager import SessionManager
+
+RESULT = {"verdict": "TRUSTED", "trust_score": 100, "logs": ["Domain on whitelist"] * 5}
+PROXIMITY = {"ble_uuid": "bench", "found": True, "supported": True, "confirmed": True}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def async_session(manager: SessionManager, limiter: RateLimiter):
+    await limiter.check("bench")
+    nonce = await manager.create_session("https://www.gov.pl/", ip="10.0.0.1", ua="bench")
+    await manager.get_session(nonce)
+    await manager.update_proximity(nonce, PROXIMITY)
+    await manager.claim_session(nonce)
+    await manager.update_status(nonce, "CONSUMED", RESULT)
+    await manager.get_session(nonce)
+
+
+async def sync_session(client: sync_redis.Redis, counter: list):
+    # The pre-asyncio code path: blocking calls straight from the coroutine
+    counter[0] += 1
+    key = f"bench:sync:{counter[0]}"
+    pipe = client.pipeline()
+    pipe.incr("rate_limit:bench")
+    pipe.expire("rate_limit:bench", 60)
+    pipe.execute()
+    client.setex(key, settings.SESSION_TTL, json.dumps({"url": "https://www.gov.pl/", "status": "PENDING"}))
+    for update in ({"proximity": PROXIMITY}, {"status": "CONSUMED", "result": RESULT}):
+        session = json.loads(client.get(key))
+        session.update(update)
+        client.setex(key, settings.SESSION_TTL, json.dumps(session))
+    json.loads(client.get(key))
+
+
+async def run(sessions: int, concurrency: int, sync_baseline: bool):
+    manager = SessionManager()
+    limiter = RateLimiter(requests_per_minute=10 ** 9)
+    limiter.redis = manager.redis
+    client = sync_redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, decode_responses=True)
+    counter = [0]
+
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            if sync_baseline:
+                await sync_session(client, counter)
+            else:
+                await async_session(manager, limiter)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(sessions)))
+    wall = time.perf_counter() - started
+    done.set()
+    await probe_task
+    await manager.close()
+    client.close()
+
+    mode = "sync client (baseline)" if sync_baseline else "asyncio pool"
+    print(f"{sessions} sessions, {concurrency} in flight, {mode}: {wall:.2f} s ({sessions / wall:.0f} sessions/s)")
+    print(f"  event-loop lag  p50={statistics.median(lags):.2f} ms  p99={percentile(lags, 99):.2f} ms  max={max(lags):.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--sync-baseline", action="store_true", help="replay the old blocking client")
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.concurrency, args.sync_baseline))
@@ -0,0 +1,161 @@
+"""
+Concurrency benchmark for VerificationEngine.verify.
+
+Starts a local TLS server that sleeps before every handshake (a stand-in for a slow
+government host), fires N concurrent verifications at it and, in parallel, samples
+event-loop lag. With the blocking pipeline the lag grows with the handshake delay;
+with the executor-based pipeline it should stay in the low milliseconds.
+
+Usage (from verification-service/):
+    python -m benchmarks.bench_verify_concurrency --requests 200 --delay 0.5 [--same-host] [--force-fresh]
+
+Every verify targets its own loopback address (127.0.x.y), i.e. its own chain cache key,
+so each one does a real handshake. With --same-host they all target localhost and the
+chain cache collapses them onto one handshake, unless --force-fresh is also given.
+"""
+import argparse
+import asyncio
+import datetime
+import multiprocessing
+import os
+import socket
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from app.services.verification_engine import VerificationEngine
+
+
+def make_self_signed(directory: str):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=30))
+        .not_valid_after(now + datetime.timedelta(days=90))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+    return cert_path, key_path
+
+
+def serve_slow_tls(cert_path: str, key_path: str, delay: float, listener: socket.socket):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+
+    def handle(conn: socket.socket):
+        time.sleep(delay)
+        try:
+            with context.wrap_socket(conn, server_side=True) as tls:
+                tls.recv(1)
+        except Exception:
+            pass
+
+    while True:
+        conn, _ = listener.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def start_server(cert_path: str, key_path: str, delay: float):
+    """Run the stand-in in its own process so it does not compete for our GIL."""
+    if socket.has_dualstack_ipv6():
+        listener = socket.create_server(("", 0), family=socket.AF_INET6, dualstack_ipv6=True, backlog=1024)
+    else:
+        listener = socket.create_server(("127.0.0.1", 0), backlog=1024)
+    process = multiprocessing.Process(
+        target=serve_slow_tls, args=(cert_path, key_path, delay, listener), daemon=True
+    )
+    process.start()
+    return process, listener.getsockname()[1]
+
+
+class AllowAll:
+    def is_trusted_host(self, hostname: str) -> bool:
+        return True
+
+
+def target(i: int, port: int, same_host: bool) -> str:
+    if same_host:
+        return f"https://localhost:{port}/"
+    # All of 127.0.0.0/8 reaches the loopback listener; 250 addresses per third octet
+    return f"https://127.0.{i // 250}.{i % 250 + 1}:{port}/"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(requests: int, delay: float, force_fresh: bool, same_host: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        server, port = start_server(*make_self_signed(tmp), delay)
+        engine = VerificationEngine()
+        engine.tar = AllowAll()
+        handshakes = 0
+        load_chain = engine.chain_cache.loader
+
+        async def counting_loader(hostname: str, port: int):
+            nonlocal handshakes
+            handshakes += 1
+            return await load_chain(hostname, port)
+
+        engine.chain_cache.loader = counting_loader
+
+        lags = []
+        done = asyncio.Event()
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append((time.perf_counter() - start - 0.005) * 1000)
+
+        async def one(i: int):
+            start = time.perf_counter()
+            await engine.verify(target(i, port, same_host), force_fresh=force_fresh)
+            return (time.perf_counter() - start) * 1000
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - started
+        done.set()
+        await probe_task
+        server.terminate()
+
+    print(f"{requests} concurrent verifies ({handshakes} handshakes), handshake delay {delay * 1000:.0f} ms, "
+          f"wall {wall:.2f} s")
+    print(f"  verify latency  p50={percentile(latencies, 50):.1f} ms  p99={percentile(latencies, 99):.1f} ms")
+    print(f"  event-loop lag  p50={statistics.median(lags):.2f} ms  p99={percentile(lags, 99):.2f} ms  max={max(lags):.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.5)
+    parser.add_argument("--force-fresh", action="store_true", help="bypass the chain cache")
+    parser.add_argument("--same-host", action="store_true", help="target one host instead of one per verify")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.delay, args.force_fresh, args.same_host))
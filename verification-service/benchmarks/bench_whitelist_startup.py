@@ -0,0 +1,63 @@
+"""
+Whitelist cold start: JSON parse + normalise + index build vs opening the binary snapshot.
+
+Writes a synthetic whitelist in the JSON list format, converts it to a GVWL snapshot and
+times both load paths, plus the Python heap each one allocates (the snapshot lives in
+mmap'd pages that the OS shares between workers, so it barely touches the heap).
+
+Usage (from verification-service/):
+    python -m benchmarks.bench_whitelist_startup --domains 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app.services.domain_index import DomainIndex
+from app.services.whitelist_snapshot import SnapshotIndex, domains_from_document, write_snapshot
+from benchmarks.bench_domain_index import build
+
+
+def measure(label: str, load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = load()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed * 1000:8.1f} ms   heap peak {peak / 1e6:7.1f} MB   ({len(index)} domains)")
+    return index
+
+
+def main(count: int):
+    domains, queries = build(count, 10_000)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "official_domains.json")
+        snapshot_path = os.path.join(tmp, "official_domains.gvwl")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(f"www.{d}" if i % 5 == 0 else d for i, d in enumerate(domains)), f, indent=2)
+        write_snapshot(domains_from_document(json.load(open(json_path, encoding="utf-8"))), snapshot_path)
+        print(f"JSON {os.path.getsize(json_path) / 1e6:.1f} MB, snapshot {os.path.getsize(snapshot_path) / 1e6:.1f} MB")
+
+        def from_json():
+            with open(json_path, "r", encoding="utf-8") as f:
+                return DomainIndex(domains_from_document(json.load(f)))
+
+        before = measure("JSON + normalise + index", from_json)
+        after = measure("snapshot mmap (checksum)", lambda: SnapshotIndex(snapshot_path))
+        measure("snapshot mmap (no checksum)", lambda: SnapshotIndex(snapshot_path, verify_checksum=False))
+
+        for label, index in (("DomainIndex", before), ("SnapshotIndex", after)):
+            start = time.perf_counter()
+            for q in queries:
+                index.matches(q)
+            print(f"  lookup {label:<21} {(time.perf_counter() - start) * 1e9 / len(queries):8.0f} ns/lookup")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--domains", type=int, default=100_000)
+    args = parser.parse_args()
+    main(args.domains)
@@ -0,0 +1,121 @@
+"""
+WebSocket broadcast fan-out with thousands of sockets across many channels.
+
+Connects N fake sockets spread over C channels (in-process broker and mailbox, no
+network), makes a fraction of them stall on send, then sends one verification result
+to every channel and measures how long the healthy sockets take to receive it.
+--serial replays the old delivery - one socket of a channel after another, no send
+timeout - where every stalled socket holds up the rest of its channel.
+
+Usage (from verification-service/):
+    python -m benchmarks.bench_ws_broadcast --sockets 5000 --channels 1000 --slow 0.01 [--serial]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from app.services.broker import InMemoryBroker
+from app.services.mailbox import MemoryMailbox
+from app.services.websocket_manager import WebSocketManager
+
+RESULT = {"verdict": "TRUSTED", "trust_score": 100, "logs": ["Domain on whitelist"] * 5}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class FakeSocket:
+    def __init__(self, latency: float, stall: float):
+        self.latency = latency
+        self.stall = stall
+        self.received_at = None
+        self.payload = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.stall or self.latency)
+        self.received_at = time.perf_counter()
+        self.payload = text
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+class SerialManager(WebSocketManager):
+    """The old delivery: each socket of a channel in turn, waiting as long as it takes."""
+
+    async def _send_local(self, channel_key: str, message: str):
+        message_id, sent_at, payload = self._unpack(message)
+        for websocket in list(self.active_connections.get(channel_key, ())):
+            await self._send(websocket, message_id, sent_at, payload, "live")
+
+
+async def run(sockets: int, channels: int, slow: float, stall: float, latency: float,
+              timeout: float, concurrency: int, serial: bool):
+    if serial:
+        concurrency, timeout = sockets, 3600.0
+    manager = (SerialManager if serial else WebSocketManager)(
+        InMemoryBroker(), MemoryMailbox(30, 8), send_timeout=timeout, send_concurrency=concurrency
+    )
+    manager.MAX_CONNECTIONS_PER_NONCE = max(manager.MAX_CONNECTIONS_PER_NONCE, -(-sockets // channels))
+    rng = random.Random(1)
+
+    keys = [f"bench-{i}" for i in range(channels)]
+    fakes = []
+    for i in range(sockets):
+        fake = FakeSocket(latency, stall if rng.random() < slow else 0.0)
+        await manager.connect(fake, keys[i % channels])
+        fakes.append((fake, keys[i % channels]))
+    healthy = [f for f, _ in fakes if not f.stall]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(manager.send_verification_success(key, RESULT) for key in keys))
+    deadline = started + stall + timeout + 5
+    while time.perf_counter() < deadline and any(f.received_at is None for f in healthy):
+        await asyncio.sleep(0.005)
+    delays = [(f.received_at - started) * 1000 for f in healthy if f.received_at is not None]
+    # Let the stalled sockets finish or get evicted before reading the counters
+    stalled = [f for f, _ in fakes if f.stall]
+    while time.perf_counter() < deadline and any(f.received_at is None and f in manager._delivered for f in stalled):
+        await asyncio.sleep(0.01)
+
+    # Every socket in a channel got the same string object: encoded once per message
+    payloads = {}
+    for fake, key in fakes:
+        if fake.payload is not None:
+            payloads.setdefault(key, set()).add(id(fake.payload))
+    encodings = max((len(ids) for ids in payloads.values()), default=0)
+
+    mode = "serial, no timeout (baseline)" if serial else f"concurrent ({concurrency} in flight, {timeout}s timeout)"
+    stats = manager.stats()
+    print(f"{sockets} sockets / {channels} channels, {sum(1 for f, _ in fakes if f.stall)} stalled, {mode}")
+    print(f"  healthy sockets reached: {len(delays)}/{len(healthy)}")
+    if delays:
+        print(f"  delivery  p50={statistics.median(delays):.1f} ms  p99={percentile(delays, 99):.1f} ms  max={max(delays):.1f} ms")
+    print(f"  payload encodings per channel: {encodings}")
+    print(f"  dropped={stats['dropped']} evicted={stats['evicted']} sockets left={stats['sockets']}")
+
+    for fake, key in fakes:
+        manager.disconnect(fake, key)
+    await asyncio.sleep(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--slow", type=float, default=0.01, help="fraction of sockets that stall")
+    parser.add_argument("--stall", type=float, default=5.0, help="seconds a stalled socket blocks a send")
+    parser.add_argument("--latency", type=float, default=0.002, help="send time of a healthy socket")
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--serial", action="store_true", help="replay the old one-by-one delivery")
+    args = parser.parse_args()
+    asyncio.run(run(args.sockets, args.channels, args.slow, args.stall, args.latency,
+                    args.timeout, args.concurrency, args.serial))
@@ -1,16 +1,18 @@
 #!/bin/bash
 set -e
 
-# Start Redis in background
-echo "Starting Redis server..."
-redis-server --daemonize yes --bind 127.0.0.1
+# Start Redis in background (not needed when sessions live in-process)
+if [ "${SESSION_BACKEND:-redis}" != "memory" ]; then
+    echo "Starting Redis server..."
+    redis-server --daemonize yes --bind 127.0.0.1
 
-# Wait for Redis to be ready
-echo "Waiting for Redis to be ready..."
-until redis-cli ping 2>/dev/null; do
-    sleep 1
-done
-echo "Redis is ready!"
+    # Wait for Redis to be ready
+    echo "Waiting for Redis to be ready..."
+    until redis-cli ping 2>/dev/null; do
+        sleep 1
+    done
+    echo "Redis is ready!"
+fi
 
 # Start the application
 echo "Starting verification service..."
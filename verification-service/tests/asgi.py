@@ -0,0 +1,58 @@
+"""
+Minimal in-process ASGI client for endpoint and middleware tests (the suite has no httpx).
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+
+@dataclass
+class Response:
+    status: int
+    headers: Dict[str, str]
+    chunks: List[bytes] = field(default_factory=list)
+    # Whether the app asked for the request body at all
+    body_read: bool = False
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+async def request(app, method: str, url: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None,
+                  client: str = "203.0.113.7", timeout: float = 5) -> Response:
+    parts = urlsplit(url)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": parts.path, "raw_path": parts.path.encode(), "root_path": "",
+        "query_string": parts.query.encode(),
+        "headers": [(name.lower().encode(), value.encode())
+                    for name, value in dict({"content-length": str(len(body))}, **(headers or {})).items()],
+        "client": (client, 50000), "server": ("testserver", 80),
+    }
+    response = Response(status=0, headers={})
+    finished = asyncio.Event()
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            response.body_read = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response.status = message["status"]
+            response.headers = {name.decode().lower(): value.decode() for name, value in message["headers"]}
+        elif message["type"] == "http.response.body":
+            if message.get("body"):
+                response.chunks.append(message["body"])
+            if not message.get("more_body"):
+                finished.set()
+
+    await asyncio.wait_for(app(scope, receive, send), timeout)
+    return response
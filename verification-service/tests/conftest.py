@@ -0,0 +1,12 @@
+import os
+
+import pytest
+
+# Importing app modules builds the global session store; keep it in-process so the suite
+# needs no Redis server. Tests that exercise the Redis engine use fakeredis explicitly.
+os.environ.setdefault("SESSION_BACKEND", "memory")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
@@ -0,0 +1,65 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from app.services.broker import RedisBroker
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def workers():
+    """Two brokers with their own connections to one Redis, like two workers or replicas."""
+    server = fakeredis.FakeServer()
+    clients = [fakeredis.FakeAsyncRedis(server=server) for _ in range(2)]
+    brokers = [RedisBroker(client, reconnect_delay=0.05) for client in clients]
+    yield brokers
+    for broker in brokers:
+        await broker.close()
+    for client in clients:
+        await client.aclose()
+
+
+async def test_publish_reaches_a_subscriber_on_another_worker(workers):
+    publisher, subscriber = workers
+    async with subscriber.subscribe("session-events:n1") as subscription:
+        assert await publisher.publish("session-events:n1", "CONSUMED") == 1
+        assert await subscription.get(timeout=2) == "CONSUMED"
+        # Other channels don't leak in
+        await publisher.publish("session-events:n2", "CONSUMED")
+        assert await subscription.get(timeout=0.2) is None
+
+
+async def test_local_subscribers_share_one_redis_subscription(workers):
+    publisher, subscriber = workers
+    async with subscriber.subscribe("ws:ch") as first, subscriber.subscribe("ws:ch") as second:
+        # Redis counts workers, not local subscribers
+        assert await publisher.publish("ws:ch", "m1") == 1
+        assert await first.get(timeout=2) == "m1"
+        assert await second.get(timeout=2) == "m1"
+    assert await publisher.publish("ws:ch", "m2") == 0
+
+
+async def test_both_workers_receive_and_publish(workers):
+    a, b = workers
+    async with a.subscribe("ws:ch") as on_a, b.subscribe("ws:ch") as on_b:
+        assert await a.publish("ws:ch", "from-a") == 2
+        assert (await on_a.get(timeout=2), await on_b.get(timeout=2)) == ("from-a", "from-a")
+        assert await b.publish("ws:ch", "from-b") == 2
+        assert (await on_a.get(timeout=2), await on_b.get(timeout=2)) == ("from-b", "from-b")
+
+
+async def test_resubscribes_after_the_connection_breaks(workers):
+    publisher, subscriber = workers
+    async with subscriber.subscribe("ws:ch") as subscription:
+        subscriber._broken = True
+        for _ in range(40):
+            await asyncio.sleep(0.05)
+            if subscriber.stats()["reconnects"] and not subscriber._broken:
+                break
+        assert subscriber.stats()["reconnects"] == 1
+        # (fakeredis keeps counting the closed connection as a receiver, so no count check)
+        await publisher.publish("ws:ch", "after")
+        assert await subscription.get(timeout=2) == "after"
+        assert await subscription.get(timeout=0.2) is None
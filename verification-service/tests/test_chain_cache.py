@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.services.chain_cache import ChainCache, ChainEntry
+
+pytestmark = pytest.mark.anyio
+
+
+class SlowLoader:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, hostname: str, port: int):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        return ChainEntry([], expiry=(True, ""), hostname_match=True, metadata={"load": f"{hostname}:{port}#{call}"})
+
+
+async def _load_id(get) -> str:
+    return (await get).metadata["load"]
+
+
+async def test_concurrent_gets_share_one_load():
+    loader = SlowLoader()
+    cache = ChainCache(loader, ttl=60)
+    gets = [asyncio.create_task(cache.get("example.gov.pl")) for _ in range(5)]
+    await asyncio.sleep(0)
+    loader.release.set()
+    assert {entry.metadata["load"] for entry in await asyncio.gather(*gets)} == {"example.gov.pl:443#1"}
+    assert loader.calls == 1
+    assert await _load_id(cache.get("example.gov.pl")) == "example.gov.pl:443#1"
+
+
+async def test_force_fresh_does_not_join_an_inflight_load():
+    loader = SlowLoader()
+    cache = ChainCache(loader, ttl=60)
+    shared = asyncio.create_task(cache.get("example.gov.pl"))
+    await asyncio.sleep(0)
+    forced = asyncio.create_task(cache.get("example.gov.pl", force_fresh=True))
+    await asyncio.sleep(0)
+    loader.release.set()
+    assert await _load_id(shared) == "example.gov.pl:443#1"
+    assert await _load_id(forced) == "example.gov.pl:443#2"
+    assert loader.calls == 2
+    assert cache.stats()["forced"] == 1
+
+
+async def test_force_fresh_bypasses_a_fresh_entry():
+    loader = SlowLoader()
+    loader.release.set()
+    cache = ChainCache(loader, ttl=60)
+    assert await _load_id(cache.get("example.gov.pl")) == "example.gov.pl:443#1"
+    assert await _load_id(cache.get("example.gov.pl", force_fresh=True)) == "example.gov.pl:443#2"
+    # The forced result replaces the cached one
+    assert await _load_id(cache.get("example.gov.pl")) == "example.gov.pl:443#2"
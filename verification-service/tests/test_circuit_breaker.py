@@ -0,0 +1,119 @@
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _breaker(clock, **kwargs) -> CircuitBreaker:
+    options = dict(window=60, buckets=10, min_calls=4, failure_rate=0.5, slow_call=1.0, open_for=30, probes=1)
+    options.update(kwargs)
+    return CircuitBreaker(clock=clock, **options)
+
+
+def _calls(breaker, outcomes):
+    for ok, duration in outcomes:
+        assert breaker.allow()
+        breaker.record(ok, duration)
+
+
+def _open(clock) -> CircuitBreaker:
+    breaker = _breaker(clock)
+    _calls(breaker, [(False, 0.1)] * 4)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_opens_on_failure_rate():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _calls(breaker, [(True, 0.1), (True, 0.1), (False, 0.1)])
+    assert breaker.state == CLOSED
+    _calls(breaker, [(False, 0.1)])
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_opens_on_slow_call_rate():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _calls(breaker, [(True, 0.1), (True, 0.1), (True, 1.5)])
+    assert breaker.state == CLOSED
+    _calls(breaker, [(True, 2.0)])
+    assert breaker.state == OPEN
+
+
+def test_needs_min_calls_before_opening():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _calls(breaker, [(False, 0.1)] * 3)
+    assert breaker.state == CLOSED
+
+
+def test_failures_age_out_of_the_window():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _calls(breaker, [(False, 0.1)] * 3)
+    clock.now += 61
+    _calls(breaker, [(True, 0.1), (False, 0.1), (True, 0.1), (True, 0.1)])
+    assert breaker.state == CLOSED
+
+
+def test_half_open_after_open_for():
+    clock = Clock()
+    breaker = _open(clock)
+    clock.now += 29.9
+    assert breaker.state == OPEN
+    assert breaker.stats()["retry_in_s"] == 0.1
+    clock.now += 0.1
+    assert breaker.state == HALF_OPEN
+
+
+def test_half_open_admits_a_single_probe():
+    clock = Clock()
+    breaker = _open(clock)
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert not breaker.allow()
+    # A probe that never reached the endpoint gives its slot back
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_successful_probe_closes_with_an_empty_window():
+    clock = Clock()
+    breaker = _open(clock)
+    clock.now += 30
+    _calls(breaker, [(True, 0.1)])
+    assert breaker.state == CLOSED
+    stats = breaker.stats()
+    assert (stats["window_calls"], stats["window_failures"]) == (0, 0)
+    _calls(breaker, [(False, 0.1)] * 3)
+    assert breaker.state == CLOSED
+
+
+def test_failed_or_slow_probe_opens_again():
+    for probe in [(False, 0.1), (True, 1.5)]:
+        clock = Clock()
+        breaker = _open(clock)
+        clock.now += 30
+        _calls(breaker, [probe])
+        assert breaker.state == OPEN
+        assert breaker.stats()["opened"] == 2
+        clock.now += 29
+        assert not breaker.allow()
+
+
+def test_registry_keys_breakers_by_endpoint():
+    registry = BreakerRegistry(max_endpoints=2, min_calls=1)
+    assert registry.get("http://ocsp.example.gov.pl/a") is registry.get("http://ocsp.example.gov.pl:80/b")
+    assert registry.get("https://ocsp.example.gov.pl/") is not registry.get("http://ocsp.example.gov.pl/")
+    assert registry.state("http://never.example.gov.pl/") == CLOSED
+    registry.get("http://crl.example.gov.pl/")
+    assert len(registry.stats()) == 2
@@ -0,0 +1,113 @@
+import datetime
+import threading
+import time
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from app.services.crl_cache import CRLCache
+
+URL = "http://crl.example.gov.pl/ca.crl"
+
+
+def make_crl(revoked=(), next_update_in: float = 3600) -> bytes:
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.datetime.now(datetime.timezone.utc)
+    builder = (
+        x509.CertificateRevocationListBuilder()
+        .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Example CA")]))
+        .last_update(now + datetime.timedelta(seconds=min(next_update_in, 0)) - datetime.timedelta(hours=1))
+        .next_update(now + datetime.timedelta(seconds=next_update_in))
+    )
+    for serial in revoked:
+        builder = builder.add_revoked_certificate(
+            x509.RevokedCertificateBuilder().serial_number(serial).revocation_date(now).build()
+        )
+    return builder.sign(key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+
+class Response:
+    def __init__(self, status_code: int, content: bytes = b""):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+
+class FakeHTTP:
+    """Serves `content` (or raises `error`) after `delay` seconds, counting calls."""
+
+    def __init__(self, content: bytes = b"", delay: float = 0, error: Exception = None):
+        self.content = content
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def get(self, url, headers=None, timeout=None, breaker=False):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return Response(200, self.content)
+
+
+def test_fetches_once_and_serves_from_memory():
+    http = FakeHTTP(make_crl(revoked=[42]))
+    cache = CRLCache(http_client=http)
+    assert cache.get(URL).is_revoked(42)
+    assert not cache.get(URL).is_revoked(43)
+    assert http.calls == 1
+    assert cache._url_locks == {}
+
+
+def test_stale_entry_is_served_within_max_staleness():
+    http = FakeHTTP(make_crl(revoked=[42], next_update_in=-60))
+    cache = CRLCache(http_client=http, max_staleness=3600)
+    assert cache.get(URL).is_revoked(42)
+    http.error = requests.ConnectionError("down")
+    cache._entries[URL].expires_at = 0  # due for revalidation
+    entry = cache.get(URL)
+    assert entry is not None and entry.is_revoked(42)
+    assert cache.stats()["stale_served"] == 1
+
+
+def test_stale_entry_past_max_staleness_is_unavailable():
+    http = FakeHTTP(make_crl(revoked=[42], next_update_in=-7200))
+    cache = CRLCache(http_client=http, max_staleness=3600)
+    # Freshly downloaded but already past nextUpdate + max_staleness: usable only while fresh
+    assert cache.get(URL) is not None
+    http.error = requests.ConnectionError("down")
+    cache._entries[URL].expires_at = 0  # due for revalidation
+    assert cache.get(URL) is None
+
+
+def test_wait_for_another_download_respects_the_timeout():
+    http = FakeHTTP(make_crl(), delay=1.0)
+    cache = CRLCache(http_client=http)
+    downloader = threading.Thread(target=cache.get, args=(URL,))
+    downloader.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    assert cache.get(URL, timeout=0.2) is None
+    assert time.monotonic() - started < 0.6
+    assert cache.stats()["lock_timeouts"] == 1
+    downloader.join()
+    assert http.calls == 1
+    assert cache.get(URL, timeout=0.2) is not None
+    assert cache._url_locks == {}
+
+
+def test_waiters_reuse_the_download():
+    http = FakeHTTP(make_crl(revoked=[7]), delay=0.3)
+    cache = CRLCache(http_client=http)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(URL, timeout=5))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert http.calls == 1
+    assert all(entry is not None and entry.is_revoked(7) for entry in results)
+    assert cache._url_locks == {}
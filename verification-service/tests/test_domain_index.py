@@ -0,0 +1,84 @@
+"""
+TrustAnchorRepository.is_trusted_host (DomainIndex and the mmap'd SnapshotIndex) must
+answer exactly like the set walk it replaced.
+"""
+import itertools
+import json
+import random
+
+import pytest
+
+from app.services.domain_index import DomainIndex
+from app.services.whitelist_checker import TrustAnchorRepository
+
+IDN = "żółw".encode("idna").decode()  # xn--w-uga1v8h
+
+DOMAINS = {"podatki.gov.pl", "www.mojeid.pl", "mojeid.pl", "www.pacjent.gov.pl", "pl-only",
+           f"{IDN}.pl", f"www.{IDN}.edu.pl"}
+
+
+def baseline_is_trusted(domains: set, domain: str) -> bool:
+    """The set walk TrustAnchorRepository.is_trusted used before the index, on a normalized host."""
+    if domain in domains:
+        return True
+    if domain.startswith("www."):
+        if domain[4:] in domains:
+            return True
+    parts = domain.split('.')
+    for i in range(1, len(parts) - 1):
+        parent = ".".join(parts[i:])
+        if parent in domains:
+            return True
+        if parent.startswith("www."):
+            if parent[4:] in domains:
+                return True
+    return False
+
+
+@pytest.fixture(params=["trie", "snapshot"])
+def repository(request, tmp_path):
+    json_path = tmp_path / "official_domains.json"
+    json_path.write_text(json.dumps(sorted(DOMAINS)), encoding="utf-8")
+    repository = TrustAnchorRepository(json_file_path=str(json_path), snapshot_path=str(tmp_path / "domains.gvwl"))
+    assert repository.stats()["source"] == "json"
+    if request.param == "trie":
+        repository._set_index(DomainIndex(repository.domains()), source="json", loaded_at=0)
+    return repository
+
+
+def _agrees(repository, host: str) -> bool:
+    # Against the set as loaded: the loader also adds the bare form of each "www." entry
+    expected = baseline_is_trusted(set(repository.domains()), host.lower().rstrip("."))
+    assert repository.is_trusted_host(host) == expected, host
+    return expected
+
+
+@pytest.mark.parametrize("host, trusted", [
+    # Exact
+    ("podatki.gov.pl", True), ("mojeid.pl", True), ("pl-only", True),
+    # Subdomains of a whitelisted domain, and the www. forms
+    ("e-deklaracje.podatki.gov.pl", True), ("a.b.podatki.gov.pl", True), ("www.podatki.gov.pl", True),
+    ("login.mojeid.pl", True), ("pacjent.gov.pl", True), ("www.pacjent.gov.pl", True),
+    ("ikp.www.pacjent.gov.pl", True),
+    # Similar suffixes that are not parents
+    ("evilgov.pl", False), ("gov.pl", False), ("evilpodatki.gov.pl", False), ("podatki.gov.pl.evil.com", False),
+    ("mojeid.pl-only", False), ("a.pl-only", False), ("pl", False), ("", False),
+    # A single-label entry also matches under a "www" label, anywhere in the name
+    ("www.pl-only", True), ("a.www.pl-only", True), ("www.a.pl-only", False),
+    # Case and trailing dot
+    ("PODATKI.GOV.PL", True), ("Login.MojeID.pl", True), ("podatki.gov.pl.", True), ("EvilGov.pl.", False),
+    # IDNA labels: the whitelist holds A-labels, so only the A-label form matches
+    (f"{IDN}.pl", True), (f"sklep.{IDN}.pl", True), (f"{IDN.upper()}.PL", True), ("żółw.pl", False),
+    (f"{IDN}.edu.pl", True), (f"www.{IDN}.edu.pl", True), (f"x{IDN}.pl", False),
+])
+def test_matches_the_set_walk(repository, host, trusted):
+    assert _agrees(repository, host) == trusted
+
+
+def test_matches_the_set_walk_on_generated_hosts(repository):
+    labels = ["www", "gov", "pl", "evilgov", "podatki", "mojeid", "pacjent", "pl-only", IDN, "edu", "x", ""]
+    hosts = [".".join(parts) for depth in range(1, 5) for parts in itertools.product(labels, repeat=depth)]
+    rng = random.Random(7)
+    hosts += [host.upper() + "." for host in rng.sample(hosts, 500)]
+    trusted = sum(_agrees(repository, host) for host in hosts)
+    assert 0 < trusted < len(hosts)
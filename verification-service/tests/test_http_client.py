@@ -0,0 +1,157 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.services.circuit_breaker import BreakerRegistry
+from app.services.http_client import HTTPClient, PoolTimeoutError
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.startswith("/trickle/"):
+            return self._trickle()
+        # /<seconds> sleeps before the headers, /body/<seconds> between the headers and the body
+        delay = float(self.path.rsplit("/", 1)[1] or 0)
+        if not self.path.startswith("/body/"):
+            time.sleep(delay)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.flush()
+        if self.path.startswith("/body/"):
+            time.sleep(delay)
+        self.wfile.write(b"ok")
+
+    def _trickle(self):
+        # /trickle/<bytes>/<seconds>: one byte of the body every <seconds>
+        _, _, size, interval = self.path.split("/")
+        self.send_response(200)
+        self.send_header("Content-Length", size)
+        self.end_headers()
+        try:
+            for _ in range(int(size)):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(float(interval))
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_reuses_connections(server):
+    client = HTTPClient(per_host=2)
+    for _ in range(5):
+        assert client.get(f"{server}/0").text == "ok"
+    stats = client.stats()
+    assert stats["connections_opened"] == 1
+    assert stats["reuse_rate"] == 0.8
+    client.close()
+
+
+def test_pool_wait_is_bounded_by_connect_timeout(server):
+    client = HTTPClient(per_host=1)
+    with ThreadPoolExecutor(2) as executor:
+        busy = executor.submit(client.get, f"{server}/1", timeout=(0.2, 5))
+        time.sleep(0.1)
+        started = time.monotonic()
+        with pytest.raises(PoolTimeoutError):
+            client.get(f"{server}/0", timeout=(0.2, 5))
+        assert time.monotonic() - started < 0.8
+        assert busy.result().text == "ok"
+    assert client.stats()["pool_timeouts"] == 1
+    client.close()
+
+
+def test_pool_timeout_is_not_a_breaker_failure(server):
+    client = HTTPClient(per_host=1, breakers=BreakerRegistry(min_calls=1, failure_rate=0.5, slow_call=5))
+    with ThreadPoolExecutor(2) as executor:
+        busy = executor.submit(client.get, f"{server}/1", timeout=(0.2, 5), breaker=True)
+        time.sleep(0.1)
+        with pytest.raises(PoolTimeoutError):
+            client.get(f"{server}/0", timeout=(0.2, 5), breaker=True)
+        busy.result()
+    breaker = client.breakers.get(server).stats()
+    assert breaker["state"] == "closed"
+    assert (breaker["calls"], breaker["failures"]) == (1, 0)
+    client.close()
+
+
+def test_slow_call_excludes_pool_wait(server):
+    # Each call takes 0.6 s at the endpoint; the second one also queues ~0.6 s for the only connection
+    client = HTTPClient(per_host=1, breakers=BreakerRegistry(min_calls=1, failure_rate=0.5, slow_call=1.0))
+    with ThreadPoolExecutor(2) as executor:
+        calls = [executor.submit(client.get, f"{server}/0.6", timeout=(3, 5), breaker=True) for _ in range(2)]
+        assert [call.result().text for call in calls] == ["ok", "ok"]
+    breaker = client.breakers.get(server).stats()
+    assert (breaker["calls"], breaker["failures"]) == (2, 0)
+    client.close()
+
+
+def test_slow_call_is_measured_to_the_headers(server):
+    client = HTTPClient(breakers=BreakerRegistry(min_calls=1, failure_rate=0.5, slow_call=0.3))
+    # A slow body after prompt headers is a big download, not a struggling endpoint
+    assert client.get(f"{server}/body/0.5", timeout=(3, 5), breaker=True).text == "ok"
+    assert client.breakers.get(server).stats()["state"] == "closed"
+    client.get(f"{server}/0.5", timeout=(3, 5), breaker=True)
+    breaker = client.breakers.get(server).stats()
+    assert (breaker["calls"], breaker["failures"], breaker["state"]) == (2, 1, "open")
+    client.close()
+
+
+def test_scalar_timeout_bounds_the_whole_body(server):
+    client = HTTPClient(per_host=1)
+    # Every byte arrives well within one read timeout, but the body takes ~2 s
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get(f"{server}/trickle/10/0.2", timeout=1.0)
+    assert time.monotonic() - started < 1.5
+    # The abandoned connection isn't handed out again half-read
+    assert client.get(f"{server}/0", timeout=1.0).text == "ok"
+    client.close()
+
+
+def test_budget_left_after_the_headers_bounds_the_body(server):
+    client = HTTPClient()
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get(f"{server}/body/0.8", timeout=0.5)
+    assert time.monotonic() - started < 0.9
+    assert client.get(f"{server}/body/0.1", timeout=1.0).text == "ok"
+    client.close()
+
+
+def test_tuple_timeout_is_per_read(server):
+    client = HTTPClient()
+    assert client.get(f"{server}/trickle/5/0.2", timeout=(1, 1)).text == "xxxxx"
+    client.close()
+
+
+@pytest.mark.parametrize("url", ["ldap://ldap.example.gov.pl/cn=CRL", "http://exa mple.gov.pl:99999/crl"])
+def test_unusable_urls_are_not_breaker_failures(url):
+    client = HTTPClient(breakers=BreakerRegistry(min_calls=1, failure_rate=0.5))
+    for _ in range(3):
+        with pytest.raises(requests.RequestException):
+            client.get(url, breaker=True)
+    breaker = client.breakers.get(url).stats()
+    assert breaker["state"] == "closed"
+    assert breaker["calls"] == 0
+    assert client.stats()["errors"] == 3
+    client.close()
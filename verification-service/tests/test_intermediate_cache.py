@@ -0,0 +1,72 @@
+import datetime
+import time
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import AuthorityInformationAccessOID, NameOID
+
+from app.services.intermediate_cache import IntermediateCache
+
+
+def _leaf(ca_issuer_urls) -> x509.Certificate:
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "example.gov.pl")]))
+        .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Missing Intermediate CA")]))
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.AuthorityInformationAccess([
+            x509.AccessDescription(AuthorityInformationAccessOID.CA_ISSUERS, x509.UniformResourceIdentifier(url))
+            for url in ca_issuer_urls
+        ]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+
+
+class FailingHTTP:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.calls = []
+
+    def get(self, url, timeout=None):
+        self.calls.append((url, timeout))
+        time.sleep(self.delay)
+        raise requests.ConnectionError("unreachable")
+
+
+def test_fetches_share_one_timeout():
+    http = FailingHTTP(delay=0.3)
+    cache = IntermediateCache(http_client=http)
+    urls = [f"http://ca{i}.example.gov.pl/ca.crt" for i in range(4)]
+    started = time.monotonic()
+    assert cache.find_issuer(_leaf(urls), timeout=0.5) is None
+    assert time.monotonic() - started < 0.8
+    assert len(http.calls) == 2
+    # The second fetch only gets what the first one left
+    assert http.calls[1][1] < 0.3
+
+
+def test_failed_urls_are_skipped_then_retried():
+    http = FailingHTTP()
+    cache = IntermediateCache(http_client=http, failure_ttl=0.2)
+    leaf = _leaf(["http://ca.example.gov.pl/ca.crt"])
+    cache.find_issuer(leaf)
+    cache.find_issuer(leaf)
+    assert len(http.calls) == 1
+    time.sleep(0.25)
+    cache.find_issuer(leaf)
+    assert len(http.calls) == 2
+
+
+def test_failed_urls_are_bounded():
+    http = FailingHTTP()
+    cache = IntermediateCache(http_client=http, max_failed=3)
+    for i in range(10):
+        cache.find_issuer(_leaf([f"http://ca{i}.example.gov.pl/ca.crt"]))
+    assert list(cache._failed_urls) == [f"http://ca{i}.example.gov.pl/ca.crt" for i in range(7, 10)]
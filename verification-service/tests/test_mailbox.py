@@ -0,0 +1,118 @@
+"""
+Both mailbox engines (MemoryMailbox, RedisMailbox on fakeredis) against the same
+expectations, on their own and as the WebSocketManager's catch-up path on (re)connect.
+"""
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+from app.services.broker import InMemoryBroker
+from app.services.mailbox import MemoryMailbox, RedisMailbox
+from app.services.websocket_manager import WebSocketManager
+
+pytestmark = pytest.mark.anyio
+
+TTL = 60
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(params=["memory", "redis"])
+async def mailbox(request):
+    if request.param == "memory":
+        yield MemoryMailbox(ttl=TTL, max_messages=3, clock=Clock())
+        return
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    yield RedisMailbox(client, ttl=TTL, max_messages=3)
+    await client.aclose()
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.received.append(json.loads(text)["result"]["n"])
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+async def test_read_returns_messages_oldest_first(mailbox):
+    for n in range(3):
+        await mailbox.put("ch", f"m{n}")
+    assert await mailbox.read("ch") == ["m0", "m1", "m2"]
+    # Reading doesn't consume: every socket on the channel gets them
+    assert await mailbox.read("ch") == ["m0", "m1", "m2"]
+    assert await mailbox.read("other") == []
+
+
+async def test_keeps_only_the_newest_max_messages(mailbox):
+    for n in range(5):
+        await mailbox.put("ch", f"m{n}")
+    assert await mailbox.read("ch") == ["m2", "m3", "m4"]
+
+
+async def test_memory_mailbox_expires_ttl_after_the_last_put():
+    clock = Clock()
+    mailbox = MemoryMailbox(ttl=TTL, max_messages=3, clock=clock)
+    await mailbox.put("ch", "m0")
+    await mailbox.put("other", "x")
+    clock.now += TTL - 1
+    await mailbox.put("ch", "m1")
+    clock.now += 1
+    assert await mailbox.read("other") == []
+    assert await mailbox.read("ch") == ["m0", "m1"]
+    clock.now += TTL
+    assert await mailbox.read("ch") == []
+    assert not mailbox._boxes
+
+
+async def test_redis_mailbox_sets_the_ttl_on_every_put():
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    mailbox = RedisMailbox(client, ttl=TTL, max_messages=3)
+    await mailbox.put("ch", "m0")
+    await client.expire("mailbox:ch", 5)
+    await mailbox.put("ch", "m1")
+    assert TTL - 2 <= await client.ttl("mailbox:ch") <= TTL
+    await client.delete("mailbox:ch")
+    assert await mailbox.read("ch") == []
+    await client.aclose()
+
+
+async def test_connect_flushes_queued_messages_in_order(mailbox):
+    manager = WebSocketManager(InMemoryBroker(), mailbox)
+    for n in range(3):
+        await manager.send_verification_success("ch", {"n": n})
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "ch")
+    assert websocket.received == [0, 1, 2]
+    assert manager.stats()["delivered_mailbox"] == 3
+
+
+async def test_reconnect_gets_the_queue_again_then_live_messages(mailbox):
+    manager = WebSocketManager(InMemoryBroker(), mailbox)
+    await manager.send_verification_success("ch", {"n": 0})
+    first = FakeWebSocket()
+    await manager.connect(first, "ch")
+    manager.disconnect(first, "ch")
+    await manager.send_verification_success("ch", {"n": 1})
+    # The phone's new socket after a network switch
+    second = FakeWebSocket()
+    await manager.connect(second, "ch")
+    assert second.received == [0, 1]
+    await manager.send_verification_success("ch", {"n": 2})
+    await asyncio.sleep(0.05)
+    assert second.received == [0, 1, 2]
+    assert first.received == [0]
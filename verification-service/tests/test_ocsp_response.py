@@ -0,0 +1,118 @@
+import datetime
+from types import SimpleNamespace
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from app.services.ssl_verifier import SSLVerifier
+
+NOW = datetime.datetime.now(datetime.timezone.utc)
+
+
+def _cert(cn, key, issuer_name, issuer_key, ca=False, eku=None) -> x509.Certificate:
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)]))
+        .issuer_name(issuer_name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(NOW - datetime.timedelta(days=1))
+        .not_valid_after(NOW + datetime.timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+    )
+    if eku:
+        builder = builder.add_extension(x509.ExtendedKeyUsage(eku), critical=False)
+    return builder.sign(issuer_key, hashes.SHA256())
+
+
+def _pki():
+    ca_key = ec.generate_private_key(ec.SECP256R1())
+    ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Test CA")])
+    ca = _cert("Test CA", ca_key, ca_name, ca_key, ca=True)
+    leaf = _cert("www.gov.pl", ec.generate_private_key(ec.SECP256R1()), ca_name, ca_key)
+    return SimpleNamespace(ca=ca, ca_key=ca_key, leaf=leaf)
+
+
+def _response(pki, responder_cert, responder_key, cert=None, certs=None) -> bytes:
+    builder = ocsp.OCSPResponseBuilder().add_response(
+        cert=cert or pki.leaf, issuer=pki.ca, algorithm=hashes.SHA1(),
+        cert_status=ocsp.OCSPCertStatus.GOOD, this_update=NOW,
+        next_update=NOW + datetime.timedelta(hours=1), revocation_time=None, revocation_reason=None,
+    ).responder_id(ocsp.OCSPResponderEncoding.HASH, responder_cert)
+    if certs:
+        builder = builder.certificates(certs)
+    return builder.sign(responder_key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+
+class FakeHTTP:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def post(self, url, **kwargs):
+        return SimpleNamespace(status_code=200, content=self.content)
+
+
+def _query(pki, content: bytes):
+    return SSLVerifier(http_client=FakeHTTP(content))._query_ocsp(pki.leaf, pki.ca, ["http://ocsp.test"])
+
+
+def test_issuer_signed_response_is_accepted():
+    pki = _pki()
+    result = _query(pki, _response(pki, pki.ca, pki.ca_key))
+    assert result is not None and result.status == "GOOD"
+
+
+def test_delegated_responder_with_ocsp_signing_eku_is_accepted():
+    pki = _pki()
+    key = ec.generate_private_key(ec.SECP256R1())
+    responder = _cert("OCSP", key, pki.ca.subject, pki.ca_key, eku=[ExtendedKeyUsageOID.OCSP_SIGNING])
+    result = _query(pki, _response(pki, responder, key, certs=[responder]))
+    assert result is not None and result.status == "GOOD"
+
+
+def test_delegated_responder_without_eku_is_rejected():
+    pki = _pki()
+    key = ec.generate_private_key(ec.SECP256R1())
+    responder = _cert("OCSP", key, pki.ca.subject, pki.ca_key, eku=[ExtendedKeyUsageOID.SERVER_AUTH])
+    assert _query(pki, _response(pki, responder, key, certs=[responder])) is None
+
+
+def test_self_signed_forgery_is_rejected():
+    pki = _pki()
+    key = ec.generate_private_key(ec.SECP256R1())
+    forger = _cert("Test CA", key, pki.ca.subject, key, eku=[ExtendedKeyUsageOID.OCSP_SIGNING])
+    assert _query(pki, _response(pki, forger, key, certs=[forger])) is None
+    assert _query(pki, _response(pki, forger, key)) is None
+
+
+def test_response_for_another_certificate_is_rejected():
+    pki = _pki()
+    other = _cert("other.gov.pl", ec.generate_private_key(ec.SECP256R1()), pki.ca.subject, pki.ca_key)
+    assert _query(pki, _response(pki, pki.ca, pki.ca_key, cert=other)) is None
+
+
+def _sha1(data: bytes) -> bytes:
+    digest = hashes.Hash(hashes.SHA1())
+    digest.update(data)
+    return digest.finalize()
+
+
+def _by_hash(pki, issuer_key_hash: bytes) -> bytes:
+    builder = ocsp.OCSPResponseBuilder().add_response_by_hash(
+        issuer_name_hash=_sha1(pki.ca.subject.public_bytes()), issuer_key_hash=issuer_key_hash,
+        serial_number=pki.leaf.serial_number, algorithm=hashes.SHA1(),
+        cert_status=ocsp.OCSPCertStatus.GOOD, this_update=NOW, next_update=None,
+        revocation_time=None, revocation_reason=None,
+    ).responder_id(ocsp.OCSPResponderEncoding.HASH, pki.ca)
+    return builder.sign(pki.ca_key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+
+def test_response_for_another_issuer_key_is_rejected():
+    pki = _pki()
+    key_hash = x509.SubjectKeyIdentifier.from_public_key(pki.ca.public_key()).digest
+    assert _query(pki, _by_hash(pki, key_hash)).status == "GOOD"
+    # Same issuer name and serial, different key: the CertID must not match
+    assert _query(pki, _by_hash(pki, b"\x00" * 20)) is None
@@ -0,0 +1,290 @@
+"""
+GCRA rate limiter and RateLimitMiddleware on a mocked clock: every time below is set
+explicitly, so the results don't depend on how fast the suite runs.
+"""
+import json
+
+import fakeredis
+import pytest
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+import asgi
+from app.core.rate_limit import RateLimiter, RateLimitMiddleware, RateLimitPolicy, gcra
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def _allowed(limiter: RateLimiter, key: str = "k", cost: int = 1) -> bool:
+    try:
+        await limiter.check(key, cost)
+        return True
+    except HTTPException as e:
+        assert e.status_code == 429
+        return False
+
+
+def _limiter(clock, rpm=60, burst=5, **kwargs) -> RateLimiter:
+    return RateLimiter(requests_per_minute=rpm, burst=burst, clock=clock,
+                       redis_client=kwargs.pop("redis_client", None), **kwargs)
+
+
+async def test_burst_then_steady_rate():
+    clock = Clock()
+    limiter = _limiter(clock, rpm=60, burst=5)
+    assert [await _allowed(limiter) for _ in range(6)] == [True] * 5 + [False]
+    # One token per second afterwards, never two
+    for _ in range(10):
+        clock.now += 0.5
+        assert not await _allowed(limiter)
+        clock.now += 0.5
+        assert await _allowed(limiter)
+        assert not await _allowed(limiter)
+
+
+async def test_full_bucket_after_idle():
+    clock = Clock()
+    limiter = _limiter(clock, rpm=60, burst=5)
+    for _ in range(5):
+        await _allowed(limiter)
+    clock.now += 3600
+    assert [await _allowed(limiter) for _ in range(6)] == [True] * 5 + [False]
+
+
+async def test_no_double_burst_at_window_edge():
+    # A fixed one-minute window lets a full budget through at 59.9 s and another at 60.0 s
+    clock = Clock(now=60 * 1000 - 0.1)
+    limiter = _limiter(clock, rpm=60, burst=10)
+    first = sum([await _allowed(limiter) for _ in range(20)])
+    clock.now += 0.2  # across the minute boundary
+    second = sum([await _allowed(limiter) for _ in range(20)])
+    assert first == 10
+    assert second == 0
+
+
+async def test_keys_are_independent():
+    clock = Clock()
+    limiter = _limiter(clock, rpm=60, burst=2)
+    assert [await _allowed(limiter, "a") for _ in range(3)] == [True, True, False]
+    assert await _allowed(limiter, "b")
+
+
+async def test_cost():
+    clock = Clock()
+    limiter = _limiter(clock, rpm=60, burst=5)
+    assert await _allowed(limiter, cost=3)
+    assert not await _allowed(limiter, cost=3)
+    assert await _allowed(limiter, cost=2)
+
+
+async def test_headers_when_allowed():
+    clock = Clock()
+    limiter = _limiter(clock, rpm=60, burst=5)
+    await limiter.check("k")
+    status = await limiter.check("k")
+    assert status.allowed
+    assert status.headers() == {"X-RateLimit-Limit": "60", "X-RateLimit-Remaining": "3", "X-RateLimit-Reset": "2"}
+
+
+async def test_headers_when_rejected():
+    clock = Clock()
+    limiter = _limiter(clock, rpm=60, burst=5)
+    for _ in range(5):
+        await limiter.check("k")
+    with pytest.raises(HTTPException) as rejected:
+        await limiter.check("k")
+    assert rejected.value.status_code == 429
+    assert rejected.value.headers == {
+        "X-RateLimit-Limit": "60", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "5", "Retry-After": "1",
+    }
+    # Retry-After is rounded up and never 0
+    clock.now += 0.75
+    with pytest.raises(HTTPException) as rejected:
+        await limiter.check("k")
+    assert rejected.value.headers["Retry-After"] == "1"
+    clock.now += 0.25
+    assert (await limiter.check("k")).allowed
+
+
+def test_gcra_step():
+    # (granted, new TAT, slack or wait, reset_after) with interval 1 s and tolerance 5 s
+    assert gcra(None, 100.0, 1.0, 5.0, 1) == (1, 101.0, 4.0, 1.0)
+    assert gcra(105.0, 100.0, 1.0, 5.0, 1) == (0, 105.0, 1.0, 5.0)
+    assert gcra(102.0, 100.0, 1.0, 5.0, 1, want=4) == (3, 105.0, 0.0, 5.0)
+
+
+@pytest.fixture
+async def redis_client():
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    yield client
+    await client.aclose()
+
+
+async def test_shared_bucket_across_workers(redis_client):
+    # Two workers sharing one Redis bucket: leases save round-trips but never exceed the budget
+    clock = Clock()
+    workers = [_limiter(clock, rpm=60, burst=10, lease_size=4, redis_client=redis_client) for _ in range(2)]
+    allowed = 0
+    for i in range(40):
+        allowed += await _allowed(workers[i % 2])
+    assert allowed == 10
+    checks = sum(w.stats()["checks"] for w in workers)
+    redis_calls = sum(w.stats()["redis_calls"] for w in workers)
+    lease_hits = sum(w.stats()["lease_hits"] for w in workers)
+    assert lease_hits > 0
+    assert redis_calls < checks
+
+    # The shared bucket refills at the sustained rate for both workers together
+    clock.now += 1
+    assert sum([await _allowed(w) for w in workers]) == 1
+
+
+async def test_lease_expires(redis_client):
+    clock = Clock()
+    worker = _limiter(clock, rpm=60, burst=10, lease_size=4, lease_ttl=2, redis_client=redis_client)
+    await worker.check("k")
+    assert worker.stats()["redis_calls"] == 1
+    await worker.check("k")
+    assert worker.stats()["lease_hits"] == 1
+    clock.now += 3
+    await worker.check("k")
+    assert worker.stats()["redis_calls"] == 2
+
+
+async def test_fails_closed_when_redis_errors():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    client = fakeredis.FakeAsyncRedis(server=server)
+    limiter = _limiter(Clock(), redis_client=client)
+    with pytest.raises(HTTPException) as rejected:
+        await limiter.check("k")
+    assert rejected.value.status_code == 503
+    await client.aclose()
+
+
+def test_policy_match_longest_prefix():
+    policy = RateLimitPolicy({
+        "buckets": {"session": {"rpm": 60}, "poll": {"rpm": 120, "burst": 20}},
+        "routes": {
+            "GET /api/v1/session": {"bucket": "session"},
+            "GET /api/v1/session/poll/": {"bucket": "poll", "cost": 2},
+            "POST /api/v1/session": {"bucket": "session", "cost": 3},
+        },
+    })
+    assert policy.match("GET", "/api/v1/session/poll/abc") == ("poll", 2)
+    assert policy.match("GET", "/api/v1/session/poll") == ("poll", 2)
+    assert policy.match("GET", "/api/v1/session/events/abc") == ("session", 1)
+    assert policy.match("GET", "/api/v1/session") == ("session", 1)
+    assert policy.match("POST", "/api/v1/session/verify") == ("session", 3)
+    assert policy.match("GET", "/api/v1/sessions") is None
+    assert policy.match("DELETE", "/api/v1/session") is None
+    assert policy.limiters["poll"].burst == 20
+    assert policy.limiters["session"].burst == 5
+
+
+def test_policy_rejects_unknown_bucket():
+    with pytest.raises(ValueError):
+        RateLimitPolicy({"buckets": {}, "routes": {"GET /x": {"bucket": "missing"}}})
+
+
+def _middleware_app(clock):
+    """FastAPI app behind RateLimitMiddleware; `calls` counts requests that reached a handler."""
+    api = FastAPI()
+    calls = []
+
+    class Verify(BaseModel):
+        token: str
+
+    @api.post("/verify")
+    async def verify(body: Verify):
+        calls.append("verify")
+        return {"ok": True}
+
+    @api.post("/verify/bulk")
+    async def verify_bulk(body: Verify):
+        calls.append("bulk")
+        return {"ok": True}
+
+    @api.get("/health")
+    async def health():
+        return {"ok": True}
+
+    policy = RateLimitPolicy({
+        "buckets": {"verify": {"rpm": 60, "burst": 3}},
+        "routes": {"POST /verify": {"bucket": "verify"}, "POST /verify/bulk": {"bucket": "verify", "cost": 3}},
+    })
+    policy.limiters["verify"] = _limiter(clock, rpm=60, burst=3)
+    return RateLimitMiddleware(api, policy), calls
+
+
+BODY = json.dumps({"token": "t"}).encode()
+JSON = {"content-type": "application/json"}
+
+
+async def test_middleware_rejects_before_the_body_is_read():
+    app, calls = _middleware_app(Clock())
+    for _ in range(3):
+        assert (await asgi.request(app, "POST", "/verify", BODY, JSON)).status == 200
+    for body in (BODY, b'{"token": '):
+        rejected = await asgi.request(app, "POST", "/verify", body, JSON)
+        assert rejected.status == 429
+        assert not rejected.body_read
+    assert calls == ["verify"] * 3
+
+
+async def test_middleware_charges_malformed_bodies_too():
+    app, calls = _middleware_app(Clock())
+    malformed = await asgi.request(app, "POST", "/verify", b'{"token": ', JSON)
+    # Allowed requests are parsed as usual, and a bad body still costs a token
+    assert malformed.status == 422
+    assert malformed.headers["x-ratelimit-remaining"] == "2"
+    assert calls == []
+
+
+async def test_middleware_sets_headers_on_allowed_and_rejected_responses():
+    clock = Clock()
+    app, _ = _middleware_app(clock)
+    allowed = await asgi.request(app, "POST", "/verify", BODY, JSON)
+    assert allowed.headers["x-ratelimit-limit"] == "60"
+    assert allowed.headers["x-ratelimit-remaining"] == "2"
+    assert allowed.headers["x-ratelimit-reset"] == "1"
+    assert "retry-after" not in allowed.headers
+    for _ in range(2):
+        await asgi.request(app, "POST", "/verify", BODY, JSON)
+    rejected = await asgi.request(app, "POST", "/verify", BODY, JSON)
+    assert rejected.status == 429
+    assert json.loads(rejected.body) == {"detail": "Rate limit exceeded"}
+    assert rejected.headers["x-ratelimit-limit"] == "60"
+    assert rejected.headers["x-ratelimit-remaining"] == "0"
+    assert rejected.headers["retry-after"] == "1"
+    clock.now += 1
+    assert (await asgi.request(app, "POST", "/verify", BODY, JSON)).status == 200
+
+
+async def test_middleware_applies_the_route_cost():
+    clock = Clock()
+    app, calls = _middleware_app(clock)
+    bulk = await asgi.request(app, "POST", "/verify/bulk", BODY, JSON)
+    assert bulk.status == 200
+    assert bulk.headers["x-ratelimit-remaining"] == "0"
+    # The bulk call took the whole shared budget
+    assert (await asgi.request(app, "POST", "/verify", BODY, JSON)).status == 429
+    clock.now += 2
+    assert (await asgi.request(app, "POST", "/verify/bulk", BODY, JSON)).status == 429
+    assert calls == ["bulk"]
+
+
+async def test_middleware_leaves_unlimited_routes_alone():
+    app, _ = _middleware_app(Clock())
+    for _ in range(10):
+        response = await asgi.request(app, "GET", "/health")
+        assert response.status == 200
+        assert "x-ratelimit-limit" not in response.headers
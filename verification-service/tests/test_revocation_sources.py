@@ -0,0 +1,43 @@
+import datetime
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import AuthorityInformationAccessOID, NameOID
+
+from app.services.ssl_verifier import SSLVerifier
+
+
+def _cert(ocsp_urls, crl_urls) -> x509.Certificate:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "example.gov.pl")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.AuthorityInformationAccess([
+            x509.AccessDescription(AuthorityInformationAccessOID.OCSP, x509.UniformResourceIdentifier(url))
+            for url in ocsp_urls
+        ]), critical=False)
+        .add_extension(x509.CRLDistributionPoints([
+            x509.DistributionPoint([x509.UniformResourceIdentifier(url)], None, None, None)
+            for url in crl_urls
+        ]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+
+
+def test_only_http_sources_are_raced():
+    cert = _cert(
+        ["http://ocsp.example.gov.pl", "ldap://ocsp.example.gov.pl"],
+        ["ldap://ldap.example.gov.pl/cn=CA?certificateRevocationList", "HTTPS://crl.example.gov.pl/ca.crl",
+         "http://crl.example.gov.pl/ca.crl"],
+    )
+    ocsp_urls, crl_urls = SSLVerifier().revocation_sources(cert)
+    assert ocsp_urls == ["http://ocsp.example.gov.pl"]
+    assert crl_urls == ["HTTPS://crl.example.gov.pl/ca.crl", "http://crl.example.gov.pl/ca.crl"]
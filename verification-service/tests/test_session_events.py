@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi import FastAPI
+
+from app.api import endpoints
+from app.core.config import settings
+from app.services.broker import InMemoryBroker
+from app.services.session_manager import SessionManager
+from app.services.session_store import MemorySessionStore
+from asgi import request
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+RESULT = {"verdict": "TRUSTED", "trust_score": 100, "logs": ["ok"], "details": {}}
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def manager(monkeypatch, clock):
+    manager = SessionManager(store=MemorySessionStore(tick=1, clock=clock), broker=InMemoryBroker())
+    monkeypatch.setattr(endpoints, "session_manager", manager)
+    return manager
+
+
+@pytest.fixture
+def app(manager):
+    app = FastAPI()
+    app.include_router(endpoints.router, prefix="/api/v1")
+    return app
+
+
+async def _consume_later(manager, nonce: str, delay: float):
+    await asyncio.sleep(delay)
+    assert (await manager.claim_session(nonce))[0] == "CLAIMED"
+    await manager.update_status(nonce, "CONSUMED", RESULT)
+
+
+def _events(body: bytes):
+    events = []
+    for block in body.decode().split("\n\n"):
+        lines = block.splitlines()
+        if lines and lines[0] == "event: status":
+            events.append(json.loads(lines[1][len("data: "):]))
+        elif lines == [": keepalive"]:
+            events.append("keepalive")
+    return events
+
+
+async def test_long_poll_returns_as_soon_as_the_session_is_consumed(app, manager):
+    nonce = await manager.create_session("https://www.gov.pl/")
+    consumer = asyncio.create_task(_consume_later(manager, nonce, 0.1))
+    started = time.monotonic()
+    response = await request(app, "GET", f"/api/v1/session/poll/{nonce}?wait=5")
+    await consumer
+    assert time.monotonic() - started < 1
+    assert response.status == 200
+    body = json.loads(response.body)
+    assert (body["status"], body["result"]["verdict"]) == ("CONSUMED", "TRUSTED")
+
+
+async def test_long_poll_returns_pending_after_wait(app, manager):
+    nonce = await manager.create_session("https://www.gov.pl/")
+    # A claimed session that isn't finished yet is still PENDING to the web client
+    await manager.claim_session(nonce)
+    started = time.monotonic()
+    response = await request(app, "GET", f"/api/v1/session/poll/{nonce}?wait=0.3")
+    assert time.monotonic() - started >= 0.3
+    assert json.loads(response.body) == {"status": "PENDING", "result": None}
+
+
+@pytest.mark.parametrize("wait", [-1, settings.LONG_POLL_MAX_WAIT + 1])
+async def test_long_poll_wait_is_bounded(app, manager, wait):
+    nonce = await manager.create_session("https://www.gov.pl/")
+    response = await request(app, "GET", f"/api/v1/session/poll/{nonce}?wait={wait}")
+    assert response.status == 422
+
+
+async def test_sse_sends_the_status_then_the_result_and_closes(app, manager):
+    nonce = await manager.create_session("https://www.gov.pl/")
+    consumer = asyncio.create_task(_consume_later(manager, nonce, 0.1))
+    response = await request(app, "GET", f"/api/v1/session/events/{nonce}")
+    await consumer
+    assert response.status == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    first, last = _events(response.body)
+    assert first == {"status": "PENDING", "result": None}
+    assert (last["status"], last["result"]["verdict"]) == ("CONSUMED", "TRUSTED")
+
+
+async def test_sse_reports_expiry_and_closes(app, manager, clock, monkeypatch):
+    monkeypatch.setattr(settings, "SSE_KEEPALIVE_INTERVAL", 0.1)
+    nonce = await manager.create_session("https://www.gov.pl/")
+
+    async def expire():
+        await asyncio.sleep(0.15)
+        clock.now += settings.SESSION_TTL + 1
+
+    expiry = asyncio.create_task(expire())
+    response = await request(app, "GET", f"/api/v1/session/events/{nonce}")
+    await expiry
+    events = _events(response.body)
+    assert events[0] == {"status": "PENDING", "result": None}
+    assert "keepalive" in events
+    assert events[-1] == {"status": "EXPIRED", "result": None}
+
+
+async def test_sse_for_an_unknown_session_closes_after_one_event(app, manager):
+    response = await request(app, "GET", "/api/v1/session/events/unknown")
+    assert _events(response.body) == [{"status": "EXPIRED", "result": None}]
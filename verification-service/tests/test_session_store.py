@@ -0,0 +1,163 @@
+"""
+Conformance suite for the session storage engines: every test runs against both
+MemorySessionStore and RedisSessionStore (on fakeredis) and expects the same behaviour.
+"""
+import asyncio
+
+import fakeredis
+import pytest
+from pydantic import ValidationError
+
+from app.api.models import BluetoothData
+from app.services.session_store import MemorySessionStore, RedisSessionStore
+
+pytestmark = pytest.mark.anyio
+
+SESSION = {"url": "https://gov.pl/login", "created_at": 1700000000.0, "status": "PENDING",
+           "ip": "203.0.113.7", "ua": "Mozilla/5.0"}
+PROXIMITY = {"ble_uuid": "123e4567-e89b-12d3-a456-426614174000", "found": True,
+             "timestamp": "2024-01-01T12:00:00Z", "supported": True, "confirmed": True}
+RESULT = {"verdict": "TRUSTED", "trust_score": 100, "logs": ["ok"]}
+
+
+@pytest.fixture(params=["memory", "redis"])
+async def store(request):
+    if request.param == "memory":
+        yield MemorySessionStore()
+        return
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    engine = RedisSessionStore(client)
+    yield engine
+    await client.aclose()
+
+
+def _fields(session):
+    # The Redis engine decodes absent optional fields as None; the in-process one omits them
+    return {name: value for name, value in session.items() if value is not None}
+
+
+async def test_create_and_get(store):
+    await store.create("n1", SESSION, ttl=30)
+    assert _fields(await store.get("n1")) == SESSION
+    assert await store.get("missing") is None
+
+
+async def test_create_without_optional_fields(store):
+    await store.create("n1", {"url": "https://gov.pl", "created_at": 1.0, "status": "PENDING",
+                              "ip": None, "ua": None}, ttl=30)
+    assert _fields(await store.get("n1")) == {"url": "https://gov.pl", "created_at": 1.0, "status": "PENDING"}
+
+
+async def test_claim_has_exactly_one_winner(store):
+    await store.create("n1", SESSION, ttl=30)
+    outcomes = await asyncio.gather(*(store.claim("n1") for _ in range(20)))
+    winners = [session for claim, session in outcomes if claim == "CLAIMED"]
+    assert len(winners) == 1
+    assert _fields(winners[0]) == dict(SESSION, status="VERIFYING")
+    assert {claim for claim, _ in outcomes if claim != "CLAIMED"} == {"VERIFYING"}
+    assert (await store.get("n1"))["status"] == "VERIFYING"
+
+
+async def test_claim_missing_session(store):
+    assert await store.claim("missing") == ("EXPIRED", None)
+
+
+async def test_finish_stores_result(store):
+    await store.create("n1", SESSION, ttl=30)
+    await store.claim("n1")
+    assert await store.finish("n1", "CONSUMED", RESULT, ttl=30)
+    session = await store.get("n1")
+    assert session["status"] == "CONSUMED"
+    assert session["result"] == RESULT
+    assert await store.claim("n1") == ("CONSUMED", None)
+
+
+async def test_finish_requires_claim(store):
+    await store.create("n1", SESSION, ttl=30)
+    assert not await store.finish("n1", "CONSUMED", RESULT, ttl=30)
+    assert (await store.get("n1"))["status"] == "PENDING"
+    assert not await store.finish("missing", "CONSUMED", RESULT, ttl=30)
+
+
+async def test_release_hands_session_back(store):
+    await store.create("n1", SESSION, ttl=30)
+    assert not await store.release("n1")  # not claimed
+    await store.claim("n1")
+    assert await store.release("n1")
+    assert (await store.get("n1"))["status"] == "PENDING"
+    claim, session = await store.claim("n1")
+    assert claim == "CLAIMED" and session is not None
+
+
+async def test_proximity(store):
+    await store.create("n1", SESSION, ttl=30)
+    assert await store.set_proximity("n1", PROXIMITY, ttl=30)
+    assert (await store.get("n1"))["proximity"] == PROXIMITY
+    replaced = dict(PROXIMITY, ble_uuid="not-a-uuid", confirmed=False)
+    assert await store.set_proximity("n1", replaced, ttl=30)
+    session = await store.get("n1")
+    assert session["proximity"] == replaced
+    assert _fields({k: v for k, v in session.items() if k != "proximity"}) == SESSION
+    assert not await store.set_proximity("missing", PROXIMITY, ttl=30)
+
+
+async def test_proximity_at_the_api_length_limit(store):
+    # 63 four-byte characters: the longest BLE fields the API accepts must round-trip on every engine
+    data = BluetoothData(ble_uuid="\U0001F600" * 63, timestamp="\U0001F600" * 63).model_dump()
+    await store.create("n1", SESSION, ttl=30)
+    assert await store.set_proximity("n1", data, ttl=30)
+    assert (await store.get("n1"))["proximity"]["ble_uuid"] == data["ble_uuid"]
+
+
+def test_api_rejects_oversized_proximity_fields():
+    # Previously accepted and crashed the Redis engine (300 > 255 bytes) with a 500
+    with pytest.raises(ValidationError):
+        BluetoothData(ble_uuid="a" * 300, timestamp="t")
+    with pytest.raises(ValidationError):
+        BluetoothData(ble_uuid="a", timestamp="t" * 300)
+
+
+async def test_expiry(store):
+    await store.create("n1", SESSION, ttl=1)
+    await store.create("n2", SESSION, ttl=30)
+    await asyncio.sleep(1.2)
+    assert await store.get("n1") is None
+    assert await store.claim("n1") == ("EXPIRED", None)
+    assert not await store.set_proximity("n1", PROXIMITY, ttl=30)
+    assert await store.get("n2") is not None
+
+
+async def test_finish_resets_ttl(store):
+    await store.create("n1", SESSION, ttl=1)
+    await store.claim("n1")
+    assert await store.finish("n1", "CONSUMED", RESULT, ttl=30)
+    await asyncio.sleep(1.2)
+    assert (await store.get("n1"))["status"] == "CONSUMED"
+
+
+async def test_speculative_verdict(store):
+    await store.create("n1", SESSION, ttl=30)
+    await store.set_speculative("n1", RESULT, ttl=30)
+    # Not part of the session as read by pollers
+    assert "speculative" not in await store.get("n1")
+    claim, session = await store.claim("n1")
+    assert claim == "CLAIMED" and session["speculative"] == RESULT
+    # A released session keeps it for the next claim
+    assert await store.release("n1")
+    claim, session = await store.claim("n1")
+    assert claim == "CLAIMED" and session["speculative"] == RESULT
+    assert await store.finish("n1", "CONSUMED", {"verdict": "UNSAFE"}, ttl=30)
+    session = await store.get("n1")
+    assert "speculative" not in session and session["result"] == {"verdict": "UNSAFE"}
+
+
+async def test_speculative_verdict_for_missing_session(store):
+    await store.set_speculative("missing", RESULT, ttl=30)
+    assert await store.get("missing") is None
+    assert await store.claim("missing") == ("EXPIRED", None)
+
+
+async def test_claim_without_speculative_verdict(store):
+    await store.create("n1", SESSION, ttl=30)
+    claim, session = await store.claim("n1")
+    assert claim == "CLAIMED" and session.get("speculative") is None
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.deadline import Deadline
+from app.services.speculative_verifier import SpeculativeVerifier
+from app.services.verdict_cache import VerdictCache
+from app.services.verification_engine import VerificationEngine
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeEngine:
+    """URL-only stages that take `delay` seconds; whitelisted unless the host starts with "evil"."""
+
+    _target_key = staticmethod(VerificationEngine._target_key)
+    is_cacheable = staticmethod(VerificationEngine.is_cacheable)
+    is_whitelisted = staticmethod(VerificationEngine.is_whitelisted)
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+        self.verdict_cache = VerdictCache(ttl=300)
+
+    async def verify_url(self, url: str):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        whitelisted = "://evil" not in url
+        return {"score": 100 if whitelisted else 0, "verdict": "SAFE" if whitelisted else "DANGER",
+                "details": {"whitelist": "PASS" if whitelisted else "FAIL"}}
+
+
+class FakeSessions:
+    def __init__(self):
+        self.attached = {}
+
+    async def attach_speculative(self, nonce: str, result: dict):
+        self.attached[nonce] = result
+
+
+async def _running(verifier: SpeculativeVerifier):
+    task = asyncio.create_task(verifier.run())
+    await asyncio.sleep(0)
+    return task
+
+
+async def test_verdict_is_attached_and_cached():
+    engine, sessions = FakeEngine(delay=0.05), FakeSessions()
+    verifier = SpeculativeVerifier(engine=engine, sessions=sessions, concurrency=2)
+    task = await _running(verifier)
+    verifier.schedule("n1", "https://www.gov.pl/web")
+    verifier.schedule("n2", "https://www.gov.pl/other")
+    verifier.schedule("n3", "https://evil.example.com/")
+    await asyncio.sleep(0.2)
+    task.cancel()
+    assert set(sessions.attached) == {"n1", "n2", "n3"}
+    assert engine.calls == 2
+    assert engine.verdict_cache.get(("www.gov.pl", 443)) is not None
+    # Rejections are attached to their session but never cached
+    assert engine.verdict_cache.get(("evil.example.com", 443)) is None
+
+
+async def test_join_returns_the_running_verdict():
+    engine = FakeEngine(delay=0.2)
+    verifier = SpeculativeVerifier(engine=engine, sessions=FakeSessions(), join_timeout=1)
+    task = await _running(verifier)
+    verifier.schedule("n1", "https://www.gov.pl/web")
+    await asyncio.sleep(0)
+    result = await verifier.prepared_for({"url": "https://www.gov.pl/web"}, deadline=Deadline(10))
+    task.cancel()
+    assert result["verdict"] == "SAFE"
+    assert verifier.stats()["joined"] == 1
+
+
+@pytest.mark.parametrize("join_timeout, deadline", [(0.2, Deadline(10)), (5, Deadline(0.2)), (0.2, None)])
+async def test_join_wait_is_capped(join_timeout, deadline):
+    engine = FakeEngine(delay=2)
+    verifier = SpeculativeVerifier(engine=engine, sessions=FakeSessions(), join_timeout=join_timeout)
+    task = await _running(verifier)
+    verifier.schedule("n1", "https://www.gov.pl/web")
+    await asyncio.sleep(0)
+    started = time.monotonic()
+    assert await verifier.prepared_for({"url": "https://www.gov.pl/web"}, deadline=deadline) is None
+    assert time.monotonic() - started < 1
+    assert verifier.stats()["join_timeouts"] == 1
+    task.cancel()
+
+
+async def test_attached_verdict_is_used_without_waiting():
+    verifier = SpeculativeVerifier(engine=FakeEngine(delay=0), sessions=FakeSessions())
+    prepared = {"verdict": "SAFE"}
+    assert await verifier.prepared_for({"url": "https://www.gov.pl/", "speculative": prepared}) is prepared
+    assert await verifier.prepared_for({"url": "https://www.gov.pl/"}) is None
+    assert verifier.stats()["ready"] == 1
+    assert verifier.stats()["missed"] == 1
@@ -0,0 +1,34 @@
+from app.services.verdict_cache import VerdictCache
+
+
+def _result(host: str) -> dict:
+    return {"score": 100, "verdict": "SAFE", "details": {"whitelist": "PASS"}, "host": host}
+
+
+def test_evicts_least_recently_used():
+    cache = VerdictCache(ttl=300, max_entries=2)
+    cache.put(("a", 443), _result("a"))
+    cache.put(("b", 443), _result("b"))
+    assert cache.get(("a", 443)) is not None  # a is now the most recently used
+    cache.put(("c", 443), _result("c"))
+    assert cache.get(("b", 443)) is None
+    assert cache.get(("a", 443)) is not None
+    assert cache.get(("c", 443)) is not None
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_put_existing_key_does_not_evict():
+    cache = VerdictCache(ttl=300, max_entries=2)
+    cache.put(("a", 443), _result("a"))
+    cache.put(("b", 443), _result("b"))
+    cache.put(("a", 443), _result("a2"))
+    assert cache.get(("a", 443))["host"] == "a2"
+    assert cache.get(("b", 443)) is not None
+    assert cache.stats()["evictions"] == 0
+
+
+def test_expired_entries_miss():
+    cache = VerdictCache(ttl=0, max_entries=2)
+    cache.put(("a", 443), _result("a"))
+    assert cache.get(("a", 443)) is None
@@ -0,0 +1,75 @@
+import pytest
+
+from app.services.verdict_cache import VerdictCache
+from app.services.verdict_warmer import VerdictWarmer
+from app.services.verification_engine import VerificationEngine
+
+pytestmark = pytest.mark.anyio
+
+
+class Whitelist:
+    def __init__(self, domains):
+        self._domains = set(domains)
+
+    def is_trusted_host(self, hostname: str) -> bool:
+        return hostname in self._domains
+
+    def domains(self):
+        return sorted(self._domains)
+
+
+class FakeEngine:
+    is_cacheable = staticmethod(VerificationEngine.is_cacheable)
+    is_whitelisted = staticmethod(VerificationEngine.is_whitelisted)
+
+    def __init__(self, whitelisted):
+        self.tar = Whitelist(whitelisted)
+        self.verdict_cache = VerdictCache(ttl=300)
+        self.verified = []
+        self.rejected = set()
+
+    async def verify_url(self, url: str, force_fresh: bool = False):
+        self.verified.append(url)
+        hostname = url.split("/")[2]
+        trusted = self.tar.is_trusted_host(hostname) and hostname not in self.rejected
+        return {"score": 100 if trusted else 0, "verdict": "SAFE" if trusted else "UNSAFE",
+                "details": {"whitelist": "PASS" if trusted else "FAIL"}}
+
+
+def _demand(engine, hostname: str, times: int):
+    for _ in range(times):
+        engine.verdict_cache.get((hostname, 443))
+
+
+async def test_hot_mode_warms_only_whitelisted_hosts():
+    engine = FakeEngine(["www.gov.pl", "podatki.gov.pl"])
+    _demand(engine, "evil.example.com", 50)
+    _demand(engine, "www.gov.pl", 5)
+    _demand(engine, "podatki.gov.pl", 2)
+    warmer = VerdictWarmer(engine=engine, mode="hot", top_n=2, jitter=0)
+    await warmer.warm_once()
+    assert engine.verified == ["https://www.gov.pl/", "https://podatki.gov.pl/"]
+    assert engine.verdict_cache.get(("www.gov.pl", 443)) is not None
+    assert engine.verdict_cache.get(("evil.example.com", 443)) is None
+    assert warmer.stats()["last_targets"] == 2
+
+
+async def test_rejected_verdicts_are_never_cached():
+    # The host was listed when targets were picked but the verification pipeline rejects it
+    engine = FakeEngine(["old.gov.pl"])
+    engine.rejected = {"old.gov.pl"}
+    _demand(engine, "old.gov.pl", 3)
+    warmer = VerdictWarmer(engine=engine, mode="hot", top_n=5, jitter=0)
+    await warmer.warm_once()
+    assert engine.verified == ["https://old.gov.pl/"]
+    assert engine.verdict_cache.get(("old.gov.pl", 443)) is None
+    assert warmer.stats()["last_warmed"] == 0
+
+
+async def test_all_mode_adds_every_whitelisted_domain():
+    engine = FakeEngine(["a.gov.pl", "b.gov.pl"])
+    _demand(engine, "evil.example.com", 10)
+    warmer = VerdictWarmer(engine=engine, mode="all", top_n=5, jitter=0)
+    await warmer.warm_once()
+    assert sorted(engine.verified) == ["https://a.gov.pl/", "https://b.gov.pl/"]
+    assert warmer.stats()["last_warmed"] == 2
@@ -0,0 +1,196 @@
+import asyncio
+import concurrent.futures
+import datetime
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.services.chain_cache import ChainEntry
+from app.services.verification_engine import VerificationEngine
+
+pytestmark = pytest.mark.anyio
+
+
+class AllowAll:
+    def is_trusted_host(self, hostname: str) -> bool:
+        return True
+
+
+def _leaf() -> x509.Certificate:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "www.gov.pl")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=90))
+        .sign(key, hashes.SHA256())
+    )
+
+
+@pytest.fixture
+def engine():
+    engine = VerificationEngine()
+    engine.tar = AllowAll()
+    leaf = _leaf()
+
+    async def load_chain(hostname, port):
+        return ChainEntry([leaf], expiry=(True, "Valid"), hostname_match=True,
+                          metadata={"penalty": 0, "unsafe": False, "logs": [], "label": "PASS"})
+
+    engine.chain_cache.loader = load_chain
+    return engine
+
+
+def _revocation(delay: float, answer=(False, "Not Revoked")):
+    async def check(*args, **kwargs):
+        await asyncio.sleep(delay)
+        return answer
+    return check
+
+
+async def test_clean_revocation_answer(engine):
+    engine._check_revocation = _revocation(0)
+    result = await engine.verify_url("https://www.gov.pl/", deadline=Deadline(5))
+    assert result["score"] == 100
+    assert result["details"]["revocation"] == "PASS"
+    assert engine.is_cacheable(result)
+
+
+@pytest.mark.parametrize("policy, score", [("pass", 75), ("caution", 75), ("fail", 0)])
+async def test_deadline_during_revocation_is_never_a_clean_pass(engine, monkeypatch, policy, score):
+    monkeypatch.setattr(settings, "REVOCATION_DEGRADED_POLICY", policy)
+    monkeypatch.setattr(settings, "REVOCATION_DEGRADED_PENALTY", 25)
+    engine._check_revocation = _revocation(5)
+    result = await engine.verify_url("https://www.gov.pl/", deadline=Deadline(0.3))
+    assert result["score"] == score
+    assert result["details"]["revocation"] == "UNKNOWN (deadline)"
+    assert result["details"]["deadline_exceeded"] == "revocation"
+    assert not engine.is_cacheable(result)
+
+
+class RecordingExecutor:
+    """Runs each call on its own thread and keeps the futures, so tests can see what was cancelled."""
+
+    def __init__(self):
+        self.futures = {}
+
+    def submit(self, fn, *args):
+        future = concurrent.futures.Future()
+        self.futures[fn.func.__name__ + ":" + str(len(self.futures))] = future
+
+        def run():
+            try:
+                result = fn(*args)
+            except Exception as e:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+                return
+            # Like ThreadPoolExecutor, a cancelled future never gets its result
+            if future.set_running_or_notify_cancel():
+                future.set_result(result)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def cancelled(self, prefix: str) -> bool:
+        return all(f.cancelled() for name, f in self.futures.items() if name.startswith(prefix))
+
+
+class StubSources:
+    """SSLVerifier stand-in whose OCSP/CRL checks sleep, then answer (or raise)."""
+
+    def __init__(self, ocsp=(0, None), crl=(0, None)):
+        self.ocsp, self.crl = ocsp, crl
+        self.started = {}
+        self.http = SimpleNamespace(breaker_states=lambda urls: {url: "closed" for url in urls})
+
+    def revocation_sources(self, cert):
+        return ["http://ocsp.test"], ["http://crl.test"]
+
+    def _answer(self, label, spec):
+        self.started[label] = time.monotonic()
+        delay, answer = spec
+        time.sleep(delay)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def check_ocsp(self, cert, issuer, ocsp_urls, deadline=None):
+        return self._answer("ocsp", self.ocsp)
+
+    def check_crl(self, cert, crl_url, deadline=None):
+        return self._answer("crl", self.crl)
+
+
+async def _race(engine, sources, hedge_delay, monkeypatch):
+    monkeypatch.setattr(settings, "REVOCATION_HEDGE_DELAY", hedge_delay)
+    engine.ssl_verifier = sources
+    engine._executor = RecordingExecutor()
+    leaf = _leaf()
+    timings = {}
+    started = time.monotonic()
+    answer = await engine._check_revocation(leaf, leaf, ["http://ocsp.test"], ["http://crl.test"],
+                                            timings, Deadline(5))
+    elapsed = time.monotonic() - started
+    await asyncio.sleep(0)  # cancellation reaches the executor future via a loop callback
+    return answer, timings, elapsed, started
+
+
+async def test_ocsp_wins_before_the_hedge(engine, monkeypatch):
+    sources = StubSources(ocsp=(0.05, (False, "OCSP: Good")), crl=(0, (True, "CRL: Revoked")))
+    answer, timings, elapsed, _ = await _race(engine, sources, 0.5, monkeypatch)
+    assert answer == (False, "OCSP: Good")
+    assert "crl" not in sources.started and "crl" not in timings
+    assert elapsed < 0.5
+
+
+async def test_crl_starts_after_the_hedge_delay_and_cancels_ocsp(engine, monkeypatch):
+    sources = StubSources(ocsp=(1, (False, "OCSP: Good")), crl=(0.05, (True, "CRL: Revoked")))
+    answer, timings, elapsed, started = await _race(engine, sources, 0.2, monkeypatch)
+    assert answer == (True, "CRL: Revoked")
+    assert 0.2 <= sources.started["crl"] - started < 0.5
+    assert elapsed < 1
+    assert "ocsp" not in timings
+    assert engine._executor.cancelled("check_ocsp")
+
+
+async def test_unanswered_ocsp_brings_in_the_crl_at_once(engine, monkeypatch):
+    # What a forged or mis-addressed OCSP response comes back as: no answer, not GOOD
+    sources = StubSources(ocsp=(0, None), crl=(0, (True, "CRL: Revoked")))
+    answer, _, elapsed, started = await _race(engine, sources, 2, monkeypatch)
+    assert answer == (True, "CRL: Revoked")
+    assert sources.started["crl"] - started < 0.5
+
+
+@pytest.mark.parametrize("policy, score", [("pass", 100), ("caution", 75), ("fail", 0)])
+async def test_both_sources_failing_applies_the_degraded_policy(engine, monkeypatch, policy, score):
+    monkeypatch.setattr(settings, "REVOCATION_DEGRADED_POLICY", policy)
+    monkeypatch.setattr(settings, "REVOCATION_DEGRADED_PENALTY", 25)
+    leaf = _leaf()
+
+    async def load_chain(hostname, port):
+        return ChainEntry([leaf, leaf], expiry=(True, "Valid"), hostname_match=True,
+                          metadata={"penalty": 0, "unsafe": False, "logs": [], "label": "PASS"})
+
+    engine.chain_cache.loader = load_chain
+    sources = StubSources(ocsp=(0, ConnectionError("refused")), crl=(0, None))
+    monkeypatch.setattr(settings, "REVOCATION_HEDGE_DELAY", 0.5)
+    engine.ssl_verifier = sources
+    result = await engine.verify_url("https://www.gov.pl/", deadline=Deadline(5))
+    assert set(sources.started) == {"ocsp", "crl"}
+    assert result["score"] == score
+    assert result["details"]["revocation"] == "UNKNOWN (degraded)"
+    assert not engine.is_cacheable(result)
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.services.broker import InMemoryBroker
+from app.services.mailbox import MemoryMailbox
+from app.services.websocket_manager import WebSocketManager
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay: float = 0):
+        self.send_delay = send_delay
+        self.received = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.send_delay)
+        self.received.append(json.loads(text)["result"])
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed = code
+
+
+class SlowBroker(InMemoryBroker):
+    """Subscriptions take `delay` seconds to go live; the first `failures` relays break."""
+
+    def __init__(self, delay: float = 0, failures: int = 0):
+        super().__init__()
+        self.delay = delay
+        self.failures = failures
+        self.subscribes = 0
+        self.live = False
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        self.subscribes += 1
+        await asyncio.sleep(self.delay)
+        async with super().subscribe(channel) as subscription:
+            self.live = True
+            try:
+                if self.failures:
+                    self.failures -= 1
+                    raise ConnectionError("subscription lost")
+                yield subscription
+            finally:
+                self.live = False
+
+
+def _manager(broker=None, **kwargs) -> WebSocketManager:
+    return WebSocketManager(broker or InMemoryBroker(), MemoryMailbox(ttl=60, max_messages=10), **kwargs)
+
+
+async def test_every_concurrent_connector_waits_for_the_subscription():
+    broker = SlowBroker(delay=0.2)
+    manager = _manager(broker)
+    live_when_connected = []
+
+    async def connect(websocket):
+        await manager.connect(websocket, "ch")
+        live_when_connected.append(broker.live)
+
+    sockets = [FakeWebSocket() for _ in range(3)]
+    await asyncio.gather(*(connect(websocket) for websocket in sockets))
+    assert live_when_connected == [True, True, True]
+    assert broker.subscribes == 1
+    await manager.send_verification_success("ch", {"n": 1})
+    await asyncio.sleep(0.05)
+    assert [websocket.received for websocket in sockets] == [[{"n": 1}]] * 3
+
+
+async def test_failed_relay_is_dropped_and_the_next_connect_resubscribes():
+    broker = SlowBroker(failures=1)
+    manager = _manager(broker)
+    first = FakeWebSocket()
+    await manager.connect(first, "ch")
+    await asyncio.sleep(0)
+    assert "ch" not in manager._listeners
+    second = FakeWebSocket()
+    await manager.connect(second, "ch")
+    assert broker.subscribes == 2
+    await manager.send_verification_success("ch", {"n": 1})
+    await asyncio.sleep(0.05)
+    assert first.received == second.received == [{"n": 1}]
+
+
+async def test_sends_to_a_channel_run_concurrently():
+    manager = _manager(send_timeout=1)
+    sockets = [FakeWebSocket(send_delay=0.2) for _ in range(4)]
+    for websocket in sockets:
+        await manager.connect(websocket, "ch")
+    started = time.monotonic()
+    await manager._send_local("ch", f"m1 {time.time()!r} " + json.dumps({"result": {"n": 1}}))
+    assert time.monotonic() - started < 0.5
+    assert all(websocket.received == [{"n": 1}] for websocket in sockets)
+
+
+async def test_slow_socket_is_evicted_without_holding_up_the_rest():
+    manager = _manager(send_timeout=0.1)
+    fast, slow = FakeWebSocket(), FakeWebSocket(send_delay=5)
+    await manager.connect(fast, "ch")
+    await manager.connect(slow, "ch")
+    started = time.monotonic()
+    await manager._send_local("ch", f"m1 {time.time()!r} " + json.dumps({"result": {"n": 1}}))
+    assert time.monotonic() - started < 0.5
+    assert fast.received == [{"n": 1}]
+    assert slow.closed == 1013
+    assert manager.active_connections["ch"] == {fast}
+    stats = manager.stats()
+    assert (stats["evicted"], stats["dropped"], stats["delivered_live"]) == (1, 1, 1)
+
+
+async def test_last_disconnect_stops_the_relay():
+    broker = SlowBroker()
+    manager = _manager(broker)
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "ch")
+    task, _ = manager._listeners["ch"]
+    manager.disconnect(websocket, "ch")
+    await asyncio.sleep(0)
+    assert task.cancelled() and not broker.live
+    assert "ch" not in manager._listeners
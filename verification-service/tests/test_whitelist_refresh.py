@@ -0,0 +1,111 @@
+"""
+Background whitelist refresh: a failed reload keeps serving the last good index and is
+retried on the next (shorter) tick; a successful one swaps the new index in.
+"""
+import asyncio
+import json
+import os
+
+import pytest
+import requests
+
+from app.services import whitelist_checker
+from app.services.whitelist_checker import TrustAnchorRepository
+
+pytestmark = pytest.mark.anyio
+
+TTL = 3600
+RETRY = TTL / 10
+
+
+class DownAPI:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        raise requests.ConnectionError("api.dane.gov.pl unreachable")
+
+
+def _write_json(path, domains):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(sorted(domains), f)
+
+
+@pytest.fixture
+def files(tmp_path):
+    return str(tmp_path / "official_domains.json"), str(tmp_path / "official_domains.gvwl")
+
+
+@pytest.fixture
+def repository(files):
+    json_path, snapshot_path = files
+    _write_json(json_path, {"podatki.gov.pl"})
+    repository = TrustAnchorRepository(cache_ttl=TTL, json_file_path=json_path, snapshot_path=snapshot_path,
+                                       http_client=DownAPI())
+    assert repository.stats()["source"] == "json"
+    assert repository.is_trusted_host("podatki.gov.pl")
+    return repository
+
+
+def _sources_gone(files):
+    # Neither the snapshot nor the JSON cache is there, and the API is down: nothing to load.
+    # The loaded index is mmap'd from the deleted snapshot and must keep working.
+    for path in files:
+        os.remove(path)
+
+
+def test_failed_reload_keeps_the_loaded_index(repository, files):
+    _sources_gone(files)
+    assert repository._load_repository() is False
+    assert repository.http.calls == 1
+    assert repository.is_trusted_host("e-deklaracje.podatki.gov.pl")
+    assert not repository.is_trusted_host("pacjent.gov.pl")
+    stats = repository.stats()
+    assert (stats["source"], stats["domains"], stats["refresh_failures"]) == ("json", 1, 1)
+    assert "unreachable" in stats["last_error"]
+
+
+async def test_refresh_loop_retries_after_failures_and_keeps_serving(repository, files, monkeypatch):
+    json_path, _ = files
+    real_sleep = asyncio.sleep
+    delays = []
+    seen = []
+
+    crashing = False
+    snapshot_is_current = repository._snapshot_is_current
+
+    def crash_once():
+        if crashing:
+            raise RuntimeError("disk on fire")
+        return snapshot_is_current()
+
+    monkeypatch.setattr(repository, "_snapshot_is_current", crash_once)
+
+    # One tick per scenario: a crashing reload, an unreachable API, then a good reload
+    def before_tick(tick):
+        nonlocal crashing
+        crashing = tick == 1
+        if tick == 2:
+            _sources_gone(files)
+        elif tick == 3:
+            _write_json(json_path, {"podatki.gov.pl", "pacjent.gov.pl"})
+
+    async def ticks(delay):
+        delays.append(delay)
+        # What lookups see after the previous tick
+        seen.append((repository.is_trusted_host("podatki.gov.pl"), repository.is_trusted_host("pacjent.gov.pl")))
+        if len(delays) > 3:
+            raise asyncio.CancelledError
+        before_tick(len(delays))
+        await real_sleep(0)
+
+    monkeypatch.setattr(whitelist_checker.asyncio, "sleep", ticks)
+    with pytest.raises(asyncio.CancelledError):
+        await repository.run_refresh_loop()
+
+    assert delays == [TTL, RETRY, RETRY, TTL]
+    assert seen == [(True, False), (True, False), (True, False), (True, True)]
+    stats = repository.stats()
+    assert stats["refresh_failures"] == 2
+    assert stats["source"] == "json"
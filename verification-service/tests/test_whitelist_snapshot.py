@@ -0,0 +1,91 @@
+import pytest
+
+from app.services.domain_index import DomainIndex
+from app.services.whitelist_snapshot import (
+    HEADER, SnapshotError, SnapshotIndex, build_snapshot, open_snapshot, write_snapshot,
+)
+
+DOMAINS = {"gov.pl", "podatki.gov.pl", "www.mojeid.pl", "mojeid.pl", "pl-only", "zażółć.pl", "x.edu.pl"}
+
+HOSTS = [
+    "gov.pl", "podatki.gov.pl", "a.b.podatki.gov.pl", "www.podatki.gov.pl", "mojeid.pl", "www.mojeid.pl",
+    "login.mojeid.pl", "pl", "edu.pl", "y.edu.pl", "x.edu.pl", "a.x.edu.pl", "pl-only", "www.pl-only",
+    "a.pl-only", "zażółć.pl", "www.zażółć.pl", "example.com", "a..gov.pl", "",
+]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / "official_domains.gvwl")
+    write_snapshot(DOMAINS, path)
+    return path
+
+
+def test_roundtrip(snapshot_path):
+    index = SnapshotIndex(snapshot_path)
+    assert len(index) == len(DOMAINS)
+    assert set(index) == DOMAINS
+    assert all(index.contains(domain) for domain in DOMAINS)
+    assert not index.contains("pl")
+
+
+def test_matches_agree_with_domain_index(snapshot_path):
+    snapshot = SnapshotIndex(snapshot_path)
+    reference = DomainIndex(DOMAINS)
+    for host in HOSTS:
+        assert snapshot.matches(host) == reference.matches(host), host
+
+
+def test_many_domains(tmp_path):
+    domains = {f"d{i}.gov.pl" for i in range(5000)}
+    path = str(tmp_path / "big.gvwl")
+    write_snapshot(domains, path)
+    index = SnapshotIndex(path)
+    assert len(index) == 5000
+    assert all(index.matches(f"www.d{i}.gov.pl") for i in range(0, 5000, 7))
+    assert not index.matches("d5000.gov.pl")
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"GVWL",
+    b"JUNK" + bytes(HEADER.size),
+])
+def test_open_snapshot_rejects_invalid_files(tmp_path, content):
+    path = tmp_path / "bad.gvwl"
+    path.write_bytes(content)
+    assert open_snapshot(str(path)) is None
+
+
+def test_open_snapshot_rejects_truncated_and_corrupted_files(tmp_path):
+    data = build_snapshot(DOMAINS)
+    truncated = tmp_path / "truncated.gvwl"
+    truncated.write_bytes(data[:-3])
+    assert open_snapshot(str(truncated)) is None
+
+    corrupted = tmp_path / "corrupted.gvwl"
+    corrupted.write_bytes(data[:-1] + bytes([data[-1] ^ 0xFF]))
+    with pytest.raises(SnapshotError, match="checksum"):
+        SnapshotIndex(str(corrupted))
+    assert open_snapshot(str(corrupted)) is None
+
+
+def test_open_snapshot_missing_file(tmp_path):
+    assert open_snapshot(str(tmp_path / "missing.gvwl")) is None
+    assert open_snapshot("") is None
+
+
+def test_parent_suffixes_are_not_whitelisted_domains(snapshot_path):
+    # "pl" and "edu.pl" are stored as suffix nodes but were never whitelisted themselves
+    index = SnapshotIndex(snapshot_path)
+    assert not index.contains("pl")
+    assert not index.contains("edu.pl")
+    assert not index.matches("edu.pl")
+    assert "edu.pl" not in set(index)
+
+
+def test_deep_hostnames(snapshot_path):
+    index = SnapshotIndex(snapshot_path)
+    assert index.matches(".".join(["a"] * 20) + ".podatki.gov.pl")
+    assert not index.matches(".".join(["a"] * 20) + ".example.com")
+    assert index.matches(".".join(["a"] * 20) + ".x.edu.pl")
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import VerificationForm from './components/VerificationForm';
 import QRCodeDisplay from './components/QRCodeDisplay';
-import { initSession, pollSession } from './services/api';
+import { initSession, watchSession } from './services/api';
 // Импортируем сканер и генератор
 import { requestDeviceWithUUID, generateBLEUUID } from './services/bluetoothScanner';
 import './App.css';
@@ -81,26 +81,21 @@ function App() {
     setIsModalOpen(false);
   };
 
-  // (useEffect для поллинга остался без изменений...)
+  // Status updates are pushed by the server (SSE, or long-poll as a fallback)
   useEffect(() => {
-    let interval;
+    let stop;
     if (session && !session.result && !expirationMessage) {
-      interval = setInterval(async () => {
-        try {
-          const data = await pollSession(session.nonce);
-          if (data.status === 'CONSUMED' && data.result) {
-            setSession(prev => ({ ...prev, result: data.result }));
-            clearInterval(interval);
-          } else if (data.status === 'EXPIRED') {
-            handleExpire();
-            clearInterval(interval);
-          }
-        } catch (e) {
-          console.error("Polling error", e);
+      stop = watchSession(session.nonce, (data) => {
+        if (data.status === 'CONSUMED' && data.result) {
+          stop();
+          setSession(prev => ({ ...prev, result: data.result }));
+        } else if (data.status === 'EXPIRED') {
+          stop();
+          handleExpire();
         }
-      }, 2000);
+      });
     }
-    return () => clearInterval(interval);
+    return () => stop && stop();
   }, [session, expirationMessage]);
 
   return (
@@ -31,9 +31,55 @@ export const verifySession = async (token) => {
     return;
 };
 
-export const pollSession = async (nonce) => {
-    const response = await api.get(`/session/poll/${nonce}`);
+export const pollSession = async (nonce, wait = 0) => {
+    // wait > 0 makes this a long-poll: the server answers as soon as the status changes
+    const response = await api.get(`/session/poll/${nonce}`, { params: wait ? { wait } : {} });
     return response.data;
 };
 
+// Calls onStatus({status, result}) on every status change until the session is
+// CONSUMED or EXPIRED. Uses Server-Sent Events, falling back to long-polling.
+// Returns a function that stops watching.
+export const watchSession = (nonce, onStatus) => {
+    let stopped = false;
+    let source = null;
+
+    const longPoll = async () => {
+        while (!stopped) {
+            try {
+                const data = await pollSession(nonce, 25);
+                if (stopped) return;
+                onStatus(data);
+                if (data.status !== 'PENDING') return;
+            } catch (e) {
+                console.error("Polling error", e);
+                await new Promise(resolve => setTimeout(resolve, 2000));
+            }
+        }
+    };
+
+    if (typeof EventSource !== 'undefined') {
+        source = new EventSource(`${api.defaults.baseURL}/session/events/${nonce}`);
+        source.addEventListener('status', (event) => {
+            const data = JSON.parse(event.data);
+            onStatus(data);
+            if (data.status !== 'PENDING') {
+                source.close();
+            }
+        });
+        source.onerror = () => {
+            // Stream refused or dropped (proxy, rate limit): continue with long-polling
+            source.close();
+            longPoll();
+        };
+    } else {
+        longPoll();
+    }
+
+    return () => {
+        stopped = true;
+        if (source) source.close();
+    };
+};
+
 export default api;